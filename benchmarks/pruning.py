@@ -0,0 +1,88 @@
+# coding: utf-8
+'''
+Benchmark candidate pruning against exhaustive scoring
+
+Usage (from the repository root):
+
+    python -m benchmarks.pruning [NUMBER_OF_PIRS]
+
+Queries are made of common words and a distinctive word,
+so that most of the index shares some ngram with them, but only a few PIRs match well.
+'''
+
+import random
+import sys
+import time
+
+from org_name_search.data import PirDetails
+from org_name_search.index import NGramIndex, Query
+from org_name_search import scoring
+
+
+COMMON_WORDS = (
+    'általános iskola óvoda bölcsőde gimnázium kollégium egyesített szociális központ '
+    'polgármesteri hivatal önkormányzat magyar nemzeti megyei városi községi intézmény').split()
+SETTLEMENTS = 'budapest debrecen szeged pécs győr tata eger sopron vác zirc kalocsa baja'.split()
+
+
+def random_word(rnd):
+    return ''.join(rnd.choice('abcdefghijklmnoprstuvzáéíóöőúüű') for _ in range(rnd.randint(4, 10)))
+
+
+def make_index(size, rnd):
+    pir_to_details = {}
+    for pir in range(size):
+        settlement = rnd.choice(SETTLEMENTS)
+        name = ' '.join(
+            [settlement + 'i', random_word(rnd)] + rnd.sample(COMMON_WORDS, rnd.randint(1, 4)))
+        pir_to_details[pir] = PirDetails(pir=pir, names={name}, settlements={settlement})
+    return NGramIndex(pir_to_details, parse=None, idf_shift=10.)
+
+
+def make_queries(index, count, rnd):
+    '''
+    Common words with a distinctive word of a PIR name
+    '''
+    queries = []
+    for _ in range(count):
+        name, = rnd.choice(index.details).names
+        distinctive_word = name.split()[1]
+        words = [distinctive_word] + rnd.sample(COMMON_WORDS, rnd.randint(2, 4))
+        queries.append(Query(' '.join(words), rnd.choice(SETTLEMENTS), parse=None))
+    return queries
+
+
+def scoring_task(index, query):
+    terms, max_score, _is_valid = index._scoring_task(query)
+    return terms, max_score / 4.0
+
+
+def time_scorer(scorer, tasks):
+    start = time.perf_counter()
+    candidates = [scorer.top_candidates(terms, min_score, max_results=10) for terms, min_score in tasks]
+    return time.perf_counter() - start, candidates
+
+
+def main(argv):
+    size = int(argv[0]) if argv else 50000
+    rnd = random.Random(20190101)
+    print(f'Building index of {size} PIRs')
+    index = make_index(size, rnd)
+    tasks = [scoring_task(index, query) for query in make_queries(index, 200, rnd)]
+
+    engines = [('python', scoring.PythonScorer)]
+    if scoring.numpy is not None:
+        engines.append(('numpy', scoring.NumpyScorer))
+
+    for engine, scorer in engines:
+        exhaustive_time, exhaustive_candidates = time_scorer(scorer(index, prune=False), tasks)
+        pruned_time, pruned_candidates = time_scorer(scorer(index, prune=True), tasks)
+        print(
+            f'{engine:>6}: exhaustive {exhaustive_time / len(tasks) * 1000:8.2f} ms/query, '
+            f'pruned {pruned_time / len(tasks) * 1000:8.2f} ms/query, '
+            f'speedup {exhaustive_time / pruned_time:5.2f}x, '
+            f'same candidates: {exhaustive_candidates == pruned_candidates}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,164 @@
+# coding: utf-8
+'''
+Benchmark suite on synthetic PIR databases
+
+Usage (from the repository root):
+
+    python -m benchmarks.suite [--sizes 10000 100000 1000000] [--queries 2000] [--output results.json]
+
+For each database size, in a separate process (so that the peak RSS is per size):
+
+    - index build time from the PIR json, snapshot save and load time
+    - single query latency (p50, p99) of NGramIndex.search
+    - batch throughput of NGramIndex.search_many
+    - throughput of the whole CSV pipeline (OrgNameMatcher, without the query cache)
+    - peak RSS
+
+The results are written as JSON, so that they can be compared between versions.
+'''
+
+import argparse
+import contextlib
+import datetime
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import petl
+
+from org_name_search import main as matcher_main
+from org_name_search import scoring
+from org_name_search.data import load_pir_to_details, parse_date
+from org_name_search.index import NGramIndex, Query
+
+from .synthetic import Generator, pir_json, SETTLEMENTS_CSV
+
+
+BATCH_SIZE = 100
+
+
+def percentile(sorted_values, percent):
+    return sorted_values[max(1, math.ceil(percent / 100 * len(sorted_values))) - 1]
+
+
+def timed(function, *args, **kwargs):
+    '''
+    -> (seconds, result of function)
+    '''
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return round(time.perf_counter() - start, 4), result
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / (1 << 10)
+
+
+def run_size(size, query_count, seed):
+    generator = Generator(seed)
+    pir_to_details = generator.pir_to_details(size)
+    queries = generator.queries(pir_to_details, query_count)
+    parser = matcher_main.OrgNameParser()
+    parser.read_csv(SETTLEMENTS_CSV, report_conflicts=False)
+    result = {'size': size, 'queries': query_count}
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        index_json = os.path.join(tempdir, 'index.json')
+        with open(index_json, 'w') as f:
+            json.dump(pir_json(pir_to_details), f)
+        del pir_to_details
+
+        result['build_s'], index = timed(
+            lambda: NGramIndex(load_pir_to_details(index_json), parser.parse, idf_shift=10.))
+        snapshot = os.path.join(tempdir, 'index.snapshot')
+        result['snapshot_save_s'], _ = timed(index.save, snapshot)
+        result['snapshot_load_s'], index = timed(NGramIndex.load, snapshot, parser.parse, idf_shift=10.)
+        result['snapshot_mb'] = round(os.path.getsize(snapshot) / (1 << 20), 1)
+
+        query_objects = [
+            Query(name, settlement, parser.parse, date=parse_date(date)) for name, settlement, date in queries]
+        latencies = []
+        for query in query_objects:
+            start = time.perf_counter()
+            index.search(query)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        result['query_p50_ms'] = round(percentile(latencies, 50) * 1000, 3)
+        result['query_p99_ms'] = round(percentile(latencies, 99) * 1000, 3)
+        result['query_mean_ms'] = round(sum(latencies) / len(latencies) * 1000, 3)
+
+        seconds, _ = timed(
+            lambda: [
+                index.search_many(query_objects[i:i + BATCH_SIZE])
+                for i in range(0, len(query_objects), BATCH_SIZE)])
+        result['batch_queries_per_s'] = round(len(query_objects) / seconds, 1)
+
+        input = petl.wrap([('id', 'name', 'settlement', 'date')] + [(i,) + query for i, query in enumerate(queries)])
+        matcher = matcher_main.OrgNameMatcher(
+            matcher_main.InputFields('name', 'settlement', 'date'),
+            matcher_main.OutputFields('pir', 'pir_name', 'pir_score', 'pir_err', 'pir_settlement', 'pir_taxid'),
+            parser.parse, differentiating_ambiguity=0.001, idf_shift=10., cache_size=0)
+        matcher.index = index
+        seconds, _ = timed(lambda: sum(1 for _ in matcher.find_matches(input)))
+        result['pipeline_rows_per_s'] = round(len(queries) / seconds, 1)
+
+    result['peak_rss_mb'] = round(peak_rss_mb(), 1)
+    return result
+
+
+def run_size_quietly(size, query_count, seed):
+    # the standard output is for the results only
+    with contextlib.redirect_stdout(sys.stderr):
+        return run_size(size, query_count, seed)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.suite', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=20190101)
+    parser.add_argument('--output', help='JSON file to write the results to (default: standard output)')
+    args = parser.parse_args(argv)
+
+    report = {
+        'revision': git_revision(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': scoring.numpy is not None,
+        'results': [],
+    }
+    for size in args.sizes:
+        print(f'Benchmarking {size} PIRs', file=sys.stderr)
+        # a fresh process for each size: peak RSS is per process
+        with multiprocessing.get_context('fork').Pool(1) as pool:
+            result = pool.apply(run_size_quietly, (size, args.queries, args.seed))
+        print(json.dumps(result), file=sys.stderr)
+        report['results'].append(result)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,224 @@
+# coding: utf-8
+'''
+Synthetic PIR records and queries for benchmarks
+
+Institution names are made of a settlement adjective (budapesti, abai, ...),
+an optional eponym and an organization type phrase generated from the
+patterns of `tagger.ORG_TYPE`, e.g. "Abai Petőfi Sándor Általános Iskola".
+
+Queries are made from the names of random PIRs with typos, abbreviations
+and settlement variants (missing accents, settlement given in the name
+or in a separate field), like the names in procurement data.
+'''
+
+import datetime
+import random
+import re
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+from org_name_search import tagger
+from org_name_search.data import PirDetails
+from org_name_search.settlements import read_settlements
+
+
+EPONYMS = (
+    'Petőfi Sándor', 'Arany János', 'Kossuth Lajos', 'Széchenyi István', 'Bolyai János', 'József Attila',
+    'Ady Endre', 'Móricz Zsigmond', 'Kodály Zoltán', 'Bartók Béla', 'Szent István', 'Vörösmarty Mihály',
+    'Jókai Mór', 'Mikszáth Kálmán', 'Kazinczy Ferenc', 'Dózsa György', 'Rákóczi Ferenc', 'Hunyadi János',
+    'Eötvös Loránd', 'Semmelweis Ignác', 'Liszt Ferenc', 'Radnóti Miklós', 'Babits Mihály', 'Zrínyi Miklós')
+
+# words generated from the patterns, that are only prefixes of the real words
+COMPLETIONS = (
+    (re.compile(r'iskol\b'), 'iskola'),
+    (re.compile(r'\bkutat\b'), 'kutatóintézet'),
+    (re.compile(r'városellát\b'), 'városellátó'),
+    (re.compile(r'gazdasági$'), 'gazdasági szervezet'),
+)
+
+ABBREVIATIONS = (
+    ('általános iskola', 'ált. isk.'),
+    ('általános iskola', 'ált. iskola'),
+    ('polgármesteri hivatal', 'polg. hiv.'),
+    ('önkormányzat', 'önk.'),
+    ('óvoda', 'ov.'),
+    ('gimnázium', 'gimn.'),
+    ('intézmény', 'int.'),
+)
+
+ACCENTS = str.maketrans('áéíóöőúüű', 'aeiooouuu')
+
+SETTLEMENTS_CSV = 'data/settlements.csv'
+
+
+def _org_type_patterns():
+    '''
+    -> [(org type, parsed pattern)] for the named groups of tagger.ORG_TYPE
+    '''
+    patterns = []
+
+    def collect(tree):
+        for op, av in tree:
+            if op is sre_parse.SUBPATTERN:
+                group, subtree = av[0], av[-1]
+                if group in names:
+                    patterns.append((names[group], subtree))
+                else:
+                    collect(subtree)
+            elif op is sre_parse.BRANCH:
+                for branch in av[1]:
+                    collect(branch)
+
+    parsed = sre_parse.parse(tagger.ORG_TYPE)
+    state = getattr(parsed, 'state', None) or parsed.pattern
+    names = {group: name for name, group in state.groupdict.items()}
+    collect(parsed)
+    return patterns
+
+
+def _generate(tree, rnd):
+    '''
+    -> random text matching the parsed pattern (lookarounds are ignored)
+    '''
+    text = []
+    for op, av in tree:
+        if op is sre_parse.LITERAL:
+            text.append(chr(av))
+        elif op is sre_parse.IN:
+            literals = [chr(value) for item_op, value in av if item_op is sre_parse.LITERAL]
+            text.append(literals[0] if literals else ' ')
+        elif op is sre_parse.BRANCH:
+            text.append(_generate(rnd.choice(av[1]), rnd))
+        elif op is sre_parse.SUBPATTERN:
+            text.append(_generate(av[-1], rnd))
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            low, high, subtree = av
+            count = rnd.randint(low, min(high, low + 1))
+            text.extend(_generate(subtree, rnd) for _ in range(count))
+        elif op is sre_parse.CATEGORY:
+            text.append(' ' if 'SPACE' in str(av) else 'a')
+        elif op is sre_parse.ANY:
+            text.append('a')
+    return ''.join(text)
+
+
+class Generator:
+
+    def __init__(self, seed=0, settlements_csv=SETTLEMENTS_CSV):
+        self.rnd = random.Random(seed)
+        self.settlements = sorted(read_settlements(settlements_csv))
+        self.org_types = []
+        for org_type, pattern in _org_type_patterns():
+            # a few variants of each pattern, the ones actually recognized by the tagger
+            phrases = {self._org_type_phrase(pattern) for _ in range(20)}
+            phrases = sorted(phrase for phrase in phrases if org_type in self._keywords(phrase))
+            if phrases:
+                self.org_types.append(phrases)
+
+    def _org_type_phrase(self, pattern):
+        phrase = ' '.join(_generate(pattern, self.rnd).split())
+        for word, completed in COMPLETIONS:
+            phrase = word.sub(completed, phrase)
+        return phrase
+
+    @staticmethod
+    def _keywords(phrase):
+        keywords, _rest = tagger.extract_org_types(phrase)
+        return keywords
+
+    def name(self, settlement):
+        rnd = self.rnd
+        words = [settlement.split()[0] + 'i']
+        if rnd.random() < 0.4:
+            words.append(rnd.choice(EPONYMS))
+        words.append(rnd.choice(rnd.choice(self.org_types)))
+        if rnd.random() < 0.2:
+            # a second organization type, e.g. "... Általános Iskola és Óvoda"
+            words.extend(('és', rnd.choice(rnd.choice(self.org_types))))
+        return ' '.join(words).lower()
+
+    def pir_to_details(self, size):
+        rnd = self.rnd
+        pir_to_details = {}
+        for i in range(size):
+            pir = 100000 + i
+            settlement = rnd.choice(self.settlements)
+            names = {self.name(settlement) for _ in range(rnd.choice((1, 1, 1, 2, 3)))}
+            start_date = end_date = None
+            if rnd.random() < 0.3:
+                start_date = datetime.date(rnd.randint(1990, 2015), 1, 1) + datetime.timedelta(rnd.randint(0, 364))
+            if rnd.random() < 0.2:
+                end_date = datetime.date(rnd.randint(2000, 2020), 1, 1) + datetime.timedelta(rnd.randint(0, 364))
+                if start_date and end_date < start_date:
+                    start_date, end_date = end_date, start_date
+            pir_to_details[pir] = PirDetails(
+                pir=pir, tax_id=f'{pir * 7 % 100000000:08d}-1-{pir % 20 + 1:02d}',
+                start_date=start_date, end_date=end_date,
+                names=names, settlements={settlement})
+        return pir_to_details
+
+    def typo(self, text):
+        rnd = self.rnd
+        if len(text) < 4:
+            return text
+        i = rnd.randrange(1, len(text) - 1)
+        kind = rnd.randrange(3)
+        if kind == 0:
+            # swap
+            return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+        if kind == 1:
+            # deletion
+            return text[:i] + text[i + 1:]
+        return text[:i] + rnd.choice('aeiostnlrk') + text[i + 1:]
+
+    def query(self, details):
+        '''
+        -> (name, settlement, date) query for a PIR
+        '''
+        rnd = self.rnd
+        name = rnd.choice(sorted(details.names))
+        settlement = next(iter(details.settlements), None)
+        for long, short in ABBREVIATIONS:
+            if long in name and rnd.random() < 0.3:
+                name = name.replace(long, short)
+        for _ in range(rnd.choice((0, 0, 1, 1, 2))):
+            name = self.typo(name)
+        if rnd.random() < 0.3:
+            name = name.translate(ACCENTS)
+        if rnd.random() < 0.5:
+            name = name.upper()
+        if settlement and rnd.random() < 0.5:
+            # the settlement is known only from the name
+            settlement = None
+        elif settlement and rnd.random() < 0.3:
+            settlement = settlement.translate(ACCENTS)
+        date = None
+        if rnd.random() < 0.7:
+            date = f'{rnd.randint(2005, 2019)}{rnd.randint(1, 12):02d}{rnd.randint(1, 28):02d}'
+        return name, settlement, date
+
+    def queries(self, pir_to_details, count):
+        details = list(pir_to_details.values())
+        return [self.query(self.rnd.choice(details)) for _ in range(count)]
+
+
+def pir_json(pir_to_details):
+    '''
+    -> pir_to_details in the PIR json format (see pir_details.load_pir_to_details)
+    '''
+    def iso(date):
+        return date.isoformat() if date else None
+
+    return {
+        str(pir): {
+            'pir': details.pir,
+            'tax_id': details.tax_id,
+            'start_date': iso(details.start_date),
+            'end_date': iso(details.end_date),
+            'names': sorted(details.names),
+            'settlements': sorted(details.settlements),
+        }
+        for pir, details in pir_to_details.items()}
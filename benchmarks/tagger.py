@@ -0,0 +1,155 @@
+# coding: utf-8
+'''
+Benchmark the organization type tagger on the workload of tag_pirnev
+
+Usage (from the repository root):
+
+    python -m benchmarks.tagger [--pirnev data/PIRNEV.csv] [--synthetic 20000] [--repeat 3]
+
+The names of the NEV column of the PIRNEV csv are tagged like `tag_pirnev.main` does.
+When the csv is not available, synthetic institution names are used instead.
+
+The compiled tagger (`tagger.extract_org_types`, and `extract_org_types_many` for the whole column)
+is timed against the original regex loop: searching the whole `tagger.ORG_TYPE` pattern
+and dropping the matched words one by one (`baseline_find_keywords`, a copy of the original code),
+their outputs are checked to be the same.
+'''
+
+import argparse
+import json
+import os
+import time
+
+import petl
+
+from org_name_search import tagger
+from org_name_search.normalize import normalize
+from org_name_search.rebuilder import WORD
+from org_name_search.settlements import SettlementMap
+from org_name_search.tag_pirnev import tag
+
+from .synthetic import Generator, SETTLEMENTS_CSV
+
+
+def read_names(args):
+    '''
+    -> (source, names)
+    '''
+    if os.path.exists(args.pirnev):
+        names = petl.fromcsv(args.pirnev, encoding='utf-8', errors='strict').values('NEV')
+        return args.pirnev, list(names)
+    generator = Generator(seed=args.seed)
+    names = [
+        generator.query(details)[0]
+        for details in generator.pir_to_details(args.synthetic).values()]
+    return f'synthetic ({args.synthetic} PIRs)', names
+
+
+def best_time(function, texts, repeat):
+    '''
+    -> (seconds of the fastest of `repeat` runs, results)
+    '''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [function(text) for text in texts]
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, results
+
+
+class _SequentialWordDropper:
+    # the original word dropper of rebuilder
+
+    def __init__(self, text):
+        self._words = WORD.finditer(text)
+        self._unprocessed = None
+        self._non_dropped = []
+
+    def words(self):
+        if self._unprocessed is not None:
+            yield self._unprocessed
+            self._unprocessed = None
+        for word in self._words:
+            yield word
+
+    def keep_until(self, char_index):
+        for word in self.words():
+            if word.end < char_index:
+                self._non_dropped.append(word)
+            else:
+                self._unprocessed = word
+                return
+
+    def drop_until(self, char_index):
+        for word in self.words():
+            if word.start >= char_index:
+                self._unprocessed = word
+                return
+
+    def keep_rest(self):
+        self._non_dropped.extend(self.words())
+
+    @property
+    def non_dropped(self):
+        return ' '.join(w.span for w in self._non_dropped)
+
+
+def baseline_find_keywords(pattern, text):
+    '''
+    The original rebuilder.find_keywords
+    '''
+    swd = _SequentialWordDropper(text)
+    keywords = set()
+    for match in pattern.finditer(text):
+        keywords.update(match.keys)
+        swd.keep_until(match.start)
+        swd.drop_until(match.end)
+    swd.keep_rest()
+
+    return keywords, swd.non_dropped
+
+
+def search_org_type(text):
+    return baseline_find_keywords(tagger.ORG_TYPE, text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pirnev', default='data/PIRNEV.csv')
+    parser.add_argument('--synthetic', type=int, default=20000, help='number of synthetic PIRs without PIRNEV (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    source, names = read_names(args)
+    settlement_map = SettlementMap()
+    settlement_map.read_csv(SETTLEMENTS_CSV)
+    # the tagger gets the names without settlements, as in tag_pirnev
+    texts = [settlement_map.extract_settlements(normalize(name))[1] for name in names]
+
+    search_seconds, searched = best_time(search_org_type, texts, args.repeat)
+    compiled_seconds, compiled = best_time(tagger.extract_org_types, texts, args.repeat)
+    batch_seconds, batch = best_time(tagger.extract_org_types_many, [texts], args.repeat)
+    pipeline_seconds, _ = best_time(lambda name: tag(settlement_map, name), names, args.repeat)
+
+    results = {
+        'source': source,
+        'names': len(names),
+        'regex_search_us_per_name': round(search_seconds / len(texts) * 1e6, 2),
+        'compiled_tagger_us_per_name': round(compiled_seconds / len(texts) * 1e6, 2),
+        'speedup': round(search_seconds / compiled_seconds, 2),
+        'compiled_tagger_batch_us_per_name': round(batch_seconds / len(texts) * 1e6, 2),
+        'tag_pirnev_us_per_name': round(pipeline_seconds / len(names) * 1e6, 2),
+        'same_output': searched == compiled == batch[0],
+    }
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+# coding: utf-8
+'''
+Caches for query results
+'''
+
+import collections
+import hashlib
+import json
+import sqlite3
+
+from .index import NGramSearchResult, NoResult
+
+
+class LRUCache:
+    '''
+    Mapping with at most `maxsize` items, the least recently used ones are evicted.
+
+    Counts the lookups, that found (hits) and did not find (misses) the key.
+    '''
+
+    def __init__(self, maxsize):
+        assert maxsize >= 0
+        self.maxsize = maxsize
+        self._items = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        try:
+            value = self._items[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if not self.maxsize:
+            return
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        return self._items.pop(key, default)
+
+    @property
+    def stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return f'{self.hits} hits, {self.misses} misses ({hit_rate:.1%} hit rate), {len(self)} cached'
+
+
+def file_fingerprint(path):
+    '''
+    -> content hash of the file at path
+    '''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def combined_fingerprint(*fingerprints):
+    '''
+    -> fingerprint of data made from data having the fingerprints (None for unknown ones)
+    '''
+    return hashlib.sha256(json.dumps(fingerprints).encode('ascii')).hexdigest()
+
+
+# NGramSearchResult needs only the name of the query
+_StoredQuery = collections.namedtuple('_StoredQuery', 'name')
+
+
+class MatchStore:
+    '''
+    Matches of queries stored in an SQLite database, so that they are reused by later runs.
+
+    The stored matches are valid only for the index they were found in:
+    when the index fingerprint changes, all of them are dropped.
+    Matches found with different matcher parameters are stored separately.
+    '''
+
+    def __init__(self, path, index, params):
+        '''
+            index:  NGramIndex having a fingerprint
+            params: the matcher parameters the matches depend on, must be JSON serializable
+        '''
+        assert index.fingerprint, 'index has no fingerprint'
+        self.index = index
+        self.params = json.dumps(params, sort_keys=True)
+        self.pir_to_row = {pir: row for row, pir in enumerate(index.pirs)}
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path)
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS matches (params TEXT, query TEXT, matches TEXT, PRIMARY KEY (params, query))')
+            stored_fingerprint = self.db.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+            if stored_fingerprint != (index.fingerprint,):
+                self.db.execute('DELETE FROM matches')
+                self.db.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('fingerprint', ?)", (index.fingerprint,))
+
+    def close(self):
+        self.db.close()
+
+    def get(self, key):
+        '''
+        -> the stored matches of the query key, None if not stored
+        '''
+        row = self.db.execute(
+            'SELECT matches FROM matches WHERE params = ? AND query = ?', (self.params, json.dumps(key))).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [self._load_match(match) for match in json.loads(row[0])]
+
+    def put_many(self, key_matches):
+        '''
+            key_matches: [(query key, matches)]
+        '''
+        with self.db:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO matches (params, query, matches) VALUES (?, ?, ?)',
+                [
+                    (self.params, json.dumps(key), json.dumps([self._dump_match(match) for match in matches]))
+                    for key, matches in key_matches])
+
+    def _dump_match(self, match):
+        if match is NoResult:
+            return None
+        return [
+            match.details.pir, match.score, match.match_error, match.query_text, match.match_text, match.settlement]
+
+    def _load_match(self, match):
+        if match is None:
+            return NoResult
+        pir, score, match_error, query_text, match_text, settlement = match
+        details = self.index.details[self.pir_to_row[pir]]
+        return NGramSearchResult(_StoredQuery(query_text), details, score, match_error, match_text, settlement)
+
+    @property
+    def stats(self):
+        return f'{self.hits} hits, {self.misses} misses'
@@ -0,0 +1,110 @@
+# coding: utf-8
+'''
+Measurements collected per process: stage timings (stats), diagnostics and search latencies (latency)
+
+Each kind of measurement has a registered Collector, that is off by default.
+Worker processes (see parallel) send what they collected (take_all) back with their results,
+it is merged into the collectors of the parent (merge_all).
+'''
+
+import abc
+
+
+class Collector(abc.ABC):
+    '''
+    Measurements collected in this process, `collected` is None when collection is off.
+
+    Subclasses define the empty measurements (new) and how measurements are added up (add).
+    '''
+
+    def __init__(self):
+        self.collected = None
+
+    @abc.abstractmethod
+    def new(self):
+        '''
+        -> empty measurements
+        '''
+
+    @abc.abstractmethod
+    def add(self, collected, taken):
+        '''
+        Add taken measurements (see take) to collected ones.
+        '''
+
+    def export(self, collected):
+        '''
+        -> collected measurements in the form returned by take
+        '''
+        return collected
+
+    def enable(self):
+        if self.collected is None:
+            self.collected = self.new()
+
+    def disable(self):
+        self.collected = None
+
+    def enabled(self):
+        return self.collected is not None
+
+    def paused(self):
+        '''
+        -> context manager turning off collection temporarily (e.g. for a diagnostic re-run of a query)
+        '''
+        return _Paused(self)
+
+    def take(self):
+        '''
+        -> the measurements collected since the last take; None when collection is off
+        '''
+        if self.collected is None:
+            return None
+        collected = self.collected
+        self.collected = self.new()
+        return self.export(collected)
+
+    def merge(self, taken):
+        '''
+        Add measurements (see take) to the collected ones.
+        '''
+        if self.collected is None or taken is None:
+            return
+        self.add(self.collected, taken)
+
+
+class _Paused:
+
+    def __init__(self, collector):
+        self.collector = collector
+
+    def __enter__(self):
+        self.collected = self.collector.collected
+        self.collector.collected = None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.collector.collected = self.collected
+
+
+# the registered collectors, in the same order in all processes
+_collectors = []
+
+
+def register(collector):
+    _collectors.append(collector)
+    return collector
+
+
+def take_all():
+    '''
+    -> the measurements of all collectors since the last take, see merge_all
+    '''
+    return [collector.take() for collector in _collectors]
+
+
+def merge_all(taken):
+    '''
+    Add the measurements taken by take_all (in another process) to the collected ones.
+    '''
+    for collector, measurements in zip(_collectors, taken):
+        collector.merge(measurements)
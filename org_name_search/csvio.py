@@ -0,0 +1,109 @@
+# coding: utf-8
+'''
+Streaming CSV input/output with the csv module
+
+Compressed files are read and written transparently, the compression is
+detected from the file extension: .gz, .bz2, .xz and .zst
+(the latter needs the optional zstandard package).
+
+The CSV dialect is the same as petl's fromcsv/tocsv (csv module defaults),
+so the output is the same as with petl.
+'''
+
+import bz2
+import csv
+import gzip
+import io
+import itertools
+import lzma
+
+import petl
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from . import stats
+
+
+BUFFER_SIZE = 1 << 20
+# number of rows given to the csv writer at once
+WRITE_BATCH_SIZE = 1000
+
+
+def _open_zstandard(path, mode):
+    if zstandard is None:
+        raise ValueError(f'{path}: reading/writing .zst files needs the zstandard package')
+    return zstandard.open(path, mode)
+
+
+OPENERS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+    '.zst': _open_zstandard,
+}
+
+
+def compression_opener(path):
+    '''
+    -> function opening path as a binary file (decompressing/compressing), None for uncompressed files
+    '''
+    for extension, opener in OPENERS.items():
+        if path.lower().endswith(extension):
+            return opener
+    return None
+
+
+def open_text(path, mode, encoding='utf-8', errors='strict'):
+    '''
+    Open a (potentially compressed) text file for csv reading (mode 'r') or writing (mode 'w').
+    '''
+    assert mode in ('r', 'w')
+    opener = compression_opener(path)
+    if opener is None:
+        return open(path, mode, encoding=encoding, errors=errors, newline='', buffering=BUFFER_SIZE)
+
+    binary = opener(path, mode + 'b')
+    if mode == 'r':
+        binary = io.BufferedReader(binary, BUFFER_SIZE)
+    else:
+        binary = io.BufferedWriter(binary, BUFFER_SIZE)
+    return io.TextIOWrapper(binary, encoding=encoding, errors=errors, newline='')
+
+
+class CSVView(petl.Table):
+    '''
+    Rows of a (potentially compressed) CSV file, as tuples.
+    '''
+
+    def __init__(self, path, encoding='utf-8', errors='strict', **csvargs):
+        self.path = path
+        self.encoding = encoding
+        self.errors = errors
+        self.csvargs = csvargs
+
+    def __iter__(self):
+        with open_text(self.path, 'r', self.encoding, self.errors) as f:
+            for row in csv.reader(f, **self.csvargs):
+                yield tuple(row)
+
+
+def fromcsv(path, encoding='utf-8', errors='strict', **csvargs):
+    return CSVView(path, encoding, errors, **csvargs)
+
+
+def tocsv(table, path, encoding='utf-8', errors='strict', **csvargs):
+    '''
+    Write table (an iterable of rows, header first) to a (potentially compressed) CSV file.
+    '''
+    with open_text(path, 'w', encoding, errors) as f:
+        writer = csv.writer(f, **csvargs)
+        rows = iter(table)
+        while True:
+            batch = list(itertools.islice(rows, WRITE_BATCH_SIZE))
+            if not batch:
+                break
+            with stats.timer('write output'):
+                writer.writerows(batch)
@@ -13,7 +13,7 @@ import os
 import petl
 from typing import Set
 
-from .pir_details import PirDetails, load_pir_to_details
+from .pir_details import PirDetails, load_pir_to_details, load_pir_delta
 
 
 app_root = __file__
@@ -43,4 +43,4 @@ assert parse_date('2004-12-38') is None
 assert parse_date('20041228') == datetime.date(2004, 12, 28)
 assert parse_date('20041228invalid') is None
 
-__all__ = ['csv_open', 'PirDetails', 'load_pir_to_details', 'parse_date']
+__all__ = ['csv_open', 'PirDetails', 'load_pir_to_details', 'load_pir_delta', 'parse_date']
@@ -0,0 +1,141 @@
+# coding: utf-8
+'''
+Counters and histograms of the work done for the queries, and of their outcomes
+
+    diagnostics.count('outcome.ambiguous')
+    diagnostics.observe('postings', 1234)
+
+Histograms have power of two buckets: a value is counted in the bucket of the
+smallest power of two, that is not less than the value (0 has its own bucket).
+
+Collection is off by default, then the functions do nothing.
+
+The diagnostics are collected by a registered collector (see collectors),
+so worker processes (see parallel) send them back with their results.
+'''
+
+import json
+
+from . import collectors
+
+
+def _empty():
+    return {'counters': {}, 'histograms': {}}
+
+
+def _new_histogram():
+    return {'count': 0, 'total': 0, 'max': 0, 'buckets': {}}
+
+
+class _Diagnostics(collectors.Collector):
+    '''
+    Diagnostics collected as
+    {'counters': {name: count}, 'histograms': {name: {'count', 'total', 'max', 'buckets': {bucket: count}}}}
+    '''
+
+    def new(self):
+        return _empty()
+
+    def add(self, diagnostics, other):
+        counters = diagnostics['counters']
+        for name, n in other['counters'].items():
+            counters[name] = counters.get(name, 0) + n
+        histograms = diagnostics['histograms']
+        for name, other_histogram in other['histograms'].items():
+            histogram = histograms.get(name)
+            if histogram is None:
+                histogram = histograms[name] = _new_histogram()
+            histogram['count'] += other_histogram['count']
+            histogram['total'] += other_histogram['total']
+            histogram['max'] = max(histogram['max'], other_histogram['max'])
+            buckets = histogram['buckets']
+            for value_bucket, n in other_histogram['buckets'].items():
+                buckets[value_bucket] = buckets.get(value_bucket, 0) + n
+
+
+_diagnostics = collectors.register(_Diagnostics())
+
+enable = _diagnostics.enable
+disable = _diagnostics.disable
+enabled = _diagnostics.enabled
+take = _diagnostics.take
+merge = _diagnostics.merge
+paused = _diagnostics.paused
+
+
+class captured:
+    '''
+    Context manager collecting diagnostics separately (e.g. of a single query), even when collection is off:
+
+        with diagnostics.captured() as capture:
+            ...
+        capture.diagnostics  # see take
+    '''
+
+    def __enter__(self):
+        self.saved = _diagnostics.collected
+        _diagnostics.collected = _empty()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.diagnostics = _diagnostics.collected
+        _diagnostics.collected = self.saved
+
+
+def bucket(value):
+    '''
+    -> the smallest power of two not less than value (an int), 0 for values <= 0
+    '''
+    if value <= 0:
+        return 0
+    return 1 << (value - 1).bit_length()
+
+
+def count(name, n=1):
+    diagnostics = _diagnostics.collected
+    if diagnostics is None:
+        return
+    counters = diagnostics['counters']
+    counters[name] = counters.get(name, 0) + n
+
+
+def observe(name, value):
+    diagnostics = _diagnostics.collected
+    if diagnostics is None:
+        return
+    histogram = diagnostics['histograms'].get(name)
+    if histogram is None:
+        histogram = diagnostics['histograms'][name] = _new_histogram()
+    histogram['count'] += 1
+    histogram['total'] += value
+    histogram['max'] = max(histogram['max'], value)
+    buckets = histogram['buckets']
+    value_bucket = bucket(value)
+    buckets[value_bucket] = buckets.get(value_bucket, 0) + 1
+
+
+def report():
+    '''
+    -> the collected diagnostics as a JSON serializable dict
+
+    Histograms have their mean, and their buckets as {bucket: count} in increasing bucket order.
+    '''
+    diagnostics = _diagnostics.collected or _empty()
+    histograms = {}
+    for name, histogram in sorted(diagnostics['histograms'].items()):
+        histograms[name] = {
+            'count': histogram['count'],
+            'mean': round(histogram['total'] / histogram['count'], 3) if histogram['count'] else 0,
+            'max': histogram['max'],
+            'buckets': {str(value_bucket): n for value_bucket, n in sorted(histogram['buckets'].items())},
+        }
+    return {'counters': dict(sorted(diagnostics['counters'].items())), 'histograms': histograms}
+
+
+def write(path):
+    '''
+    Save the collected diagnostics (see report) as JSON to path.
+    '''
+    with open(path, 'w') as f:
+        json.dump(report(), f, indent=2)
+        f.write('\n')
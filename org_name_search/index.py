@@ -1,11 +1,25 @@
 # coding: utf-8
 
+from array import array
+import bisect
 import collections
-from datetime import datetime
+from datetime import date, datetime
 import functools
+import heapq
+import itertools
+import time
 
-from .normalize import normalize, simplify_accents
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .normalize import tokenize
 from .data import PirDetails
+from . import diagnostics
+from . import scoring
+from . import snapshot
+from . import stats
 
 
 def ngrams(text, n=3):
@@ -15,20 +29,31 @@ def ngrams(text, n=3):
     return set(text[i:i+n] for i in range(len(text) - n + 1))
 
 
-def union_ngrams(text, n=3):
+def word_ngrams(words, n=3):
     """
-    Generate set of ngrams for words in text.
+    Generate set of ngrams for words (see `normalize.tokenize`).
+
+    The ngrams of a word are its ngrams and its first and last n+1 characters padded with a space.
     """
     text_ngrams = set()
-    for word in simplify_accents(normalize(text)).split():
-        word_ngrams = set(ngrams(word, n))
+    add = text_ngrams.add
+    for word in words:
         padded = f' {word} '
-        word_ngrams.add(padded[:n+1])
-        word_ngrams.add(padded[-n-1:])
-        text_ngrams |= word_ngrams
+        add(padded[:n+1])
+        add(padded[-n-1:])
+        # the ngrams of word
+        for i in range(1, len(word) - n + 2):
+            add(padded[i:i+n])
     return text_ngrams
 
 
+def union_ngrams(text, n=3):
+    """
+    Generate set of ngrams for words in text.
+    """
+    return word_ngrams(tokenize(text).words, n)
+
+
 # name, names -> best_match_name, "match_score"
 # TODO: rename details -> pir_details
 
@@ -36,12 +61,19 @@ class Query:
     # TODO: expand all caps words to letters separated with dot-space ('. ' )
     # TODO: . stops ngram generation (end of word is skipped)
     # TODO: register number .-s so that scoring algorythm can accomodate presensce of acronyms
-    def __init__(self, name: str, settlement: str, parse, date: datetime.date =None):
+    def __init__(self, name: str, settlement: str, parse, date: datetime.date =None, words=None):
+        """
+        words: tokenize(name).words, when name is already tokenized
+        """
         self.name = name
         self.settlement = settlement
         self.parse = parse
         self.date: datetime.date = date
-        self.name_ngrams = union_ngrams(name) | (union_ngrams(settlement) if settlement else set())
+        if words is None:
+            words = tokenize(name).words
+        if settlement:
+            words = words + tokenize(settlement).words
+        self.name_ngrams = word_ngrams(words)
 
     @property
     def parsed(self):
@@ -106,6 +138,10 @@ class NoResult:
         return 'NoResult()'
     __repr__ = __str__ = __unicode__
 
+    def __reduce__(self):
+        # unpickle as the NoResult singleton
+        return 'NoResult'
+
 
 NoResult = NoResult()
 
@@ -134,99 +170,592 @@ class NGramSearchResult:
     __repr__ = __str__ = __unicode__
 
 
+NO_END_DAY = date.max.toordinal() + 1
+
+
+def _mapped(values, mapping):
+    """
+    -> array('i') of mapping[value] for values
+
+        values, mapping: array('i')
+    """
+    if numpy is None:
+        return array('i', [mapping[value] for value in values])
+    mapped = numpy.frombuffer(mapping, dtype=numpy.intc)[numpy.frombuffer(values, dtype=numpy.intc)]
+    result = array('i')
+    result.frombytes(mapped.tobytes())
+    return result
+
+
+class TextNGrams:
+    """
+    Texts of the rows (e.g. names of the PIRs) with their ngram ids, in flat arrays.
+
+    The texts of row `r` are `texts[row_offsets[r]:row_offsets[r + 1]]`,
+    the sorted ngram ids of text `t` are `ngram_ids[ngram_offsets[t]:ngram_offsets[t + 1]]`.
+    """
+
+    def __init__(self, texts, row_offsets, ngram_offsets, ngram_ids):
+        self.texts = texts
+        self.row_offsets = row_offsets
+        self.ngram_offsets = ngram_offsets
+        self.ngram_ids = ngram_ids
+
+    @classmethod
+    def build(cls, row_texts, text_ngram_ids):
+        texts = []
+        row_offsets = array('q', [0])
+        ngram_offsets = array('q', [0])
+        ngram_ids = array('i')
+        for row_text_list in row_texts:
+            for text in row_text_list:
+                texts.append(text)
+                ngram_ids.extend(text_ngram_ids(text))
+                ngram_offsets.append(len(ngram_ids))
+            row_offsets.append(len(texts))
+        return cls(texts, row_offsets, ngram_offsets, ngram_ids)
+
+    def updated(self, rows, text_ngram_ids, ngram_id_map=None):
+        """
+        -> TextNGrams of new rows, taking over the texts of the unchanged ones from self
+
+            rows:            for each new row, the row of self taken over or the texts of a changed row
+            text_ngram_ids:  function returning the sorted (new) ngram ids of a text of a changed row
+            ngram_id_map:    the new ids of the ngram ids of self, None if they are unchanged
+        """
+        texts = []
+        row_offsets = array('q', [0])
+        ngram_offsets = array('q', [0])
+        ngram_ids = array('i')
+
+        def take_over(first_row, end_row):
+            first_text, end_text = self.row_offsets[first_row], self.row_offsets[end_row]
+            first_ngram, end_ngram = self.ngram_offsets[first_text], self.ngram_offsets[end_text]
+            text_shift = len(texts) - first_text
+            ngram_shift = len(ngram_ids) - first_ngram
+            texts.extend(self.texts[first_text:end_text])
+            row_offsets.extend(offset + text_shift for offset in self.row_offsets[first_row + 1:end_row + 1])
+            ngram_offsets.extend(offset + ngram_shift for offset in self.ngram_offsets[first_text + 1:end_text + 1])
+            old_ngram_ids = self.ngram_ids[first_ngram:end_ngram]
+            ngram_ids.extend(old_ngram_ids if ngram_id_map is None else _mapped(old_ngram_ids, ngram_id_map))
+
+        # consecutive rows taken over are copied at once
+        first_row = end_row = None
+        for row in rows:
+            if isinstance(row, int) and row == end_row:
+                end_row += 1
+                continue
+            if first_row is not None:
+                take_over(first_row, end_row)
+                first_row = end_row = None
+            if isinstance(row, int):
+                first_row, end_row = row, row + 1
+            else:
+                for text in row:
+                    texts.append(text)
+                    ngram_ids.extend(text_ngram_ids(text))
+                    ngram_offsets.append(len(ngram_ids))
+                row_offsets.append(len(texts))
+        if first_row is not None:
+            take_over(first_row, end_row)
+        return self.__class__(texts, row_offsets, ngram_offsets, ngram_ids)
+
+    def get_state(self):
+        return self.texts, self.row_offsets, self.ngram_offsets, self.ngram_ids
+
+    def of_row(self, row):
+        """
+        -> [(text, sorted ngram ids of text)] for the texts of row
+        """
+        ngram_offsets = self.ngram_offsets
+        ngram_ids = self.ngram_ids
+        return [
+            (self.texts[t], ngram_ids[ngram_offsets[t]:ngram_offsets[t + 1]])
+            for t in range(self.row_offsets[row], self.row_offsets[row + 1])]
+
+
 class NGramIndex:
-    def __init__(self, pir_to_details, parse, idf_shift=0):
+    """
+    Inverted index of PIR name & settlement ngrams.
+
+    Ngrams are interned to dense integer ids (assigned in sorted ngram order),
+    PIRs are mapped to dense row ids (in pir_to_details iteration order).
+    The postings of all ngrams are stored in one contiguous int array,
+    the postings of ngram `i` are `postings[offsets[i]:offsets[i + 1]]`, sorted by row id.
+
+    `fingerprint` identifies the PIR data the index is built from (e.g. content hash of the json),
+    or is None when unknown.
+    """
+
+    def __init__(self, pir_to_details, parse, idf_shift=0, fingerprint=None):
         self.parse = parse
         assert idf_shift >= 0
         self.idf_shift = idf_shift
-        self.pir_to_details = pir_to_details
-        self.index = collections.defaultdict(set)  # ngram -> set(pirs)
-        self.ngram_counts = collections.Counter()
-
-        def detail_ngrams(pir_details):
-            text = ' '.join(pir_details.names) + ' ' + ' '.join(pir_details.settlements)
-            text = ' '.join(sorted(set(text.split())))
-            return union_ngrams(text)
-        for pir, pir_details in self.pir_to_details.items():
-            ngrams = detail_ngrams(pir_details)
-            for ngram in ngrams:
-                self.index[ngram].add(pir)
-            self.ngram_counts.update(ngrams)
-        self.index = dict(self.index)
-
-        average_freq = sum(self.ngram_counts.values()) / len(self.ngram_counts)
-        self.missing_ngram_tfidf = 1 / (average_freq + idf_shift)
-
-    def search(self, query, max_results=10):
-        # pir_score = pir -> sum(tfidf(ngram) for ngram in query_ngrams)
-        max_score = 0
-        pir_score = collections.defaultdict(float)
+        self.fingerprint = fingerprint
+        self.pirs = list(pir_to_details)
+        self.details = [pir_to_details[pir] for pir in self.pirs]
+
+        # ngrams are generated once per distinct text: settlements and names are repeated a lot
+        text_ngrams = {}
+
+        def ngrams_of(text):
+            ngrams = text_ngrams.get(text)
+            if ngrams is None:
+                ngrams = text_ngrams[text] = union_ngrams(text)
+            return ngrams
+
+        row_names = [sorted(pir_details.names) for pir_details in self.details]
+        row_settlements = [sorted(pir_details.settlements) for pir_details in self.details]
+        row_ngrams = [
+            set().union(*(ngrams_of(text) for text in names + settlements))
+            for names, settlements in zip(row_names, row_settlements)]
+
+        self.ngrams = sorted(set().union(*row_ngrams))
+        ngram_ids = {ngram: ngram_id for ngram_id, ngram in enumerate(self.ngrams)}
+        row_ngram_ids = [[ngram_ids[ngram] for ngram in ngrams] for ngrams in row_ngrams]
+
+        def sorted_ngram_ids(text):
+            return sorted(ngram_ids[ngram] for ngram in ngrams_of(text))
+        self.names = TextNGrams.build(row_names, sorted_ngram_ids)
+        self.settlements = TextNGrams.build(row_settlements, sorted_ngram_ids)
+
+        self._init_days()
+        self._init_postings(row_ngram_ids)
+        self._init_lookups()
+
+    def _init_days(self):
+        # validity intervals as date ordinals, open ends are replaced with ordinals out of the range of dates
+        self.start_days = array('i', (d.start_date.toordinal() if d.start_date else 0 for d in self.details))
+        self.end_days = array('i', (d.end_date.toordinal() if d.end_date else NO_END_DAY for d in self.details))
+        # the set of valid rows changes only at these days
+        self.epoch_starts = array('i', sorted(set(self.start_days) | {day + 1 for day in self.end_days}))
+
+    def _init_postings(self, row_ngram_ids):
+        ngram_counts = [0] * len(self.ngrams)
+        for ngram_ids_of_row in row_ngram_ids:
+            for ngram_id in ngram_ids_of_row:
+                ngram_counts[ngram_id] += 1
+        self.ngram_counts = array('i', ngram_counts)
+
+        self.offsets = array('q', [0])
+        for count in ngram_counts:
+            self.offsets.append(self.offsets[-1] + count)
+
+        # rows are visited in increasing order, so each posting list gets sorted
+        self.postings = array('i', bytes(self.postings_itemsize * self.offsets[-1]))
+        fill = array('q', self.offsets[:-1])
+        for row, ngram_ids_of_row in enumerate(row_ngram_ids):
+            for ngram_id in ngram_ids_of_row:
+                self.postings[fill[ngram_id]] = row
+                fill[ngram_id] += 1
+
+    postings_itemsize = array('i').itemsize
+
+    def _init_lookups(self, tfidfs=None):
+        self.ngram_ids = {ngram: ngram_id for ngram_id, ngram in enumerate(self.ngrams)}
+        self._postings = memoryview(self.postings)
+        # simplification: tf in tfidf is 1.0 (ignore effect of rare ngram repetition within same name)
+        # shift freq to lower the impact of very rare, potentially bogus ngrams
+        idf_shift = self.idf_shift
+        if tfidfs is None:
+            tfidfs = array('d', (1.0 / (freq + idf_shift) for freq in self.ngram_counts))
+        self.tfidfs = tfidfs
+        average_freq = sum(self.ngram_counts) / len(self.ngram_counts)
+        self.missing_ngram_tfidf = 1 / (average_freq + self.idf_shift)
+        self.scorer = scoring.make_scorer(self)
+        self._validity_masks = collections.OrderedDict()
+
+    def get_state(self):
+        """
+        Everything that is needed to recreate the index without rebuilding it.
+
+        Query time parameters (parse, idf_shift) are not part of the state.
+        """
+        return {
+            'fingerprint': self.fingerprint,
+            'pirs': self.pirs,
+            'details': self.details,
+            'ngrams': self.ngrams,
+            'ngram_counts': self.ngram_counts,
+            'offsets': self.offsets,
+            'postings': self.postings,
+            'names': self.names.get_state(),
+            'settlements': self.settlements.get_state(),
+            'start_days': self.start_days,
+            'end_days': self.end_days,
+            'epoch_starts': self.epoch_starts,
+        }
+
+    @classmethod
+    def from_state(cls, state, parse, idf_shift=0):
+        assert idf_shift >= 0
+        self = cls.__new__(cls)
+        self.parse = parse
+        self.idf_shift = idf_shift
+        self.fingerprint = state['fingerprint']
+        self.pirs = state['pirs']
+        self.details = state['details']
+        self.ngrams = state['ngrams']
+        self.ngram_counts = state['ngram_counts']
+        self.offsets = state['offsets']
+        self.postings = state['postings']
+        self.names = TextNGrams(*state['names'])
+        self.settlements = TextNGrams(*state['settlements'])
+        self.start_days = state['start_days']
+        self.end_days = state['end_days']
+        self.epoch_starts = state['epoch_starts']
+        self._init_lookups()
+        return self
+
+    def save(self, path):
+        snapshot.write_snapshot(self.get_state(), path)
+
+    @classmethod
+    def load(cls, path, parse, idf_shift=0):
+        return cls.from_state(snapshot.read_snapshot(path), parse, idf_shift)
+
+    def apply_delta(self, delta, fingerprint=None):
+        """
+        -> new index of the PIRs updated with delta, the same as if it was built from scratch
+
+            delta: {pir: PirDetails or None}, None removes the PIR, new PIRs are added at the end
+
+        Only the changed and new PIRs have their ngrams generated,
+        and only the postings of their ngrams (and of the ngrams of the replaced PIRs) are rebuilt.
+        The texts, postings and tfidfs of the rest are taken over from this index (renumbered).
+        """
+        pir_to_details = self.pir_to_details
+        for pir, details in delta.items():
+            if details is None:
+                pir_to_details.pop(pir, None)
+            else:
+                pir_to_details[pir] = details
+        pir_to_old_row = {pir: row for row, pir in enumerate(self.pirs)}
+
+        index = self.__class__.__new__(self.__class__)
+        index.parse = self.parse
+        index.idf_shift = self.idf_shift
+        index.fingerprint = fingerprint
+        index.pirs = list(pir_to_details)
+        index.details = [pir_to_details[pir] for pir in index.pirs]
+        # rows taken over unchanged -> their row in this index
+        old_rows = [None if pir in delta else pir_to_old_row[pir] for pir in index.pirs]
+        # changed pirs keep their rows, so rows shift only when a pir is removed
+        rows_shifted = any(details is None and pir in pir_to_old_row for pir, details in delta.items())
+        old_to_new_row = array('i', [-1]) * len(self.pirs)
+        for row, old_row in enumerate(old_rows):
+            if old_row is not None:
+                old_to_new_row[old_row] = row
+
+        # ngrams of the replaced rows (their postings lose the row)
+        dropped_counts = collections.Counter()
+        for pir in delta:
+            old_row = pir_to_old_row.get(pir)
+            if old_row is not None:
+                dropped_counts.update(set().union(
+                    *(ngram_ids for _text, ngram_ids in self.names.of_row(old_row) + self.settlements.of_row(old_row))))
+        # ngram -> new rows having it, in increasing order
+        text_ngrams = {}
+        added_rows = collections.defaultdict(list)
+        for row, (details, old_row) in enumerate(zip(index.details, old_rows)):
+            if old_row is None:
+                for text in itertools.chain(details.names, details.settlements):
+                    if text not in text_ngrams:
+                        text_ngrams[text] = union_ngrams(text)
+                for ngram in set().union(*(text_ngrams[text] for text in details.names | details.settlements)):
+                    added_rows[ngram].append(row)
+
+        old_ngram_ids = self.ngram_ids
+        vanished = {
+            ngram_id for ngram_id, count in dropped_counts.items()
+            if count == self.ngram_counts[ngram_id] and self.ngrams[ngram_id] not in added_rows}
+        added_ngrams = sorted(ngram for ngram in added_rows if ngram not in old_ngram_ids)
+        if vanished or added_ngrams:
+            # ngram ids are assigned in sorted ngram order in both indexes, so renumbering keeps the id order
+            index.ngrams = []
+            new_to_old_id = []
+            old_to_new_id = array('i', [-1]) * len(self.ngrams)
+            kept = ((ngram, ngram_id) for ngram_id, ngram in enumerate(self.ngrams) if ngram_id not in vanished)
+            for ngram, old_id in heapq.merge(kept, ((ngram, -1) for ngram in added_ngrams)):
+                if old_id >= 0:
+                    old_to_new_id[old_id] = len(index.ngrams)
+                new_to_old_id.append(old_id)
+                index.ngrams.append(ngram)
+        else:
+            index.ngrams = list(self.ngrams)
+            new_to_old_id = range(len(self.ngrams))
+            old_to_new_id = None
+
+        def new_ngram_id(ngram):
+            return bisect.bisect_left(index.ngrams, ngram)
+
+        def sorted_ngram_ids(text):
+            return sorted(new_ngram_id(ngram) for ngram in text_ngrams[text])
+        index.names = self.names.updated(
+            [sorted(details.names) if old_row is None else old_row
+                for details, old_row in zip(index.details, old_rows)],
+            sorted_ngram_ids, old_to_new_id)
+        index.settlements = self.settlements.updated(
+            [sorted(details.settlements) if old_row is None else old_row
+                for details, old_row in zip(index.details, old_rows)],
+            sorted_ngram_ids, old_to_new_id)
+
+        touched = {new_ngram_id(ngram) for ngram in added_rows}
+        touched.update(
+            ngram_id if old_to_new_id is None else old_to_new_id[ngram_id]
+            for ngram_id in dropped_counts if ngram_id not in vanished)
         idf_shift = self.idf_shift
+        ngram_counts = array('i')
+        offsets = array('q', [0])
+        postings = array('i')
+        tfidfs = array('d')
+
+        def take_over(first_old_id, end_old_id):
+            # the postings of consecutive ngrams are contiguous
+            first, end = self.offsets[first_old_id], self.offsets[end_old_id]
+            shift = len(postings) - first
+            rows = self.postings[first:end]
+            postings.extend(_mapped(rows, old_to_new_row) if rows_shifted else rows)
+            offsets.extend(offset + shift for offset in self.offsets[first_old_id + 1:end_old_id + 1])
+            ngram_counts.extend(self.ngram_counts[first_old_id:end_old_id])
+            tfidfs.extend(self.tfidfs[first_old_id:end_old_id])
+
+        # the ngrams between the touched ones are taken over,
+        # in runs of ngrams that were consecutive in this index (vanished ngrams break the runs)
+        run_ends = touched | {new_ngram_id(self.ngrams[ngram_id]) for ngram_id in vanished} | {len(index.ngrams)}
+        first_id = 0
+        for ngram_id in sorted(run_ends):
+            if first_id < ngram_id:
+                take_over(new_to_old_id[first_id], new_to_old_id[ngram_id - 1] + 1)
+            first_id = ngram_id
+            if ngram_id not in touched:
+                continue
+            old_id = new_to_old_id[ngram_id]
+            rows = []
+            if old_id >= 0:
+                rows = [old_to_new_row[row] for row in self.postings_of(old_id) if old_to_new_row[row] >= 0]
+            rows = list(heapq.merge(rows, added_rows.get(index.ngrams[ngram_id], ())))
+            postings.extend(rows)
+            offsets.append(len(postings))
+            ngram_counts.append(len(rows))
+            tfidfs.append(1.0 / (len(rows) + idf_shift))
+            first_id = ngram_id + 1
+        index.ngram_counts = ngram_counts
+        index.offsets = offsets
+        index.postings = postings
+
+        index._init_days()
+        index._init_lookups(tfidfs)
+        return index
+
+    @property
+    def pir_to_details(self):
+        return dict(zip(self.pirs, self.details))
+
+    def ngram_freq(self, ngram):
+        ngram_id = self.ngram_ids.get(ngram)
+        if ngram_id is None:
+            return 0
+        return self.ngram_counts[ngram_id]
+
+    def postings_of(self, ngram_id):
+        """
+        Rows containing the ngram, in increasing order.
+        """
+        return self._postings[self.offsets[ngram_id]:self.offsets[ngram_id + 1]]
+
+    def validity_epoch(self, date):
+        """
+        -> number identifying the set of PIRs valid at date
+
+        Dates with the same epoch have the same valid PIRs.
+        """
+        return bisect.bisect_right(self.epoch_starts, date.toordinal())
+
+    def valid_rows(self, date):
+        """
+        -> mask of the rows that are valid at date (see `PirDetails.is_valid_at`)
+        """
+        epoch = self.validity_epoch(date)
+        masks = self._validity_masks
+        if epoch in masks:
+            masks.move_to_end(epoch)
+        else:
+            masks[epoch] = self.scorer.validity_mask(date.toordinal())
+            if len(masks) > self.max_validity_masks:
+                masks.popitem(last=False)
+        return masks[epoch]
+
+    max_validity_masks = 64
+
+    def _scoring_task(self, query):
+        """
+        -> (terms, max_score, valid) or None if nothing can match the query
+
+        terms = [(ngram_id, tfidf(ngram)) for ngram in query_ngrams]
+        """
+        diagnostics.observe('query ngrams', len(query.name_ngrams))
+        max_score = 0
+        terms = []
         for ngram in sorted(query.name_ngrams):
-            freq = self.ngram_counts[ngram]
-            if freq:
-                pirs = self.index.get(ngram, ())
-                # simplification: tf in tfidf is 1.0 (ignore effect of rare ngram repetition within same name)
-                # shift freq to lower the impact of very rare, potentially bogus ngrams
-                tfidf = 1.0 / (freq + idf_shift)
+            ngram_id = self.ngram_ids.get(ngram)
+            if ngram_id is not None:
+                tfidf = self.tfidfs[ngram_id]
                 max_score += tfidf
-                for pir in pirs:
-                    pir_score[pir] += tfidf
+                terms.append((ngram_id, tfidf))
             else:
                 # this prevents the strange phenomenon, that a lorem ipsum text has 1.0 score.
                 # since scores are normalized, a query containing an ngram that is not present in the index
                 # will not have 1.0 score for any match
                 max_score += self.missing_ngram_tfidf
 
+        if diagnostics.enabled():
+            offsets = self.offsets
+            diagnostics.observe('postings', sum(offsets[ngram_id + 1] - offsets[ngram_id] for ngram_id, _ in terms))
         if max_score <= 0:
-            return []
+            return None
 
         # drop matches that were not valid at query time
-        if query.date:
-            for pir in list(pir_score):
-                if not self.pir_to_details[pir].is_valid_at(query.date):
-                    del pir_score[pir]
-
-        # features to use for deciding on match quality (much later, when evaluating matches - if there is any at all):
-        #  - tfidf of ngrams
-        #  - length of query - in number of ngrams
-        #  - match / (match + non-match) ratio
-        #  - parsed query text & parsed matches
-        #  - presence of acronyms in query
-
-        # pirs with highest scores
-        # drop matches, that have low query matching score: they are not matches
-        min_score = max_score / 4.0
-        top_scores = sorted(set(score for score in pir_score.values() if score > min_score), reverse=True)[:max_results]
-        if not top_scores:
-            return []
-        min_score = top_scores[-1]
-
-        pirs = (pir for pir, score in pir_score.items() if score >= min_score)
-        search_results = (self.get_search_result(query, pir, pir_score, max_score) for pir in pirs)
-        # drop overly negative matches - they turned out to be not so great match
-        # also makes the returned score to be between -1 and 1
-        search_results = (r for r in search_results if r.score >= 0.)
-        search_results = (r for r in search_results if r.score >= 0.55)
+        valid = self.valid_rows(query.date) if query.date else None
+
+        return terms, max_score, valid
+
+    # features to use for deciding on match quality (much later, when evaluating matches - if there is any at all):
+    #  - tfidf of ngrams
+    #  - length of query - in number of ngrams
+    #  - match / (match + non-match) ratio
+    #  - parsed query text & parsed matches
+    #  - presence of acronyms in query
+
+    # rows with highest scores are the candidates
+    # drop matches, that have low query matching score (<= max_score / 4): they are not matches
+
+    def search(self, query, max_results=10, materialize=None):
+        """
+        Find the best matches for query.
+
+        max_results:  return at most this many results
+        materialize:  when given, only this many of the best results are returned (lazy mode):
+                      the results are selected by score first,
+                      and only the selected ones are fully evaluated
+        """
+        with stats.timer('scoring'):
+            task = self._scoring_task(query)
+            if task is None:
+                return []
+            terms, max_score, valid = task
+            candidates = self.scorer.top_candidates(terms, max_score / 4.0, max_results, valid)
+        with stats.timer('select'):
+            return self._search_results(query, terms, candidates, max_score, max_results, materialize)
+
+    def search_many(self, queries, max_results=10, materialize=None, seconds=None):
+        """
+        Search for a block of queries at once.
+
+        Returns the list of results for each query, the same as `search` would.
+
+            seconds:  when given, the search time of each query is appended to this list
+                      (work done for the block as a whole is divided evenly among its queries)
+        """
+        query_seconds = [0.0] * len(queries)
+        with stats.timer('scoring'):
+            tasks = []
+            for i, query in enumerate(queries):
+                start = time.perf_counter()
+                tasks.append(self._scoring_task(query))
+                query_seconds[i] = time.perf_counter() - start
+            scored = [i for i, task in enumerate(tasks) if task is not None]
+            scoring_seconds = []
+            candidates = self.scorer.top_candidates_many(
+                [(tasks[i][0], tasks[i][1] / 4.0, tasks[i][2]) for i in scored],
+                max_results, scoring_seconds)
+            for i, task_seconds in zip(scored, scoring_seconds):
+                query_seconds[i] += task_seconds
+
+        results = [[] for _ in queries]
+        with stats.timer('select'):
+            for i, query_candidates in zip(scored, candidates):
+                start = time.perf_counter()
+                terms, max_score, _valid = tasks[i]
+                results[i] = self._search_results(
+                    queries[i], terms, query_candidates, max_score, max_results, materialize)
+                query_seconds[i] += time.perf_counter() - start
+        if seconds is not None:
+            seconds.extend(query_seconds)
+        return results
+
+    def no_result_reason(self, query):
+        """
+        -> why query has no results:
+           'date filter' (it would have results without its date),
+           'weak matches' (it has candidates, but none of them scores at least 0.55)
+           or 'no candidates'
+
+        The query is searched again for this (without recording diagnostics and stage timings).
+        """
+        with diagnostics.paused(), stats.paused():
+            task = self._scoring_task(query)
+            if task is None:
+                return 'no candidates'
+            terms, max_score, valid = task
+            min_score = max_score / 4.0
+            if valid is not None:
+                undated_candidates = self.scorer.top_candidates(terms, min_score, 1)
+                if self._search_results(query, terms, undated_candidates, max_score, 1):
+                    return 'date filter'
+            if self.scorer.top_candidates(terms, min_score, 1, valid):
+                return 'weak matches'
+            return 'no candidates'
+
+    def _search_results(self, query, terms, candidates, max_score, max_results, materialize=None):
+        # drop weak matches - the (normalized) score is known before the result is built, so filter on it first
+        candidates = [(row, score) for row, score in candidates if score / max_score >= 0.55]
+        diagnostics.observe('results', len(candidates))
+
+        if materialize is not None and len(candidates) > materialize:
+            # results are ordered by score, then match_error
+            # keep all candidates tied with the last one to be returned, as match_error can reorder them
+            min_score = heapq.nlargest(materialize, (score / max_score for _row, score in candidates))[-1]
+            candidates = [(row, score) for row, score in candidates if score / max_score >= min_score]
+            max_results = min(max_results, materialize)
+
+        # results tied on score and match_error are kept in first hit order:
+        # by the first query ngram (in sorted ngram order) the row has, then by row
+        candidates = sorted(candidates, key=lambda candidate: self._first_hit(terms, candidate[0]))
+        query_ngram_ids = {ngram_id for ngram_id, _tfidf in terms}
+        search_results = [
+            self.get_search_result(query, query_ngram_ids, row, score, max_score)
+            for row, score in candidates]
         return sorted(search_results, reverse=True)[:max_results]
 
-    def get_search_result(self, query, pir, pir_score, max_score):
-        details = self.pir_to_details[pir]
-        match_text = self.select(query.name_ngrams, details.names)
+    def _first_hit(self, terms, row):
+        """
+        -> (index of the first term having row in its postings, row)
+        """
+        for i, (ngram_id, _tfidf) in enumerate(terms):
+            postings = self.postings_of(ngram_id)
+            position = bisect.bisect_left(postings, row)
+            if position < len(postings) and postings[position] == row:
+                return i, row
+        return len(terms), row
+
+    def get_search_result(self, query, query_ngram_ids, row, row_score, max_score):
+        details = self.details[row]
+        match_text, match_ngram_ids = self.select(query_ngram_ids, self.names.of_row(row))
         if query.settlement and query.settlement in details.settlements:
             settlement = query.settlement
         else:
-            settlement = self.select(query.name_ngrams, details.settlements)
+            settlement, _ = self.select(query_ngram_ids, self.settlements.of_row(row))
         match = match_text
         if settlement:
             match += ' ' + settlement
         # score is normalized (0 <= score <= 1.0)
-        score = pir_score[pir] / max_score
+        score = row_score / max_score
         # query_error is also normalized to be between 0 and 1
         # query_error = 1 - score
-        non_query_ngrams = union_ngrams(match_text) - query.name_ngrams
+        non_query_ngram_ids = (ngram_id for ngram_id in match_ngram_ids if ngram_id not in query_ngram_ids)
         # match_error intentionally does not include settlement, there is also no upper limit
-        match_error = self._tfidf(non_query_ngrams, self.missing_ngram_tfidf) / max_score
+        match_error = self._tfidf(non_query_ngram_ids) / max_score
         return (
             NGramSearchResult(
                 query,
@@ -236,37 +765,34 @@ class NGramIndex:
                 match_text=match_text,
                 match_settlement=settlement))
 
-    def _tfidf(self, ngrams, missing_ngram_tfidf=0):
+    def _tfidf(self, ngram_ids):
+        tfidfs = self.tfidfs
         tfidf = 0.0
-        idf_shift = self.idf_shift
-        for ngram in sorted(ngrams):
-            freq = self.ngram_counts[ngram]
-            if freq:
-                # simplification: tf in tfidf is 1.0 (ignore effect of rare ngram repetition within same name)
-                # shift freq to lower the impact of very rare, potentially bogus ngrams
-                tfidf += 1.0 / (freq + idf_shift)
-            else:
-                tfidf += missing_ngram_tfidf
+        for ngram_id in ngram_ids:
+            tfidf += tfidfs[ngram_id]
         return tfidf
 
-    def select(self, query_ngrams, text_options):
+    def select(self, query_ngram_ids, text_options):
         """
         Select the best matching text from text_options.
 
+            text_options: [(text, sorted ngram ids of text)]
+
+        -> (text, ngram ids of text), ('', ()) if there are no options
+
         Note, that it is not intended as a general search,
         as text_options is expected to be a small list,
         and exactly one option is returned.
         """
 
-        if not text_options:
-            return ''
-
-        _score, best_text = (
-            sorted(
-                ((self._tfidf(union_ngrams(text) & query_ngrams), text)
-                    for text in text_options),
-                reverse=True)[0])
-        return best_text
+        best = None
+        for text, ngram_ids in text_options:
+            score = self._tfidf(ngram_id for ngram_id in ngram_ids if ngram_id in query_ngram_ids)
+            if best is None or (score, text) > best[:2]:
+                best = score, text, ngram_ids
+        if best is None:
+            return '', ()
+        return best[1:]
 
 
 Index = NGramIndex
@@ -0,0 +1,161 @@
+# coding: utf-8
+'''
+Search latency of the queries, and the slow queries
+
+The latencies are counted in a histogram with logarithmic buckets
+(BUCKETS_PER_DOUBLING buckets between each power of two microseconds),
+so the memory use does not depend on the number of queries,
+and the percentiles are accurate within a bucket (about 9%).
+
+Slow queries (taking at least the slow threshold) are kept with their details for a slow query log.
+
+Recording is off by default.
+
+The latencies are collected by a registered collector (see collectors),
+so worker processes (see parallel) send them back with their results.
+'''
+
+import csv
+import math
+
+from . import collectors
+
+
+BUCKETS_PER_DOUBLING = 8
+
+
+def _bucket(seconds):
+    microseconds = seconds * 1e6
+    if microseconds <= 1:
+        return 0
+    return math.ceil(math.log2(microseconds) * BUCKETS_PER_DOUBLING)
+
+
+def _bucket_seconds(bucket):
+    '''
+    -> upper bound of bucket in seconds
+    '''
+    return 2 ** (bucket / BUCKETS_PER_DOUBLING) / 1e6
+
+
+class Latencies:
+
+    def __init__(self):
+        # bucket -> number of queries
+        self.buckets = {}
+        self.count = 0
+        self.max = 0.0
+        # [(seconds, details)]
+        self.slow_queries = []
+
+    def add(self, seconds):
+        bucket = _bucket(seconds)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        self.max = max(self.max, other.max)
+        self.slow_queries.extend(other.slow_queries)
+
+    def percentile(self, percent):
+        '''
+        -> nearest-rank percentile of the latencies in seconds (upper bound of its bucket), None if there are none
+        '''
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(percent / 100 * self.count))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(_bucket_seconds(bucket), self.max)
+
+    def summary(self):
+        if not self.count:
+            return 'no queries searched'
+        percentiles = ', '.join(
+            f'p{percent} {self.percentile(percent) * 1000:.3f} ms' for percent in (50, 90, 99))
+        return f'{percentiles}, max {self.max * 1000:.3f} ms ({self.count} queries)'
+
+
+class _Recorder(collectors.Collector):
+    '''
+    Latencies collected in Latencies
+    '''
+
+    def new(self):
+        return Latencies()
+
+    def add(self, latencies, other):
+        latencies.merge(other)
+
+
+_latencies = collectors.register(_Recorder())
+# queries taking at least this many seconds are slow, None: no slow queries are kept
+_slow_threshold = None
+
+
+def enable(slow_threshold=None):
+    '''
+        slow_threshold: seconds, keep the details of the queries taking at least this long
+    '''
+    global _slow_threshold
+    _latencies.enable()
+    _slow_threshold = slow_threshold
+
+
+def disable():
+    global _slow_threshold
+    _latencies.disable()
+    _slow_threshold = None
+
+
+enabled = _latencies.enabled
+take = _latencies.take
+merge = _latencies.merge
+
+
+def record(seconds):
+    '''
+    Count the latency of a query.
+
+    -> True if the query is slow: its details are to be given to `add_slow_query`
+    '''
+    latencies = _latencies.collected
+    if latencies is None:
+        return False
+    latencies.add(seconds)
+    return _slow_threshold is not None and seconds >= _slow_threshold
+
+
+def add_slow_query(seconds, details):
+    '''
+        details: {field: value}, see SLOW_LOG_FIELDS
+    '''
+    latencies = _latencies.collected
+    if latencies is not None:
+        latencies.slow_queries.append((seconds, details))
+
+
+def summary():
+    return (_latencies.collected or Latencies()).summary()
+
+
+SLOW_LOG_FIELDS = ('milliseconds', 'name', 'settlement', 'date', 'query_ngrams', 'postings', 'scored_rows', 'candidates')
+
+
+def write_slow_log(path):
+    '''
+    Save the slow queries as CSV to path, the slowest first.
+    '''
+    slow_queries = sorted((_latencies.collected or Latencies()).slow_queries, key=lambda slow: slow[0], reverse=True)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(SLOW_LOG_FIELDS)
+        for seconds, details in slow_queries:
+            details = dict(details, milliseconds=round(seconds * 1000, 3))
+            writer.writerow([details.get(field) for field in SLOW_LOG_FIELDS])
@@ -1,15 +1,29 @@
 # coding: utf-8
 
 import argparse
+import collections
+import contextlib
+import cProfile
+import io
+import itertools
 import sys
+import time
 
 import petl
-from petl.io.sources import FileSource
 
 from .settlements import SettlementMap  # read_settlements, make_settlement_variant_map, extract_settlements
 from .index import Index, Query, NoResult
-from .data import load_pir_to_details, parse_date
-from .normalize import normalize
+from .data import load_pir_to_details, load_pir_delta, parse_date
+from .normalize import normalize, tokenize
+from .cache import LRUCache, MatchStore, combined_fingerprint, file_fingerprint
+from .snapshot import is_snapshot
+from . import csvio
+from . import diagnostics
+from . import latency
+from . import parallel
+from . import server
+from . import stats
+from . import stream
 from . import tagger
 
 
@@ -57,11 +71,108 @@ def field_name(base, i):
 class OrgNameParser(SettlementMap):
 
     def parse(self, org_name):
-        normalized_name = normalize(org_name)
-        settlements, name_wo_settlements = self.extract_settlements(normalized_name)
-        keywords, new_name = tagger.extract_org_types(name_wo_settlements)
-        rest = new_name.split()
-        return settlements, keywords, rest
+        with stats.timer('parse'):
+            normalized_name = normalize(org_name)
+            settlements, name_wo_settlements = self.extract_settlements(normalized_name)
+            keywords, new_name = tagger.extract_org_types(name_wo_settlements)
+            rest = new_name.split()
+            return settlements, keywords, rest
+
+
+BATCH_SIZE = 100
+MAX_RESULTS = 10
+CACHE_SIZE = 100000
+
+
+class MatchesView(petl.Table):
+    """
+    Extends the input rows with the fields of their matches.
+
+    The rows are given to `match_batches` in batches of `batch_size` rows,
+    `match_values` turns the matches of a row into the values of `match_fields`.
+    """
+
+    def __init__(self, source, match_fields, match_batches, batch_size, match_values):
+        self.source = source
+        self.match_fields = tuple(match_fields)
+        self.match_batches = match_batches
+        self.batch_size = batch_size
+        self.match_values = match_values
+
+    def __iter__(self):
+        rows = iter(self.source)
+        header = tuple(next(rows))
+        yield header + self.match_fields
+
+        width = len(header)
+        # batches given to match_batches, but not yet matched
+        unmatched = collections.deque()
+
+        def batches():
+            while True:
+                with stats.timer('read input'):
+                    batch = [tuple(row) for row in itertools.islice(rows, self.batch_size)]
+                if not batch:
+                    return
+                # short rows are padded, like petl does for missing values
+                batch = [row + (None,) * (width - len(row)) if len(row) < width else row for row in batch]
+                unmatched.append(batch)
+                yield batch
+
+        match_values = self.match_values
+        for matches in self.match_batches(header, batches()):
+            for row, row_matches in zip(unmatched.popleft(), matches):
+                yield row + match_values(row_matches)
+
+
+class _Matches:
+    """
+    Matches of a query, available when the search for it is finished.
+
+    outcome: of the search, counted in diagnostics for each row having these matches
+             (see OrgNameMatcher.outcome, None when diagnostics is off)
+    """
+    __slots__ = ('matches', 'outcome')
+
+    def __init__(self, matches=None, outcome=None):
+        self.matches = matches
+        self.outcome = outcome
+
+
+_NO_MATCHES = _Matches([NoResult], 'stop word')
+
+
+class _Batch:
+    """
+    Queries of a batch of input rows.
+    """
+
+    def __init__(self):
+        # _Matches for each row
+        self.rows = []
+        # queries to search for (see OrgNameMatcher.search) and where to put their matches
+        self.to_search = []
+        self.search_keys = []
+        self.searching = []
+        # key -> _Matches for the queries searched for in this batch
+        self.searched = {}
+
+    def matches(self, found):
+        for matches, (query_matches, outcome) in zip(self.searching, found):
+            matches.matches = query_matches
+            matches.outcome = outcome
+        return [matches.matches for matches in self.rows]
+
+
+def load_index(path, parse, idf_shift=0):
+    """
+    Load the index from a PIR json or from an index snapshot.
+    """
+    if is_snapshot(path):
+        return Index.load(path, parse=parse, idf_shift=idf_shift)
+    return Index(
+        load_pir_to_details(path=path), parse=parse, idf_shift=idf_shift,
+        fingerprint=file_fingerprint(path))
 
 
 class OrgNameMatcher:
@@ -72,7 +183,8 @@ class OrgNameMatcher:
     def __init__(self,
             input_fields : InputFields,
             output_fields : OutputFields,
-            parse, extramatches=0, differentiating_ambiguity=0.0, idf_shift=None, stop_words=()):
+            parse, extramatches=0, differentiating_ambiguity=0.0, idf_shift=None, stop_words=(),
+            batch_size=BATCH_SIZE, jobs=1, max_results=MAX_RESULTS, cache_size=CACHE_SIZE, match_store=None):
         """
         input_fields:  define the input stream structure (what is the fields to use for matching)
         output_fields: define the match field names in the generated output stream
@@ -84,6 +196,11 @@ class OrgNameMatcher:
         idf_shift:     shift document frequency by this number, makes rare instances of ngrams less rare, range: non-negative numbers
                        the smaller the number (<10), the greater effect of rare, potentially bogus names will have (not good)
                        the bigger the number, the less impact of frequency differences will have (not good)
+        batch_size:    number of input rows searched for together
+        jobs:          number of worker processes searching in parallel (1: search in this process)
+        max_results:   number of top scores considered for a query
+        cache_size:    number of query results kept in memory for reuse
+        match_store:   SQLite file to keep query results in for reuse by later runs (None: do not keep them)
         """
         self.index = None
         self.input_fields = input_fields
@@ -98,9 +215,34 @@ class OrgNameMatcher:
             self.differentiating_ambiguity = differentiating_ambiguity
         assert idf_shift >= 0
         self.idf_shift = idf_shift
+        assert batch_size > 0
+        self.batch_size = batch_size
+        assert jobs > 0
+        if jobs > 1 and not parallel.can_fork():
+            print(f"Parallel search is not supported on this platform, using 1 job instead of {jobs}")
+            jobs = 1
+        self.jobs = jobs
+        assert max_results > 0
+        self.max_results = max_results
+        self.query_cache = LRUCache(cache_size)
+        self.match_store_path = match_store
+        self.match_store = None
 
     def load_index(self, index_data):
-        self.index = Index(load_pir_to_details(path=index_data), parse=self.parse, idf_shift=self.idf_shift)
+        self.index = load_index(index_data, parse=self.parse, idf_shift=self.idf_shift)
+
+    def open_match_store(self):
+        if not self.index.fingerprint:
+            print(f"Index has no fingerprint, not using match store {self.match_store_path}")
+            return
+        # everything except the index, that the matches depend on
+        params = dict(
+            extramatches=self.extramatches,
+            differentiating_ambiguity=self.differentiating_ambiguity,
+            idf_shift=self.idf_shift,
+            stop_words=sorted(self.stop_words),
+            max_results=self.max_results)
+        self.match_store = MatchStore(self.match_store_path, self.index, params)
 
     def validate_input(self, input):
         input_header = petl.header(input)
@@ -127,89 +269,234 @@ class OrgNameMatcher:
 
         Expects and returns a PETL table container
         """
-        # make up a new intermediate field that is guaranteed to not exist
-        taken_header_names = set(petl.header(input)) | self.output_fields.as_set
-        max_input_field_name_length = max(len(name) for name in taken_header_names if name)
-        matches_field = 'matches-' + '0' * max_input_field_name_length
-
-        org_name_field = self.input_fields.org_name
-        settlement_field = self.input_fields.settlement
-        date_field = self.input_fields.date
+        slots = range(self.extramatches + 1)
+        with_settlement = bool(self.output_fields.settlement)
+
+        match_fields = []
+        for i in slots:
+            match_fields.extend(
+                field_name(f, i)
+                for f in (
+                    self.output_fields.score,
+                    self.output_fields.match_error,
+                    self.output_fields.pir,
+                    self.output_fields.tax_id,
+                    self.output_fields.name))
+            if with_settlement:
+                match_fields.append(field_name(self.output_fields.settlement, i))
+
+        def match_values(row_matches):
+            values = []
+            for match in self.slot_matches(row_matches):
+                values.extend((match.score, match.match_error, match.details.pir, match.details.tax_id, match.match_text))
+                if with_settlement:
+                    values.append(match.settlement)
+            return tuple(values)
+
+        return MatchesView(input, match_fields, self.match_batches, self.batch_size, match_values)
+
+    def slot_matches(self, row_matches):
+        """
+        -> the matches to output for a row: one for each of the extramatches + 1 slots,
+           NoResult for missing matches
+        """
+        slots = []
+        for i in range(self.extramatches + 1):
+            match = row_matches[i] if i < len(row_matches) else NoResult
+            slots.append(NoResult if match.score == 0 else match)
+        return slots
+
+    def match_batches(self, header, batches):
+        """
+        Find the matches for a stream of input row batches.
+
+        Yields the list of matches for each row of each batch, in order.
+        """
+        # batches waiting for the search results of their queries
+        pending = collections.deque()
+
+        def searches():
+            for rows in batches:
+                with stats.timer('prepare queries'):
+                    batch = self.prepare_batch(header, rows)
+                pending.append(batch)
+                yield (batch.to_search,)
+
+        if self.jobs > 1:
+            # the index is loaded by now, workers get it through fork
+            found_batches = parallel.imap_ordered(self.search, searches(), self.jobs)
+        else:
+            found_batches = (self.search(*task) for task in searches())
+        for found in found_batches:
+            yield self.complete_batch(pending.popleft(), found)
+        print(f"Query cache: {self.query_cache.stats}")
+        if latency.enabled():
+            print(f"Search latency: {latency.summary()}")
+        if self.match_store:
+            print(f"Match store: {self.match_store.stats}")
+
+    def query_key(self, words, settlement, date):
+        """
+        Queries with the same key have the same matches.
+
+            words: tokenize(name).words
+        """
+        epoch = self.index.validity_epoch(date) if date else None
+        return ' '.join(words), settlement, epoch
+
+    def prepare_batch(self, header, rows):
+        """
+        Collect the queries of rows, that are to be searched for.
+        """
+        org_name_index = header.index(self.input_fields.org_name)
+        settlement_index = header.index(self.input_fields.settlement) if self.input_fields.settlement else None
+        date_index = header.index(self.input_fields.date) if self.input_fields.date else None
         stop_words = self.stop_words
 
-        def _find_matches(row):
-            name = row[org_name_field]
-            if stop_words & set(name.lower().replace('.', ' ').split()):
-                return [NoResult]
-            settlement = row[settlement_field] if settlement_field else None
-            date = parse_date(row[date_field]) if date_field else None
-            query = Query(name, settlement, self.parse, date=date)
-
-            # nuke ambiguous matches, except when the first is a full match and the only one such
-            # XXX: this code only works with the first two matches, needs to be elaborated if more is needed
-            matches = self.index.search(query)
-            if len(matches) > 1:
-                score_diff = matches[0].score - matches[1].score
-                if score_diff == 0:
-                    score_diff = matches[1].match_error - matches[0].match_error
-                if score_diff <= self.differentiating_ambiguity:
-                    matches = [NoResult]
-            return matches
-
-        def _unpack_match(input, i):
-            def _get_match(row, i):
-                row_matches = row[matches_field]
-                if len(row_matches) <= i:
-                    return NoResult
-                result = row_matches[i]
-                if result.score == 0:
-                    return NoResult
-                return result
-
-            output = (
-                input
-                .addfield(
-                    field_name(self.output_fields.score, i),
-                    lambda row: _get_match(row, i).score)
-
-                .addfield(
-                    field_name(self.output_fields.match_error, i),
-                    lambda row: _get_match(row, i).match_error)
-
-                .addfield(
-                    field_name(self.output_fields.pir, i),
-                    lambda row: _get_match(row, i).details.pir)
-
-                .addfield(
-                    field_name(self.output_fields.tax_id, i),
-                    lambda row: _get_match(row, i).details.tax_id)
-
-                .addfield(
-                    field_name(self.output_fields.name, i),
-                    lambda row: _get_match(row, i).match_text)
-
-            )
-            if self.output_fields.settlement:
-                output = output.addfield(
-                    field_name(self.output_fields.settlement, i),
-                    lambda row: _get_match(row, i).settlement)
-
-            return output
-
-        output = input.addfield(matches_field, _find_matches)
-        for i in range(self.extramatches + 1):
-            output = _unpack_match(output, i)
-        # drop raw match fields (they were unpacked)
-        output = output.cutout(matches_field)
-        return output
+        batch = _Batch()
+        for row in rows:
+            name = row[org_name_index]
+            with stats.timer('normalize'):
+                tokens = tokenize(name, stop_words)
+            if tokens.has_stop_word:
+                batch.rows.append(_NO_MATCHES)
+                continue
+            settlement = row[settlement_index] if settlement_index is not None else None
+            date = parse_date(row[date_index]) if date_index is not None else None
+
+            key = self.query_key(tokens.words, settlement, date)
+            # the cache has the (future) matches of queries searched for in previous batches
+            matches = self.query_cache.get(key) or batch.searched.get(key)
+            if matches is None and self.match_store:
+                stored_matches = self.match_store.get(key)
+                if stored_matches is not None:
+                    outcome = None
+                    if diagnostics.enabled():
+                        # the reason of no results is not stored
+                        query = Query(name, settlement, self.parse, date=date, words=tokens.words)
+                        outcome = self.outcome(query, stored_matches)
+                    matches = _Matches(stored_matches, outcome)
+                    self.query_cache.put(key, matches)
+            if matches is None:
+                matches = batch.searched[key] = _Matches()
+                self.query_cache.put(key, matches)
+                batch.to_search.append((name, settlement, date, tokens.words))
+                batch.search_keys.append(key)
+                batch.searching.append(matches)
+            batch.rows.append(matches)
+        return batch
+
+    def complete_batch(self, batch, found):
+        """
+        Give the search results of a batch prepared by prepare_batch to its queries.
+
+        Returns the list of matches for each row of the batch.
+        """
+        if self.match_store:
+            with stats.timer('match store'):
+                self.match_store.put_many(
+                    (key, matches) for key, (matches, _outcome) in zip(batch.search_keys, found))
+        rows = batch.matches(found)
+        if diagnostics.enabled():
+            diagnostics.count('rows', len(batch.rows))
+            for matches in batch.rows:
+                diagnostics.count('outcome.' + matches.outcome)
+        return rows
+
+    def search(self, queries):
+        """
+        Find the matches for queries.
+
+            queries: [(name, settlement, date, words of name)], see prepare_batch
+
+        Returns the list of (matches, outcome) for each query, see complete_batch.
+
+        The queries are searched together (index.search_many),
+        the latency of each query is recorded when latencies are recorded (see latency).
+        """
+        search_queries = []
+        parse_seconds = []
+        with stats.timer('query ngrams'):
+            for name, settlement, date, words in queries:
+                start = time.perf_counter()
+                search_queries.append(Query(name, settlement, self.parse, date=date, words=words))
+                parse_seconds.append(time.perf_counter() - start)
+        queries = search_queries
+        search_seconds = []
+        # only the first two matches are needed for deciding on ambiguity
+        found = self.index.search_many(
+            queries, self.max_results, materialize=self.extramatches + 2, seconds=search_seconds)
+        if latency.enabled():
+            for query, parsing, searching in zip(queries, parse_seconds, search_seconds):
+                seconds = parsing + searching
+                if latency.record(seconds):
+                    latency.add_slow_query(seconds, self.slow_query_details(query))
+        with stats.timer('ambiguity'):
+            results = [self.drop_ambiguous(matches) for matches in found]
+        diagnostics.count('queries', len(queries))
+        return [(matches, self.outcome(query, matches)) for query, matches in zip(queries, results)]
+
+    def slow_query_details(self, query):
+        """
+        -> details of query for the slow query log (see latency.SLOW_LOG_FIELDS)
+
+        The query is searched again to collect the amount of work it needs (not timed in the stages).
+        """
+        with stats.paused(), diagnostics.captured() as capture:
+            self.index.search(query, self.max_results, materialize=self.extramatches + 2)
+        histograms = capture.diagnostics['histograms']
+
+        def observed(name):
+            return histograms[name]['total'] if name in histograms else 0
+
+        return {
+            'name': query.name,
+            'settlement': query.settlement,
+            'date': query.date.isoformat() if query.date else None,
+            'query_ngrams': observed('query ngrams'),
+            'postings': observed('postings'),
+            'scored_rows': observed('candidates before cut'),
+            'candidates': observed('candidates after cut'),
+        }
+
+    def outcome(self, query, matches):
+        """
+        -> outcome of the search for query: matched, ambiguous, or the reason of no results,
+           None when diagnostics is off
+
+            matches: the matches of query kept by drop_ambiguous
+        """
+        if not diagnostics.enabled():
+            return None
+        if not matches:
+            return self.index.no_result_reason(query)
+        if matches[0] is NoResult:
+            return 'ambiguous'
+        return 'matched'
+
+    def drop_ambiguous(self, matches):
+        # nuke ambiguous matches, except when the first is a full match and the only one such
+        # XXX: this code only works with the first two matches, needs to be elaborated if more is needed
+        if len(matches) > 1:
+            score_diff = matches[0].score - matches[1].score
+            if score_diff == 0:
+                score_diff = matches[1].match_error - matches[0].match_error
+            if score_diff <= self.differentiating_ambiguity:
+                matches = [NoResult]
+        return matches
 
     @classmethod
-    def run(cls, input, input_fields, output_fields, index_data, parse, extramatches=0, differentiating_ambiguity=0, idf_shift=0, stop_words=()):
-        finder = cls(input_fields, output_fields, parse, extramatches, differentiating_ambiguity, idf_shift, stop_words)
+    def run(cls, input, input_fields, output_fields, index_data, parse, extramatches=0, differentiating_ambiguity=0, idf_shift=0, stop_words=(),
+            batch_size=BATCH_SIZE, jobs=1, max_results=MAX_RESULTS, cache_size=CACHE_SIZE, match_store=None):
+        finder = cls(
+            input_fields, output_fields, parse, extramatches, differentiating_ambiguity, idf_shift, stop_words,
+            batch_size, jobs, max_results, cache_size, match_store)
         print(f"Validating input headers {petl.header(input)}")
         finder.validate_input(input)
         print(f"Loading index {index_data}")
         finder.load_index(index_data)
+        if match_store:
+            finder.open_match_store()
         print("Finding matches...")
         return finder.find_matches(input)
 
@@ -217,6 +504,127 @@ class OrgNameMatcher:
 find_matches = OrgNameMatcher.run
 
 
+def non_negative_float(value):
+    value = float(value)
+    if value < 0:
+        raise argparse.ArgumentTypeError(f"expecting non-negative float, got {value}")
+    return value
+
+
+def positive_int(value):
+    value = int(value)
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"expecting positive integer, got {value}")
+    return value
+
+
+def non_negative_int(value):
+    value = int(value)
+    if value < 0:
+        raise argparse.ArgumentTypeError(f"expecting non-negative integer, got {value}")
+    return value
+
+
+def add_matcher_arguments(parser, jobs=True):
+    """
+    Add the options of OrgNameMatcher to parser, see matcher_kwargs.
+
+        jobs: add the option for the number of processes, too
+    """
+    parser.add_argument(
+        '--extramatches', default=0, action='count',
+        help='''output multiple matches, implies --keep-ambiguous''')
+
+    parser.add_argument(
+        '--drop-ambiguous', dest='differentiating_ambiguity', default=0.001, type=float,
+        help='''report no match for matches where the score difference of the first
+        two matches are less than this value
+        (default: %(default)s)''')
+
+    parser.add_argument(
+        '--keep-ambiguous', dest='differentiating_ambiguity', const=-1,
+        action='store_const',
+        help='''keep all first matches - even potentially bad ones
+        (see --drop-ambiguous)''')
+
+    parser.add_argument(
+        '--idf-shift', type=non_negative_float, default=10.0,
+        help="""Shift frequency count by this number. This is an important parameter, influences score!
+        If this value is small (<10), typos in text to find have great effect,
+        potentially resulting in a bad match, that has the same rare character combination as the typo.
+        However, if this value is too big (>>100), rare words will have the same influence over the match as common ones
+        (e.g. siofoki = budapesti = magyar = nemzeti).
+        (default: %(default)s)"""
+    )
+
+    HUN_DEFAULT_STOP_WORDS = ('bt', 'rt', 'zrt', 'nyrt', 'kft')
+
+    parser.add_argument(
+        '-x', '--stop-word', dest='stop_words', metavar='STOP-WORD',
+        action='append',
+        default=list(HUN_DEFAULT_STOP_WORDS),
+        help="""Exclude matches for queries that contain these words (default: %(default)s)""")
+
+    class SetHunDefault(argparse.Action):
+        def __call__(self, parser, namespace, values, option_string):
+            setattr(namespace, self.dest, list(HUN_DEFAULT_STOP_WORDS))
+
+    parser.add_argument(
+        '--hun-stop-words', dest='stop_words',
+        action=SetHunDefault,
+        nargs=0,
+        help=f"""Exclude matches for these words: {', '.join(HUN_DEFAULT_STOP_WORDS)}""")
+
+    class ClearArg(argparse.Action):
+        def __call__(self, parser, namespace, values, option_string):
+            setattr(namespace, self.dest, [])
+
+    parser.add_argument(
+        '--clear-stop-words', dest='stop_words', action=ClearArg,
+        nargs=0,
+        help="Make the stop-word list empty"
+    )
+
+    parser.add_argument(
+        '--max-results', type=positive_int, default=MAX_RESULTS,
+        help="""Consider the matches with the best this many distinct scores.
+        Matches not among them are not reported, even with --extramatches.
+        (default: %(default)s)""")
+
+    parser.add_argument(
+        '--cache-size', type=non_negative_int, default=CACHE_SIZE,
+        help="""Number of query results to remember, repeated queries are not searched for again.
+        0 turns off caching.
+        (default: %(default)s)""")
+
+    parser.add_argument(
+        '--match-cache', dest='match_store', metavar='SQLITE_FILE',
+        help="""Keep the matches in this file, and reuse them in later runs with the same index and parameters.
+        The kept matches are dropped, when the index changes.""")
+
+    if jobs:
+        parser.add_argument(
+            '-j', '--jobs', type=positive_int, default=1,
+            help="""Number of processes to search with.
+            The output is the same as with a single process.
+            (default: %(default)s)""")
+
+
+def matcher_kwargs(args):
+    """
+    -> OrgNameMatcher keyword arguments from the options added by add_matcher_arguments
+    """
+    return dict(
+        extramatches=args.extramatches,
+        differentiating_ambiguity=args.differentiating_ambiguity,
+        idf_shift=args.idf_shift,
+        stop_words=args.stop_words,
+        jobs=getattr(args, 'jobs', 1),
+        max_results=args.max_results,
+        cache_size=args.cache_size,
+        match_store=args.match_store)
+
+
 def parse_args(argv, version):
     description = '''
         Identify organizations by name (and optionally by settlement)
@@ -226,12 +634,14 @@ def parse_args(argv, version):
 
     parser = argparse.ArgumentParser(
         # formatter_class=argparse.RawDescriptionHelpFormatter,
-        description=description)
+        description=description,
+        epilog='other commands: {} (see COMMAND --help)'.format(', '.join(COMMANDS)))
 
     parser.add_argument(
         'pir_index',
         metavar='PIR_INDEX_JSON',
-        help='json file containing the pre-processed PIR database (see pir-index bead)')
+        help='''json file containing the pre-processed PIR database (see pir-index bead),
+        or an index snapshot made by the build-index command''')
 
     parser.add_argument(
         'org_name_field',
@@ -239,14 +649,14 @@ def parse_args(argv, version):
         help='input field containing the organization name to find')
 
     parser.add_argument(
-        'input_csv', type=FileSource,
+        'input_csv',
         metavar='INPUT_CSV',
-        help='input csv file')
+        help='input csv file, compressed if it ends with .gz, .bz2, .xz or .zst')
 
     parser.add_argument(
-        'output_csv', type=FileSource,
+        'output_csv',
         metavar='OUTPUT_CSV',
-        help='output csv file')
+        help='output csv file, compressed if it ends with .gz, .bz2, .xz or .zst')
 
     parser.add_argument(
         '--settlement', dest='settlement_field',
@@ -299,80 +709,275 @@ def parse_args(argv, version):
         '--no-progress', dest='progress', default=True, action='store_false',
         help='show progress during processing (default: %(default)s)')
 
+    add_matcher_arguments(parser)
+
     parser.add_argument(
-        '--extramatches', default=0, action='count',
-        help='''output multiple matches, implies --keep-ambiguous''')
+        '--batch-size', type=positive_int, default=BATCH_SIZE,
+        help="""Number of input rows to search for at once.
+        Bigger batches are faster, but need more memory.
+        (default: %(default)s)""")
 
     parser.add_argument(
-        '--drop-ambiguous', dest='differentiating_ambiguity', default=0.001, type=float,
-        help='''report no match for matches where the score difference of the first
-        two matches are less than this value
-        (default: %(default)s)''')
+        '--stats', default=False, action='store_true',
+        help="""Time the stages of matching (reading, normalization, scoring, ...),
+        and print the times at the end""")
 
     parser.add_argument(
-        '--keep-ambiguous', dest='differentiating_ambiguity', const=-1,
-        action='store_const',
-        help='''keep all first matches - even potentially bad ones
-        (see --drop-ambiguous)''')
+        '--slow-log', metavar='FILE',
+        help="""Save the queries taking at least --slow-threshold to search
+        with the amount of work they needed as CSV to FILE, the slowest first""")
 
-    def non_negative_float(value):
-        value = float(value)
-        if value < 0:
-            raise argparse.ArgumentTypeError(f"expecting non-negative float, got {value}")
-        return value
+    parser.add_argument(
+        '--slow-threshold', metavar='MS', default=100.0, type=non_negative_float,
+        help="""Searches taking at least this many milliseconds are slow (default: %(default)s)""")
 
     parser.add_argument(
-        '--idf-shift', type=non_negative_float, default=10.0,
-        help="""Shift frequency count by this number. This is an important parameter, influences score!
-        If this value is small (<10), typos in text to find have great effect,
-        potentially resulting in a bad match, that has the same rare character combination as the typo.
-        However, if this value is too big (>>100), rare words will have the same influence over the match as common ones
-        (e.g. siofoki = budapesti = magyar = nemzeti).
-        (default: %(default)s)"""
-    )
+        '--diagnostics', metavar='FILE',
+        help="""Count the work done for the queries (ngrams, postings, candidates, results)
+        and their outcomes (matched, or why not), and save the counts as JSON to FILE at the end""")
 
-    HUN_DEFAULT_STOP_WORDS = ('bt', 'rt', 'zrt', 'nyrt', 'kft')
+    parser.add_argument(
+        '--profile', metavar='FILE',
+        help="""Profile the run with cProfile and save the stats to FILE (see the pstats module).
+        Only this process is profiled, not the --jobs workers.""")
 
     parser.add_argument(
-        '-x', '--stop-word', dest='stop_words', metavar='STOP-WORD',
-        action='append',
-        default=list(HUN_DEFAULT_STOP_WORDS),
-        help="""Exclude matches for queries that contain these words (default: %(default)s)""")
+        '-V', '--version', action='version',
+        version='%(prog)s {}'.format(version),
+        help='Show version info')
 
-    class SetHunDefault(argparse.Action):
-        def __call__(self, parser, namespace, values, option_string):
-            setattr(namespace, self.dest, list(HUN_DEFAULT_STOP_WORDS))
+    args = parser.parse_args(argv)
+    return args
+
+
+def parse_build_index_args(argv, version):
+    parser = argparse.ArgumentParser(
+        prog='build-index',
+        description='''
+            Build the index from the PIR database and save it as a snapshot.
+            The snapshot can be used in place of PIR_INDEX_JSON
+            and it loads much faster.''')
 
     parser.add_argument(
-        '--hun-stop-words', dest='stop_words',
-        action=SetHunDefault,
-        nargs=0,
-        help=f"""Exclude matches for these words: {', '.join(HUN_DEFAULT_STOP_WORDS)}""")
+        'pir_index',
+        metavar='PIR_INDEX_JSON',
+        help='json file containing the pre-processed PIR database (see pir-index bead)')
 
-    class ClearArg(argparse.Action):
-        def __call__(self, parser, namespace, values, option_string):
-            setattr(namespace, self.dest, [])
+    parser.add_argument(
+        'snapshot',
+        metavar='SNAPSHOT',
+        help='output index snapshot file')
 
     parser.add_argument(
-        '--clear-stop-words', dest='stop_words', action=ClearArg,
-        nargs=0,
-        help="Make the stop-word list empty"
-    )
+        '-V', '--version', action='version',
+        version='%(prog)s {}'.format(version),
+        help='Show version info')
+
+    return parser.parse_args(argv)
+
+
+def build_index(argv, version):
+    args = parse_build_index_args(argv, version)
+    print(f"Building index {args.pir_index}")
+    # parse and idf_shift are query time parameters, they are not saved
+    index = Index(load_pir_to_details(path=args.pir_index), parse=None, fingerprint=file_fingerprint(args.pir_index))
+    print(f"Writing snapshot {args.snapshot}")
+    index.save(args.snapshot)
+
+
+def parse_update_index_args(argv, version):
+    parser = argparse.ArgumentParser(
+        prog='update-index',
+        description='''
+            Apply changes of the PIR database to an index, without rebuilding it,
+            and save the result as a snapshot.''')
+
+    parser.add_argument(
+        'pir_index',
+        metavar='PIR_INDEX_JSON',
+        help='''json file containing the pre-processed PIR database (see pir-index bead),
+        or an index snapshot made by the build-index or update-index command''')
+
+    parser.add_argument(
+        'delta',
+        metavar='DELTA_JSON',
+        help='''json file of the new and changed PIRs, in the same format as PIR_INDEX_JSON.
+        PIRs with null details are removed.''')
+
+    parser.add_argument(
+        'snapshot',
+        metavar='SNAPSHOT',
+        help='output index snapshot file')
 
     parser.add_argument(
         '-V', '--version', action='version',
         version='%(prog)s {}'.format(version),
         help='Show version info')
 
-    args = parser.parse_args(argv)
-    return args
+    return parser.parse_args(argv)
+
+
+def update_index(argv, version):
+    args = parse_update_index_args(argv, version)
+    print(f"Loading index {args.pir_index}")
+    index = load_index(args.pir_index, parse=None)
+    delta = load_pir_delta(args.delta)
+    print(f"Applying {len(delta)} changes from {args.delta}")
+    index = index.apply_delta(delta, fingerprint=combined_fingerprint(index.fingerprint, file_fingerprint(args.delta)))
+    print(f"Writing snapshot {args.snapshot}")
+    index.save(args.snapshot)
+
+
+def parse_serve_args(argv, version):
+    parser = argparse.ArgumentParser(
+        prog='serve',
+        description='''
+            Load the index once and answer match requests over HTTP/JSON
+            (see the server module for the requests).''')
+
+    parser.add_argument(
+        'pir_index',
+        metavar='PIR_INDEX_JSON',
+        help='''json file containing the pre-processed PIR database (see pir-index bead),
+        or an index snapshot made by the build-index command''')
+
+    parser.add_argument(
+        '--host', default='127.0.0.1',
+        help='address to listen on (default: %(default)s)')
+
+    parser.add_argument(
+        '--port', type=positive_int, default=8080,
+        help='port to listen on (default: %(default)s)')
+
+    parser.add_argument(
+        '--unix-socket', metavar='PATH',
+        help='listen on this Unix socket instead of host:port')
+
+    add_matcher_arguments(parser)
+
+    parser.add_argument(
+        '-V', '--version', action='version',
+        version='%(prog)s {}'.format(version),
+        help='Show version info')
+
+    return parser.parse_args(argv)
+
+
+def serve(argv, version):
+    args = parse_serve_args(argv, version)
+    parser = OrgNameParser()
+    parser.read_csv('data/settlements.csv', report_conflicts=False)
+    # matches are not written to a table, there are no output fields
+    matcher = OrgNameMatcher(
+        InputFields(*server.QUERY_FIELDS), None, parser.parse, **matcher_kwargs(args))
+    print(f"Loading index {args.pir_index}")
+    matcher.load_index(args.pir_index)
+    if matcher.match_store_path:
+        matcher.open_match_store()
+    server.MatchServer(matcher).serve_forever(args.host, args.port, args.unix_socket)
+
+
+def parse_stream_args(argv, version):
+    parser = argparse.ArgumentParser(
+        prog='stream',
+        description='''
+            Read queries from the standard input line by line,
+            and write a result line for each to the standard output as soon as it is found
+            (see the stream module for the formats).''')
+
+    parser.add_argument(
+        'pir_index',
+        metavar='PIR_INDEX_JSON',
+        help='''json file containing the pre-processed PIR database (see pir-index bead),
+        or an index snapshot made by the build-index command''')
+
+    parser.add_argument(
+        '--format', choices=sorted(stream.FORMATS), default='jsonl',
+        help='input and output line format (default: %(default)s)')
+
+    parser.add_argument(
+        '--batch-size', type=positive_int, default=1,
+        help="""Maximum number of input lines to search for at once (default: %(default)s)""")
+
+    parser.add_argument(
+        '--max-delay', type=non_negative_float, default=0.0,
+        help="""Seconds to wait for more input lines to fill a batch.
+        0: search for the lines already available (default: %(default)s)""")
+
+    add_matcher_arguments(parser, jobs=False)
+
+    parser.add_argument(
+        '-V', '--version', action='version',
+        version='%(prog)s {}'.format(version),
+        help='Show version info')
+
+    return parser.parse_args(argv)
+
+
+def stream_matches(argv, version):
+    args = parse_stream_args(argv, version)
+    input = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', errors='strict')
+    output = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', newline='\n')
+    # standard output is for the results only
+    with contextlib.redirect_stdout(sys.stderr):
+        parser = OrgNameParser()
+        parser.read_csv('data/settlements.csv', report_conflicts=False)
+        matcher = OrgNameMatcher(
+            InputFields(*server.QUERY_FIELDS), None, parser.parse, **matcher_kwargs(args))
+        print(f"Loading index {args.pir_index}")
+        matcher.load_index(args.pir_index)
+        if matcher.match_store_path:
+            matcher.open_match_store()
+        stream.run(matcher, input, output, args.format, args.batch_size, args.max_delay)
+
+
+COMMANDS = {
+    'build-index': build_index,
+    'update-index': update_index,
+    'serve': serve,
+    'stream': stream_matches,
+}
 
 
 def main(argv, version):
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:], version)
+
     args = parse_args(argv, version)
+    if args.stats:
+        stats.enable()
+    if args.diagnostics:
+        diagnostics.enable()
+    # the latency percentiles are printed at the end, the slow queries are kept only for the slow query log
+    latency.enable(slow_threshold=args.slow_threshold / 1000 if args.slow_log else None)
+    profile = None
+    if args.profile:
+        profile = cProfile.Profile()
+        profile.enable()
+    try:
+        find_all_matches(args)
+    finally:
+        if profile:
+            profile.disable()
+            profile.dump_stats(args.profile)
+            print(f"Profile saved to {args.profile}")
+        if args.stats:
+            print(stats.report())
+            stats.disable()
+        if args.diagnostics:
+            diagnostics.write(args.diagnostics)
+            print(f"Diagnostics saved to {args.diagnostics}")
+            diagnostics.disable()
+        if args.slow_log:
+            latency.write_slow_log(args.slow_log)
+            print(f"Slow queries saved to {args.slow_log}")
+        latency.disable()
+
+
+def find_all_matches(args):
     input_fields = InputFields.from_args(args)
     output_fields = OutputFields.from_args(args)
-    input = petl.fromcsv(args.input_csv, encoding='utf-8', errors='strict')
+    input = csvio.fromcsv(args.input_csv, encoding='utf-8', errors='strict')
     parser = OrgNameParser()
     parser.read_csv('data/settlements.csv', report_conflicts=False)
 
@@ -380,15 +985,13 @@ def main(argv, version):
         input, input_fields, output_fields,
         index_data=args.pir_index,
         parse=parser.parse,
-        extramatches=args.extramatches,
-        differentiating_ambiguity=args.differentiating_ambiguity,
-        idf_shift=args.idf_shift,
-        stop_words=args.stop_words)
+        batch_size=args.batch_size,
+        **matcher_kwargs(args))
 
     if args.progress:
         matches = matches.progress()
 
-    matches.tocsv(args.output_csv, encoding='utf-8')
+    csvio.tocsv(matches, args.output_csv, encoding='utf-8')
 
 
 if __name__ == '__main__':
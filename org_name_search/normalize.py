@@ -1,5 +1,8 @@
 # coding: utf-8
 
+import collections
+
+
 TRANSLATE_TABLE = dict(
     [(ord(c), ' ') for c in u'''"'-.;[]()/'''] +
     [(ord(','), ' és ')])
@@ -14,3 +17,24 @@ HUN_ACCENT_MAP = dict(list(zip(map(ord, 'íóőűú'), 'ioöüu')))
 
 def simplify_accents(text):
     return text.translate(HUN_ACCENT_MAP)
+
+
+# normalize and simplify_accents in one go
+TOKENIZE_TABLE = {**TRANSLATE_TABLE, **HUN_ACCENT_MAP}
+
+Tokens = collections.namedtuple('Tokens', 'words has_stop_word')
+
+
+def tokenize(text, stop_words=frozenset()):
+    '''
+    Process text for matching in one pass.
+
+    -> Tokens:
+        words:          words of the normalized text with simplified accents,
+                        the same as `simplify_accents(normalize(text)).split()`
+        has_stop_word:  one of stop_words (lower case words) is in text,
+                        as a word separated by white space or '.'
+    '''
+    lowered = text.lower()
+    has_stop_word = bool(stop_words) and not stop_words.isdisjoint(lowered.replace('.', ' ').split())
+    return Tokens(lowered.translate(TOKENIZE_TABLE).split(), has_stop_word)
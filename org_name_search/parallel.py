@@ -0,0 +1,94 @@
+# coding: utf-8
+'''
+Run a function over a stream of tasks in forked worker processes
+
+The workers are forked when the pool is started, so they inherit
+all the state of the parent (e.g. a loaded index) copy-on-write,
+only the tasks and their results are sent between the processes.
+'''
+
+import collections
+import multiprocessing
+
+from . import collectors
+
+
+# the function the workers run, set in the parent just before forking
+_worker_function = None
+
+
+def _run_task(task):
+    # the measurements of the worker (see collectors) are sent back with the result
+    return _worker_function(*task), collectors.take_all()
+
+
+def _result(async_result):
+    result, measurements = async_result.get()
+    collectors.merge_all(measurements)
+    return result
+
+
+def _init_worker():
+    # workers drop the measurements inherited from the parent
+    collectors.take_all()
+
+
+def _start_pool(jobs):
+    return multiprocessing.get_context('fork').Pool(jobs, initializer=_init_worker)
+
+
+def can_fork():
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def imap_ordered(function, tasks, jobs):
+    '''
+    Like map(lambda task: function(*task), tasks), but in `jobs` worker processes.
+
+    Results are produced in the order of tasks, at most 2 * jobs tasks are in flight,
+    so that tasks are read from the (potentially long) stream only as needed.
+    '''
+    global _worker_function
+
+    assert jobs > 1
+    _worker_function = function
+    pool = _start_pool(jobs)
+    try:
+        pending = collections.deque()
+        for task in tasks:
+            pending.append(pool.apply_async(_run_task, (task,)))
+            if len(pending) >= 2 * jobs:
+                yield _result(pending.popleft())
+        while pending:
+            yield _result(pending.popleft())
+    finally:
+        pool.terminate()
+        pool.join()
+        _worker_function = None
+
+
+class WorkerPool:
+    '''
+    Forked worker processes running `function`, for tasks coming one by one.
+    '''
+
+    def __init__(self, function, jobs):
+        global _worker_function
+
+        assert jobs > 1
+        # kept set while the pool is running: the pool replaces exited workers by forking again
+        _worker_function = function
+        self.pool = _start_pool(jobs)
+
+    def apply(self, *task):
+        '''
+        -> function(*task), run in a worker process
+        '''
+        return _result(self.pool.apply_async(_run_task, (task,)))
+
+    def close(self):
+        global _worker_function
+
+        self.pool.terminate()
+        self.pool.join()
+        _worker_function = None
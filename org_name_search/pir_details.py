@@ -26,26 +26,40 @@ class PirDetails:
         return not (born_later or died_earlier)
 
 
+def make_pir_details(details_dict):
+    d = dict(details_dict)
+    def todate(d, key):
+        if d[key]:
+            d[key] = date_from_isodate(d[key])
+    todate(d, 'start_date')
+    todate(d, 'end_date')
+    def convert(d, key, type):
+        d[key] = type(d[key])
+    convert(d, 'pir', int)
+    convert(d, 'settlements', set)
+    convert(d, 'names', set)
+    return PirDetails(**d)
+
+
 def load_pir_to_details(path):
     with open(path) as f:
         raw_pir_to_details = json.load(f)
 
-    def make_pir_details(details_dict):
-        d = dict(details_dict)
-        def todate(d, key):
-            if d[key]:
-                d[key] = date_from_isodate(d[key])
-        todate(d, 'start_date')
-        todate(d, 'end_date')
-        def convert(d, key, type):
-            d[key] = type(d[key])
-        convert(d, 'pir', int)
-        convert(d, 'settlements', set)
-        convert(d, 'names', set)
-        return PirDetails(**d)
-
     pir_to_details = {
         int(k): make_pir_details(v)
         for k, v in raw_pir_to_details.items()}
 
     return pir_to_details
+
+
+def load_pir_delta(path):
+    """
+    Changes to the PIR database, in the same format as the full database,
+    except that PIRs to remove have null details.
+    """
+    with open(path) as f:
+        raw_delta = json.load(f)
+
+    return {
+        int(k): None if v is None else make_pir_details(v)
+        for k, v in raw_delta.items()}
@@ -1,6 +1,7 @@
 # coding: utf-8
 # FIXME: rename to tagre
 
+import bisect
 import re
 
 
@@ -67,44 +68,37 @@ def no_log(*args):
     pass
 
 
-class _SequentialWordDropper:
-
-    def __init__(self, text):
-        self._words = WORD.finditer(text)
-        self._unprocessed = None
-        self._non_dropped = []
-
-    def words(self):
-        if self._unprocessed is not None:
-            yield self._unprocessed
-            self._unprocessed = None
-        for word in self._words:
-            yield word
-
-    def keep_until(self, char_index, log=no_log):
-        log('keep_until', char_index)
-        for word in self.words():
-            log('keep_until', word.span)
-            if word.end < char_index:
-                self._non_dropped.append(word)
-            else:
-                self._unprocessed = word
-                return
-
-    def drop_until(self, char_index, log=no_log):
-        log('drop_until', char_index)
-        for word in self.words():
-            log('drop_until', word.span)
-            if word.start >= char_index:
-                self._unprocessed = word
-                return
-
-    def keep_rest(self):
-        self._non_dropped.extend(self.words())
+def _drop_matched_words(text, spans, log=no_log):
+    '''
+    -> words of text not touched by the matched spans, separated by one space
 
-    @property
-    def non_dropped(self):
-        return ' '.join(w.span for w in self._non_dropped)
+        spans: (start, end) of the matches, in increasing order
+
+    Before a match the words ending before its start are kept,
+    then the words starting before its end are dropped.
+    The text is tokenized once, the kept and dropped words are found by bisection.
+    '''
+    if not spans:
+        return ' '.join(_WORD_REGEX.findall(text))
+    words = []
+    starts = []
+    ends = []
+    for word in _WORD_REGEX.finditer(text):
+        words.append(word.group())
+        start, end = word.span()
+        starts.append(start)
+        ends.append(end)
+    kept = []
+    position = 0
+    for start, end in spans:
+        keep_end = bisect.bisect_left(ends, start, position)
+        drop_end = bisect.bisect_left(starts, end, keep_end)
+        log('keep_until', start, words[position:keep_end])
+        log('drop_until', end, words[keep_end:drop_end])
+        kept.extend(words[position:keep_end])
+        position = drop_end
+    kept.extend(words[position:])
+    return ' '.join(kept)
 
 
 def find_keywords(pattern, text, log=no_log):
@@ -112,15 +106,74 @@ def find_keywords(pattern, text, log=no_log):
 
     Returns keywords and remaining text.
     '''
-    swd = _SequentialWordDropper(text)
     keywords = set()
+    spans = []
     for match in pattern.finditer(text):
         keywords.update(match.keys)
-        swd.keep_until(match.start, log)
-        swd.drop_until(match.end, log)
-    swd.keep_rest()
+        spans.append((match.start, match.end))
+
+    return keywords, _drop_matched_words(text, spans, log)
+
+
+def find_keywords_many(pattern, texts):
+    '''
+    -> [find_keywords(pattern, text) for text in texts]
+    '''
+    return [find_keywords(pattern, text) for text in texts]
+
+
+def _has_single_group(pattern):
+    '''
+    -> True if pattern has at most one capturing group
+    '''
+    try:
+        return re.compile(pattern, flags=re.UNICODE).groups <= 1
+    except re.error:
+        # e.g. refers to a group of another alternative
+        return False
+
 
-    return keywords, swd.non_dropped
+class Tagger:
+    '''
+    find_keywords for `any_of(*alternatives)`, compiled once.
+
+    When each alternative has at most one capturing group (e.g. made by `group` or `separated_group`),
+    a match has at most one matched group: its keyword is looked up directly as the last matched group,
+    otherwise all the groups of the match are checked, as with Match.keys.
+    '''
+
+    def __init__(self, alternatives):
+        self.alternatives = tuple(alternatives)
+        self.regex = re.compile(any_of(*self.alternatives), flags=re.UNICODE)
+        self.single_group = all(_has_single_group(alternative) for alternative in self.alternatives)
+
+    def keys(self, re_match):
+        '''
+        -> names of the groups that matched (see Match.keys)
+        '''
+        if self.single_group:
+            key = re_match.lastgroup
+            return (key,) if key is not None else ()
+        return tuple(key for key, value in re_match.groupdict().items() if value is not None)
+
+    def find_keywords(self, text, log=no_log):
+        '''
+        Same as find_keywords(RE(any_of(*alternatives)), text, log).
+        '''
+        keywords = set()
+        spans = []
+        for re_match in self.regex.finditer(text):
+            keywords.update(self.keys(re_match))
+            spans.append(re_match.span())
+
+        return keywords, _drop_matched_words(text, spans, log)
+
+    def find_keywords_many(self, texts):
+        '''
+        -> [self.find_keywords(text) for text in texts]
+        '''
+        find_keywords = self.find_keywords
+        return [find_keywords(text) for text in texts]
 
 
 escape = re.escape
@@ -145,6 +198,7 @@ def zero_or_more(pattern, wrap=protect):
 WORD_START = WORD_END = r'\b'
 WORD_CHAR = RE(r'\w')
 WORD = one_or_more(WORD_CHAR, raw)
+_WORD_REGEX = re.compile(WORD, flags=re.UNICODE)
 WORD_PREFIX = zero_or_more(WORD_CHAR, raw)
 WORD_SUFFIX = zero_or_more(WORD_CHAR, raw)
 SPACE = RE(r'\s')
@@ -0,0 +1,375 @@
+# coding: utf-8
+'''
+Scoring engines for NGramIndex
+
+An engine sums the tfidf weights of the query ngrams for every row (PIR)
+in their postings and selects the rows with the top scores.
+
+NumPy is optional: the zipped application contains only pure Python code,
+so the plain Python engine is used when NumPy is not available.
+
+The engines record the number of scored rows ('candidates before cut')
+and of the rows scoring above min_score ('candidates after cut') in diagnostics.
+With pruning only the rows in the postings of the rare ngrams are scored.
+'''
+
+import bisect
+import heapq
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from . import diagnostics
+
+
+# relative safety margin for the score upper bounds: they are summed in a different order than the scores
+_BOUND_MARGIN = 1e-9
+
+
+def admitting_terms(terms, min_score, posting_counts):
+    '''
+    Select the terms, whose postings contain all the rows that can score above min_score.
+
+    Going from the rarest (highest tfidf) term to the most common one,
+    a row that is not in the postings of the terms seen so far
+    can score at most the sum of the remaining tfidf values.
+    Once that is not more than min_score, the rest of the terms can not admit new candidates.
+
+        posting_counts: number of postings for each term
+
+    -> indexes of the admitting terms, rarest first;
+       None if pruning is not worth it (the admitting terms have most of the postings)
+    '''
+    by_rarity = sorted(range(len(terms)), key=lambda i: terms[i][1], reverse=True)
+    remaining = [0.0] * (len(terms) + 1)
+    for j in reversed(range(len(terms))):
+        remaining[j] = remaining[j + 1] + terms[by_rarity[j]][1]
+    for j in range(len(terms)):
+        if remaining[j] * (1 + _BOUND_MARGIN) <= min_score:
+            admitting = by_rarity[:j]
+            admitted_postings = sum(posting_counts[i] for i in admitting)
+            if admitted_postings * 2 < sum(posting_counts):
+                return admitting
+            return None
+    return None
+
+
+class PythonScorer:
+
+    def __init__(self, index, prune=True):
+        '''
+            prune: generate candidates only from the rare terms (see `admitting_terms`),
+                   and score only them - the results are the same as without pruning
+        '''
+        self.index = index
+        self.prune = prune
+
+    def validity_mask(self, day):
+        '''
+        -> mask of the rows valid at day (a date ordinal)
+        '''
+        index = self.index
+        return bytearray(start <= day <= end for start, end in zip(index.start_days, index.end_days))
+
+    def _scores(self, terms, valid):
+        row_score = {}
+        postings_of = self.index.postings_of
+        for ngram_id, tfidf in terms:
+            if valid is None:
+                for row in postings_of(ngram_id):
+                    row_score[row] = row_score.get(row, 0.0) + tfidf
+            else:
+                for row in postings_of(ngram_id):
+                    if valid[row]:
+                        row_score[row] = row_score.get(row, 0.0) + tfidf
+        return row_score
+
+    def _pruned_scores(self, terms, min_score, valid):
+        postings_of = self.index.postings_of
+        term_postings = [postings_of(ngram_id) for ngram_id, _tfidf in terms]
+        admitting = admitting_terms(terms, min_score, [len(postings) for postings in term_postings])
+        if admitting is None:
+            return self._scores(terms, valid)
+
+        candidates = set()
+        for i in admitting:
+            candidates.update(term_postings[i])
+        if valid is not None:
+            candidates = {row for row in candidates if valid[row]}
+        admitting = set(admitting)
+
+        # scores are summed in the order of terms, the same way as in _scores
+        row_score = dict.fromkeys(candidates, 0.0)
+        lookup_cost = len(row_score) * max(1, len(row_score).bit_length())
+        for i, (ngram_id, tfidf) in enumerate(terms):
+            postings = term_postings[i]
+            if i in admitting and valid is None:
+                for row in postings:
+                    row_score[row] += tfidf
+            elif lookup_cost < len(postings):
+                # few candidates, long postings: binary search the candidates in the (sorted) postings
+                for row in row_score:
+                    position = bisect.bisect_left(postings, row)
+                    if position < len(postings) and postings[position] == row:
+                        row_score[row] += tfidf
+            else:
+                for row in postings:
+                    if row in row_score:
+                        row_score[row] += tfidf
+        return row_score
+
+    def top_candidates(self, terms, min_score, max_results, valid=None):
+        '''
+            terms:      [(ngram_id, tfidf)] in the order the tfidf values are to be summed
+            min_score:  rows scoring at most this are dropped
+            valid:      mask of rows (see validity_mask), when given invalid rows are not scored
+
+        -> [(row, score)] rows having one of the best `max_results` distinct scores,
+           in increasing row order
+        '''
+        if self.prune:
+            row_score = self._pruned_scores(terms, min_score, valid)
+        else:
+            row_score = self._scores(terms, valid)
+
+        candidates = [(row, score) for row, score in row_score.items() if score > min_score]
+        diagnostics.observe('candidates before cut', len(row_score))
+        diagnostics.observe('candidates after cut', len(candidates))
+
+        top_scores = heapq.nlargest(max_results, set(score for _row, score in candidates))
+        if not top_scores:
+            return []
+        min_score = top_scores[-1]
+        return sorted((row, score) for row, score in candidates if score >= min_score)
+
+    def top_candidates_many(self, tasks, max_results, seconds=None):
+        '''
+            tasks:    [(terms, min_score, valid)]
+            seconds:  when given, the time spent on each task is appended to this list
+
+        -> [top_candidates(terms, min_score, max_results, valid) for each task]
+        '''
+        results = []
+        for terms, min_score, valid in tasks:
+            start = time.perf_counter()
+            results.append(self.top_candidates(terms, min_score, max_results, valid))
+            if seconds is not None:
+                seconds.append(time.perf_counter() - start)
+        return results
+
+
+class NumpyScorer:
+
+    def __init__(self, index, prune=True):
+        '''
+            prune: see PythonScorer, applies to single queries
+        '''
+        self.index = index
+        self.prune = prune
+        self.n_rows = len(index.pirs)
+        self.postings = numpy.frombuffer(index.postings, dtype=numpy.intc)
+        self.offsets = numpy.frombuffer(index.offsets, dtype=numpy.int64)
+        self.start_days = numpy.frombuffer(index.start_days, dtype=numpy.intc)
+        self.end_days = numpy.frombuffer(index.end_days, dtype=numpy.intc)
+
+    def validity_mask(self, day):
+        return (self.start_days <= day) & (day <= self.end_days)
+
+    def top_candidates(self, terms, min_score, max_results, valid=None):
+        '''
+        Same as PythonScorer.top_candidates, but the scores are accumulated
+        in a dense score vector, a whole posting list at a time.
+        '''
+        if not terms:
+            diagnostics.observe('candidates before cut', 0)
+            diagnostics.observe('candidates after cut', 0)
+            return []
+        admitting = self._admitting_terms(terms, min_score)
+        if admitting is not None:
+            return self._top_pruned(terms, admitting, min_score, max_results, valid)
+
+        ngram_ids = numpy.fromiter((ngram_id for ngram_id, _ in terms), dtype=numpy.int64, count=len(terms))
+        tfidfs = numpy.fromiter((tfidf for _, tfidf in terms), dtype=numpy.float64, count=len(terms))
+
+        starts = self.offsets[ngram_ids]
+        ends = self.offsets[ngram_ids + 1]
+        rows = numpy.concatenate([self.postings[start:end] for start, end in zip(starts, ends)])
+        weights = numpy.repeat(tfidfs, ends - starts)
+        if valid is not None:
+            # invalid rows are not scored
+            keep = valid[rows]
+            rows = rows[keep]
+            weights = weights[keep]
+        # bincount adds the weights in input order, so the sums are the same as with PythonScorer
+        scores = numpy.bincount(rows, weights=weights, minlength=self.n_rows)
+
+        candidates = numpy.flatnonzero(scores > min_score)
+        if diagnostics.enabled():
+            diagnostics.observe('candidates before cut', int(numpy.count_nonzero(scores > 0)))
+            diagnostics.observe('candidates after cut', len(candidates))
+        return self._top(candidates, scores[candidates], max_results)
+
+    def _admitting_terms(self, terms, min_score):
+        '''
+        -> admitting_terms for pruning, None if the query is to be scored without pruning
+        '''
+        if not self.prune or not terms:
+            return None
+        posting_counts = [self.offsets[ngram_id + 1] - self.offsets[ngram_id] for ngram_id, _tfidf in terms]
+        return admitting_terms(terms, min_score, posting_counts)
+
+    def _postings_of(self, ngram_id):
+        return self.postings[self.offsets[ngram_id]:self.offsets[ngram_id + 1]]
+
+    def _top_pruned(self, terms, admitting, min_score, max_results, valid):
+        admitted = numpy.zeros(self.n_rows, dtype=bool)
+        for i in admitting:
+            admitted[self._postings_of(terms[i][0])] = True
+        if valid is not None:
+            admitted &= valid
+        candidates = numpy.flatnonzero(admitted)
+        admitting = set(admitting)
+
+        # scores are summed in the order of terms, the same way as with bincount
+        scores = numpy.zeros(len(candidates), dtype=numpy.float64)
+        candidate_position = None
+        lookup_cost = len(candidates) * max(1, len(candidates).bit_length())
+        for i, (ngram_id, tfidf) in enumerate(terms):
+            postings = self._postings_of(ngram_id)
+            if i not in admitting and lookup_cost < len(postings):
+                # few candidates, long postings: binary search the candidates in the (sorted) postings
+                found = numpy.searchsorted(postings, candidates)
+                found[found == len(postings)] = 0
+                scores[postings[found] == candidates] += tfidf
+            else:
+                if candidate_position is None:
+                    candidate_position = numpy.full(self.n_rows, -1, dtype=numpy.int64)
+                    candidate_position[candidates] = numpy.arange(len(candidates))
+                positions = candidate_position[postings]
+                scores[positions[positions >= 0]] += tfidf
+
+        above_min = scores > min_score
+        diagnostics.observe('candidates before cut', len(candidates))
+        diagnostics.observe('candidates after cut', int(numpy.count_nonzero(above_min)))
+        return self._top(candidates[above_min], scores[above_min], max_results)
+
+    def top_candidates_many(self, tasks, max_results, seconds=None):
+        '''
+        Same as PythonScorer.top_candidates_many.
+
+        The tasks that can be pruned are scored one by one: scoring only the candidates
+        of the rare ngrams is much cheaper than scoring all the postings.
+        The scores of the rest are computed together, as a sparse
+        (task x ngram) by (ngram x row) matrix product,
+        the time of the product is divided evenly among its tasks.
+        '''
+        results = [None] * len(tasks)
+        task_seconds = [0.0] * len(tasks)
+        unpruned = []
+        for i, (terms, min_score, valid) in enumerate(tasks):
+            start = time.perf_counter()
+            admitting = self._admitting_terms(terms, min_score)
+            if admitting is None:
+                unpruned.append(i)
+            else:
+                results[i] = self._top_pruned(terms, admitting, min_score, max_results, valid)
+            task_seconds[i] = time.perf_counter() - start
+        if unpruned:
+            start = time.perf_counter()
+            for i, candidates in zip(unpruned, self._top_product([tasks[i] for i in unpruned], max_results)):
+                results[i] = candidates
+            share = (time.perf_counter() - start) / len(unpruned)
+            for i in unpruned:
+                task_seconds[i] += share
+        if seconds is not None:
+            seconds.extend(task_seconds)
+        return results
+
+    def _top_product(self, tasks, max_results):
+        '''
+        -> [top_candidates(terms, min_score, max_results, valid) for each task], without pruning
+        '''
+        task_rows = []
+        task_weights = []
+        for task_id, (terms, _min_score, valid) in enumerate(tasks):
+            for ngram_id, tfidf in terms:
+                rows = self._postings_of(ngram_id)
+                if valid is not None:
+                    rows = rows[valid[rows]]
+                # (task, row) cells of the product
+                # the cell ids overflow 32 bits with a few thousand tasks on a large index
+                task_rows.append(rows.astype(numpy.int64) + task_id * self.n_rows)
+                task_weights.append(numpy.full(len(rows), tfidf))
+        if not task_rows:
+            for _task in tasks:
+                diagnostics.observe('candidates before cut', 0)
+                diagnostics.observe('candidates after cut', 0)
+            return [[] for _ in tasks]
+
+        # cells get sorted by task, then row
+        cells, cell_index = numpy.unique(numpy.concatenate(task_rows), return_inverse=True)
+        # bincount adds the weights in input order, so the sums are the same as with PythonScorer
+        scores = numpy.bincount(cell_index.ravel(), weights=numpy.concatenate(task_weights))
+        cell_tasks, cell_rows = numpy.divmod(cells, self.n_rows)
+
+        min_scores = numpy.array([min_score for _terms, min_score, _valid in tasks], dtype=numpy.float64)
+        above_min = scores > min_scores[cell_tasks]
+        if diagnostics.enabled():
+            scored_counts = numpy.bincount(cell_tasks, minlength=len(tasks)).tolist()
+            candidate_counts = numpy.bincount(cell_tasks[above_min], minlength=len(tasks)).tolist()
+            for scored, candidates in zip(scored_counts, candidate_counts):
+                diagnostics.observe('candidates before cut', scored)
+                diagnostics.observe('candidates after cut', candidates)
+        scores = scores[above_min]
+        cell_tasks = cell_tasks[above_min]
+        cell_rows = cell_rows[above_min]
+
+        bounds = numpy.searchsorted(cell_tasks, numpy.arange(len(tasks) + 1))
+        return [
+            self._top(cell_rows[start:end], scores[start:end], max_results)
+            for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist())]
+
+    def _top(self, candidates, candidate_scores, max_results):
+        '''
+        -> [(row, score)] for the candidates having one of the best `max_results` distinct scores
+
+            candidates: rows in increasing order
+        '''
+        if not len(candidates):
+            return []
+
+        selected = candidate_scores >= _min_top_score(candidate_scores, max_results)
+        return list(zip(candidates[selected].tolist(), candidate_scores[selected].tolist()))
+
+
+def _min_top_score(scores, k):
+    '''
+    -> the k-th largest distinct value in scores (the smallest one, if there are less)
+    '''
+    size = len(scores)
+    if size <= k:
+        return scores.min()
+    if size <= 4 * k:
+        # sorting a few values is cheaper than partitioning them repeatedly
+        distinct_scores = numpy.unique(scores)
+        return distinct_scores[max(0, len(distinct_scores) - k)]
+    width = k
+    while True:
+        # the `width` largest values, duplicates included:
+        # they have all the distinct values not less than the smallest of them
+        top_scores = numpy.unique(numpy.partition(scores, size - width)[size - width:])
+        if len(top_scores) >= k:
+            return top_scores[len(top_scores) - k]
+        if width == size:
+            return top_scores[0]
+        # there are ties among the largest values, the k-th distinct value is further down
+        width = min(size, 4 * width)
+
+
+def make_scorer(index):
+    if numpy is not None:
+        return NumpyScorer(index)
+    return PythonScorer(index)
@@ -0,0 +1,237 @@
+# coding: utf-8
+'''
+Matching service answering HTTP/JSON requests with a loaded (warm) index
+
+Connections are handled by asyncio, the CPU bound search runs in worker
+processes (or in a thread, with a single job), so the service keeps
+accepting requests while searching.
+
+Requests:
+
+    POST /match     {"name": NAME, "settlement": SETTLEMENT, "date": DATE}
+                    -> {"matches": [MATCH, ...]}
+
+                    the body can be a list of queries, too, the response is then
+                    a list of {"matches": [...]} in the same order.
+                    settlement and date are optional, date is in one of YYYY, YYYY-MM-DD or YYYYMMDD formats.
+
+    GET /stats      -> {"requests": COUNT, "p50_ms": P50, "p99_ms": P99}
+
+where MATCH is {"pir", "tax_id", "score", "match_error", "name", "settlement"}.
+'''
+
+import asyncio
+import concurrent.futures
+import http
+import json
+import time
+import traceback
+
+from .index import NoResult
+from .latency import Latencies
+from . import parallel
+
+
+# OrgNameMatcher.input_fields must name these fields
+QUERY_FIELDS = ('name', 'settlement', 'date')
+
+# maximum size of a request body
+MAX_BODY_SIZE = 16 << 20
+
+
+class RequestError(Exception):
+    pass
+
+
+def latency_stats(latencies):
+    '''
+    -> /stats response of the request latencies (latency.Latencies)
+    '''
+    def ms(seconds):
+        return None if seconds is None else round(seconds * 1000, 3)
+    return {'requests': latencies.count, 'p50_ms': ms(latencies.percentile(50)), 'p99_ms': ms(latencies.percentile(99))}
+
+
+class MatchServer:
+
+    def __init__(self, matcher):
+        '''
+            matcher: OrgNameMatcher with its index loaded, having QUERY_FIELDS as input fields
+        '''
+        self.matcher = matcher
+        self.latencies = Latencies()
+        # _Matches being searched for -> future done when the search is finished
+        self.in_flight = {}
+        if matcher.jobs > 1:
+            self.pool = parallel.WorkerPool(matcher.search, matcher.jobs)
+            search = self.pool.apply
+        else:
+            self.pool = None
+            search = matcher.search
+        self.search = search
+        # threads waiting for the workers (or searching, with a single job)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=matcher.jobs)
+
+    def close(self):
+        self.executor.shutdown()
+        if self.pool:
+            self.pool.close()
+
+    async def start(self, host='127.0.0.1', port=8080, unix_socket=None):
+        '''
+        -> the started asyncio server
+        '''
+        if unix_socket:
+            return await asyncio.start_unix_server(self.handle_connection, path=unix_socket)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def serve_forever(self, host='127.0.0.1', port=8080, unix_socket=None):
+        loop = asyncio.get_event_loop()
+        server = loop.run_until_complete(self.start(host, port, unix_socket))
+        print(f"Serving on {unix_socket or '{}:{}'.format(host, port)}")
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            self.close()
+            print(f"Latency: {latency_stats(self.latencies)}")
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, path, version = request_line.decode('latin-1').split()
+                    length = int(headers.get('content-length', 0))
+                    if not 0 <= length <= MAX_BODY_SIZE:
+                        raise ValueError(length)
+                except ValueError:
+                    await self.send(writer, 'HTTP/1.1', 400, {'error': 'bad request'}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length)
+
+                status, response = await self.respond(method, path, body)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                await self.send(writer, version, status, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def send(self, writer, version, status, response, keep_alive):
+        body = json.dumps(response, ensure_ascii=False).encode('utf-8')
+        head = (
+            f'{version} {status} {http.HTTPStatus(status).phrase}\r\n'
+            'Content-Type: application/json; charset=utf-8\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n'
+            '\r\n')
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def respond(self, method, path, body):
+        '''
+        -> (HTTP status, JSON response)
+        '''
+        if path == '/stats':
+            if method != 'GET':
+                return 405, {'error': 'use GET'}
+            return 200, latency_stats(self.latencies)
+        if path != '/match':
+            return 404, {'error': f'unknown path {path}'}
+        if method != 'POST':
+            return 405, {'error': 'use POST'}
+
+        start = time.perf_counter()
+        try:
+            request = json.loads(body.decode('utf-8'))
+            queries = request if isinstance(request, list) else [request]
+            rows = [query_row(query) for query in queries]
+        except (ValueError, RequestError) as e:
+            return 400, {'error': str(e)}
+        try:
+            matches = await self.match(rows)
+        except Exception as e:
+            traceback.print_exc()
+            return 500, {'error': str(e)}
+        results = [{'matches': matches_json(self.matcher.slot_matches(row_matches))} for row_matches in matches]
+        self.latencies.add(time.perf_counter() - start)
+        return 200, results if isinstance(request, list) else results[0]
+
+    async def match(self, rows):
+        '''
+        -> the list of matches for each row of QUERY_FIELDS
+        '''
+        matcher = self.matcher
+        batch = matcher.prepare_batch(QUERY_FIELDS, rows)
+        done = asyncio.get_event_loop().create_future()
+        for matches in batch.searching:
+            self.in_flight[matches] = done
+        try:
+            found = []
+            if batch.to_search:
+                found = await asyncio.get_event_loop().run_in_executor(self.executor, self.search, batch.to_search)
+            matcher.complete_batch(batch, found)
+        except Exception:
+            # concurrent requests must not get the unfinished matches
+            for key in batch.search_keys:
+                matcher.query_cache.pop(key)
+            raise
+        finally:
+            for matches in batch.searching:
+                del self.in_flight[matches]
+            done.set_result(None)
+
+        # matches being searched for by concurrent requests
+        for matches in batch.rows:
+            if matches.matches is None and matches in self.in_flight:
+                await self.in_flight[matches]
+            if matches.matches is None:
+                raise RuntimeError('search for the same query in a concurrent request failed')
+        return [matches.matches for matches in batch.rows]
+
+
+def matches_json(matches):
+    '''
+    -> JSON representation of matches (see OrgNameMatcher.slot_matches)
+    '''
+    return [
+        {
+            'pir': match.details.pir,
+            'tax_id': match.details.tax_id,
+            'score': match.score,
+            'match_error': match.match_error,
+            'name': match.match_text,
+            'settlement': match.settlement,
+        }
+        for match in matches
+        if match is not NoResult]
+
+
+def query_row(query):
+    '''
+    -> row of QUERY_FIELDS from a JSON query
+    '''
+    if not isinstance(query, dict):
+        raise RequestError(f'query must be an object, got {query!r}')
+    row = tuple(query.get(field) for field in QUERY_FIELDS)
+    if not isinstance(row[0], str):
+        raise RequestError(f'query needs a name, got {query!r}')
+    if not all(value is None or isinstance(value, str) for value in row):
+        raise RequestError(f'query fields must be strings, got {query!r}')
+    return row
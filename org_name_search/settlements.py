@@ -1,9 +1,11 @@
 # coding: utf-8
 
+import re
+
 import petl
 
 from . import data
-from .normalize import simplify_accents
+from .normalize import normalize, simplify_accents
 
 
 def import_ksh_settlements(xlsfilename, output_csv):
@@ -28,6 +30,35 @@ def read_settlements(csvsource):
         .flatten())
 
 
+_DISTRICT = re.compile(r'^(.* )(\d+)(\. .*)$')
+_ROMAN_DIGITS = (
+    (1000, 'm'), (900, 'cm'), (500, 'd'), (400, 'cd'), (100, 'c'), (90, 'xc'),
+    (50, 'l'), (40, 'xl'), (10, 'x'), (9, 'ix'), (5, 'v'), (4, 'iv'), (1, 'i'))
+
+
+def _roman(number):
+    roman = ''
+    for value, digits in _ROMAN_DIGITS:
+        count, number = divmod(number, value)
+        roman += digits * count
+    return roman
+
+
+def _district_variants(settlement):
+    '''
+    Other spellings of the district number of a settlement.
+
+    E.g.:
+        budapest 01. kerület -> budapest 1. kerület, budapest i. kerület
+    '''
+    match = _DISTRICT.match(settlement)
+    if not match:
+        return []
+    head, number, tail = match.groups()
+    number = int(number)
+    return [head + str(number) + tail, head + _roman(number) + tail]
+
+
 def make_settlement_variant_map(settlements, report_conflicts=True):
     '''
     Create a map of words that are to be mapped to settlements.
@@ -67,6 +98,9 @@ def make_settlement_variant_map(settlements, report_conflicts=True):
         _map_variant(_replacetail(normalized, u'háza', u'házi'), s)
         _map_variant(_replacetail(normalized, u'halom', u'halmi'), s)
         _map_variant(_replacetail(normalized, u'falva', u'falvi'), s)
+        for district in _district_variants(normalized):
+            _map_variant(district, s)
+            _map_variant(district + u'i', s)
     return variant_map
 
 
@@ -82,10 +116,67 @@ def extract_settlements(variant_map, text):
     return settlements, text_without_settlements
 
 
+# key of the settlement in the trie node ending a settlement variant
+_SETTLEMENT = None
+
+
+def make_settlement_trie(variant_map):
+    '''
+    Create a token trie of the variants in variant_map.
+
+    The variants are split into words like normalized text, with simplified accents:
+        budapest 01. kerületi -> {'budapest': {'01': {'kerületi': {_SETTLEMENT: 'budapest 01. kerület'}}}}
+    '''
+    trie = {}
+    for variant, settlement in variant_map.items():
+        words = simplify_accents(normalize(variant)).split()
+        if not words:
+            continue
+        node = trie
+        for word in words:
+            node = node.setdefault(word, {})
+        # the variant written as it is found in text wins over other variants with the same words
+        if _SETTLEMENT not in node or ' '.join(words) == variant:
+            node[_SETTLEMENT] = settlement
+    return trie
+
+
+def extract_longest_settlements(trie, text):
+    '''
+        -> ({settlements}, text_without_settlements)
+
+    Like extract_settlements, but in one pass from left to right,
+    the settlement with the most words is taken at each word.
+    '''
+    words = text.split()
+    # simplify_accents maps characters to characters, so the words remain aligned
+    simplified_words = simplify_accents(text).split()
+    settlements = set()
+    kept_words = []
+    i = 0
+    while i < len(words):
+        node = trie
+        settlement = None
+        for j in range(i, len(words)):
+            node = node.get(simplified_words[j])
+            if node is None:
+                break
+            if _SETTLEMENT in node:
+                settlement, end = node[_SETTLEMENT], j + 1
+        if settlement is None:
+            kept_words.append(words[i])
+            i += 1
+        else:
+            settlements.add(settlement)
+            i = end
+    return settlements, ' '.join(kept_words)
+
+
 class SettlementMap:
 
     def __init__(self):
         self._map = {}
+        self._trie = {}
 
     def read_csv(self, filename, report_conflicts=True):
         self.build(
@@ -94,12 +185,15 @@ class SettlementMap:
 
     def build(self, settlements, report_conflicts):
         self._map = make_settlement_variant_map(settlements, report_conflicts)
+        self._trie = make_settlement_trie(self._map)
 
     def extract_settlements(self, text):
         '''
             -> ({settlements}, text_without_settlements)
+
+        Multi word settlements (e.g. budapest 01. kerület) are found as well, see extract_longest_settlements.
         '''
-        return extract_settlements(self._map, text)
+        return extract_longest_settlements(self._trie, text)
 
     @property
     def settlements(self):
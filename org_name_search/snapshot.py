@@ -0,0 +1,59 @@
+# coding: utf-8
+'''
+Binary snapshot of a built NGramIndex
+
+Building the index from the PIR json means parsing all the records
+and generating the ngrams for all names and settlements - on every run.
+A snapshot stores the result of this work, so that it can be loaded
+without redoing it.
+
+File layout:
+
+    MAGIC | format version (uint32, little endian) | sha256 of payload | payload
+
+where payload is the pickled index state.
+'''
+
+import hashlib
+import pickle
+import struct
+
+
+MAGIC = b'PIRSNAP\0'
+FORMAT_VERSION = 5
+_HEADER = struct.Struct('<8sI32s')
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def is_snapshot(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def write_snapshot(state, path):
+    payload = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+    checksum = hashlib.sha256(payload).digest()
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, checksum))
+        f.write(payload)
+
+
+def read_snapshot(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if len(data) < _HEADER.size:
+        raise SnapshotError(f'{path}: truncated snapshot')
+    magic, version, checksum = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise SnapshotError(f'{path}: not an index snapshot')
+    if version != FORMAT_VERSION:
+        raise SnapshotError(
+            f'{path}: unsupported snapshot format version {version} (expected {FORMAT_VERSION}), rebuild it')
+    payload = memoryview(data)[_HEADER.size:]
+    if hashlib.sha256(payload).digest() != checksum:
+        raise SnapshotError(f'{path}: checksum mismatch, snapshot is corrupt')
+    return pickle.loads(payload)
@@ -0,0 +1,107 @@
+# coding: utf-8
+'''
+Time spent in the stages of matching
+
+Stages are timed with
+
+    with stats.timer('stage name'):
+        ...
+
+Timing is off by default, then `timer` returns a shared no-op context manager,
+so the instrumented code pays only for a function call.
+
+The timings are collected by a registered collector (see collectors),
+so worker processes (see parallel) send them back with their results.
+'''
+
+import time
+
+from . import collectors
+
+
+class _Stage:
+    __slots__ = ('seconds', 'calls')
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+
+
+class _Timer:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        stage = self.stage
+        stage.seconds += time.perf_counter() - self.start
+        stage.calls += 1
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Stages(collectors.Collector):
+    '''
+    Timings collected as {stage name: _Stage}, taken as {stage name: (seconds, calls)}
+    '''
+
+    def new(self):
+        return {}
+
+    def add(self, stages, timings):
+        for name, (seconds, calls) in timings.items():
+            stage = stages.get(name)
+            if stage is None:
+                stage = stages[name] = _Stage()
+            stage.seconds += seconds
+            stage.calls += calls
+
+    def export(self, stages):
+        return {name: (stage.seconds, stage.calls) for name, stage in stages.items()}
+
+
+_stages = collectors.register(_Stages())
+
+enable = _stages.enable
+disable = _stages.disable
+enabled = _stages.enabled
+take = _stages.take
+merge = _stages.merge
+paused = _stages.paused
+
+
+def timer(name):
+    stages = _stages.collected
+    if stages is None:
+        return _NULL_TIMER
+    stage = stages.get(name)
+    if stage is None:
+        stage = stages[name] = _Stage()
+    return _Timer(stage)
+
+
+def report():
+    '''
+    -> table of the collected timings, the most time consuming stage first
+    '''
+    lines = [f'{"stage":<24} {"calls":>10} {"seconds":>10} {"us/call":>10}']
+    stages = sorted((_stages.collected or {}).items(), key=lambda item: item[1].seconds, reverse=True)
+    for name, stage in stages:
+        per_call = stage.seconds / stage.calls * 1e6 if stage.calls else 0.0
+        lines.append(f'{name:<24} {stage.calls:>10} {stage.seconds:>10.3f} {per_call:>10.1f}')
+    return '\n'.join(lines)
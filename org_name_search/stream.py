@@ -0,0 +1,156 @@
+# coding: utf-8
+'''
+Line oriented matching: a result line is written for each input line, as soon as it is found
+
+Input lines are collected into micro batches: a batch is searched for, when
+it is full, or when no more input arrived in `max_delay` seconds - so the
+latency of a line is bounded, even when the producer is slow.
+
+Formats:
+
+    jsonl   input:  {"name": NAME, "settlement": SETTLEMENT, "date": DATE} (settlement and date are optional)
+            output: the input object with "matches" added (see server.matches_json),
+                    or with "error" added, when the line is not a valid query
+
+    tsv     input:  NAME[<TAB>SETTLEMENT[<TAB>DATE]]
+            output: the input fields followed by score, match_error, pir, tax_id, name, settlement
+                    for each match
+'''
+
+import json
+import queue
+import threading
+import time
+
+from .server import QUERY_FIELDS, RequestError, matches_json, query_row
+
+
+class JSONLines:
+
+    @staticmethod
+    def parse(line):
+        '''
+        -> (query row, input to output the result with)
+        '''
+        query = json.loads(line)
+        return query_row(query), query
+
+    @staticmethod
+    def format(query, matches):
+        return json.dumps(dict(query, matches=matches_json(matches)), ensure_ascii=False)
+
+    @staticmethod
+    def format_error(line, error):
+        try:
+            query = json.loads(line)
+        except ValueError:
+            query = None
+        if not isinstance(query, dict):
+            query = {'input': line}
+        return json.dumps(dict(query, error=str(error)), ensure_ascii=False)
+
+
+class TSV:
+
+    @staticmethod
+    def parse(line):
+        fields = line.split('\t')
+        values = fields + [None] * (len(QUERY_FIELDS) - len(fields))
+        name, settlement, date = values[:len(QUERY_FIELDS)]
+        return (name, settlement or None, date or None), fields
+
+    @staticmethod
+    def format(fields, matches):
+        values = list(fields)
+        for match in matches:
+            values.extend(
+                (match.score, match.match_error, match.details.pir, match.details.tax_id,
+                    match.match_text, match.settlement))
+        return '\t'.join(_tsv_value(value) for value in values)
+
+    @staticmethod
+    def format_error(line, error):
+        # all TSV lines are valid queries
+        raise error
+
+
+FORMATS = {
+    'jsonl': JSONLines,
+    'tsv': TSV,
+}
+
+
+def _tsv_value(value):
+    if value is None:
+        return ''
+    return str(value).replace('\t', ' ').replace('\n', ' ')
+
+
+def micro_batches(lines, batch_size, max_delay=0.0):
+    '''
+    Group lines into batches of at most batch_size lines.
+
+    A batch is produced when no more line arrived in max_delay seconds after its first line,
+    (with max_delay=0, when no more line is available immediately).
+    '''
+    # lines are read in a thread, so that the availability of the next line can be checked
+    available = queue.Queue(maxsize=max(1024, 4 * batch_size))
+    end = object()
+
+    def read():
+        try:
+            for line in lines:
+                available.put(line)
+        finally:
+            available.put(end)
+
+    threading.Thread(target=read, daemon=True).start()
+
+    while True:
+        line = available.get()
+        if line is end:
+            return
+        batch = [line]
+        deadline = time.monotonic() + max_delay
+        while len(batch) < batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                line = available.get(timeout=timeout) if timeout > 0 else available.get_nowait()
+            except queue.Empty:
+                break
+            if line is end:
+                yield batch
+                return
+            batch.append(line)
+        yield batch
+
+
+def run(matcher, input, output, format='jsonl', batch_size=1, max_delay=0.0):
+    '''
+    Write a result line to output for each line of input, flushing output after each micro batch.
+
+        matcher: OrgNameMatcher with its index loaded, having QUERY_FIELDS as input fields
+    '''
+    format = FORMATS[format]
+    for lines in micro_batches(input, batch_size, max_delay):
+        lines = [line.rstrip('\r\n') for line in lines]
+        parsed = []
+        errors = {}
+        for i, line in enumerate(lines):
+            try:
+                parsed.append(format.parse(line))
+            except (ValueError, RequestError) as e:
+                errors[i] = e
+
+        batch = matcher.prepare_batch(QUERY_FIELDS, [row for row, _input in parsed])
+        found = matcher.search(batch.to_search) if batch.to_search else []
+        results = iter(zip(parsed, matcher.complete_batch(batch, found)))
+
+        for i, line in enumerate(lines):
+            if i in errors:
+                output.write(format.format_error(line, errors[i]))
+            else:
+                (_row, line_input), row_matches = next(results)
+                output.write(format.format(line_input, matcher.slot_matches(row_matches)))
+            output.write('\n')
+        output.flush()
@@ -32,6 +32,27 @@ def format_set(set):
     return '*'
 
 
+def tag(settlement_map, name):
+    '''
+    -> (settlements, org types, rest of the normalized name)
+    '''
+    normalized_name = normalize(name)
+    settlements, name_wo_settlements = settlement_map.extract_settlements(normalized_name)
+    keywords, new_name = tagger.extract_org_types(name_wo_settlements)
+    return settlements, keywords, new_name
+
+
+def tag_many(settlement_map, names):
+    '''
+    -> [tag(settlement_map, name) for name in names], the org types are tagged in one batch
+    '''
+    settlements_and_rests = [settlement_map.extract_settlements(normalize(name)) for name in names]
+    org_types = tagger.extract_org_types_many([rest for _, rest in settlements_and_rests])
+    return [
+        (settlements, keywords, new_name)
+        for (settlements, _), (keywords, new_name) in zip(settlements_and_rests, org_types)]
+
+
 def main():
     pirnev = (
         petl
@@ -41,10 +62,8 @@ def main():
 
     settlement_map = SettlementMap()
     settlement_map.read_csv('data/settlements.csv')
-    for name, in pirnev.cut('NEV'):
-        normalized_name = normalize(name)
-        settlements, name_wo_settlements = settlement_map.extract_settlements(normalized_name)
-        keywords, new_name = tagger.extract_org_types(name_wo_settlements)
+    names = list(pirnev.values('NEV'))
+    for name, (settlements, keywords, new_name) in zip(names, tag_many(settlement_map, names)):
         uprint(format_set(settlements), 16, format_set(keywords), 60, new_name, 100, name)
 
 
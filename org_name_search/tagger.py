@@ -5,11 +5,11 @@ from .rebuilder import (
     any_of, group, separated, separated_group,
     after, not_after,
     WORD_START, WORD_PREFIX, WORD_SUFFIX, JUNK_WORDS,
-    find_keywords
+    Tagger, find_keywords
 )
 
 
-ORG_TYPE = any_of(
+ORG_TYPE_ALTERNATIVES = (
     group(
         'bolcsode',
         WORD_START + 'bölcsőd[eé]'),
@@ -214,18 +214,32 @@ ORG_TYPE = any_of(
             'egyesített',
             'általános',
             'alapfokú',
-            ))
+            )),
 )
 
+
 # FIXME: post-regex hack - normalize hungarian accents
-for fix in zip(u'íóőűú', u'ioöüu'):
-    ORG_TYPE = ORG_TYPE.replace(fix[0], u'[{}{}]'.format(*fix))
-ORG_TYPE = RE(ORG_TYPE)
+def _accents_normalized(pattern):
+    for fix in zip(u'íóőűú', u'ioöüu'):
+        pattern = pattern.replace(fix[0], u'[{}{}]'.format(*fix))
+    return pattern
+
+
+ORG_TYPE_ALTERNATIVES = tuple(_accents_normalized(pattern) for pattern in ORG_TYPE_ALTERNATIVES)
+ORG_TYPE = RE(any_of(*ORG_TYPE_ALTERNATIVES))
 # print(ORG_TYPE.encode('utf-8'))
+ORG_TYPE_TAGGER = Tagger(ORG_TYPE_ALTERNATIVES)
 
 
 def extract_org_types(org_name):
     '''
         Return `tags` and *name without tagged words* for `org_name`
     '''
-    return find_keywords(ORG_TYPE, org_name)
+    return ORG_TYPE_TAGGER.find_keywords(org_name)
+
+
+def extract_org_types_many(org_names):
+    '''
+        `extract_org_types` for each of `org_names`, e.g. a whole column
+    '''
+    return ORG_TYPE_TAGGER.find_keywords_many(org_names)
@@ -0,0 +1,91 @@
+# coding: utf-8
+
+from unittest import TestCase
+
+from .cache import LRUCache, MatchStore
+from .data import load_pir_to_details
+from .index import Index, NoResult, Query
+from .test_main import TempFile
+
+
+class Test_LRUCache(TestCase):
+
+    def test_least_recently_used_is_evicted(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        cache.put('c', 3)
+
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+
+    def test_hits_and_misses_are_counted(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.get('a')
+        cache.get('a')
+        cache.get('b')
+
+        self.assertEqual(2, cache.hits)
+        self.assertEqual(1, cache.misses)
+        self.assertEqual('2 hits, 1 misses (66.7% hit rate), 1 cached', cache.stats)
+
+    def test_zero_size_cache_keeps_nothing(self):
+        cache = LRUCache(0)
+        cache.put('a', 1)
+        self.assertEqual(0, len(cache))
+        self.assertEqual('x', cache.get('a', 'x'))
+
+
+def parse(name):
+    return name
+
+
+def as_tuples(matches):
+    return [(m.details.pir, m.score, m.match_error, m.match_text, m.settlement) for m in matches]
+
+
+class Test_MatchStore(TestCase):
+
+    def setUp(self):
+        self.pir_to_details = load_pir_to_details('test_data/index.json')
+        self.index = Index(self.pir_to_details, parse, idf_shift=10., fingerprint='index-v1')
+        self.matches = self.index.search(Query('megévesztő minisztérium', None, parse))
+        self.key = ('megevesztő miniszterium', None, None)
+
+    def test_stored_matches_are_reused(self):
+        with TempFile() as db:
+            store = MatchStore(db, self.index, dict(idf_shift=10.))
+            self.assertIsNone(store.get(self.key))
+            store.put_many([(self.key, self.matches), (('x', None, 1), [NoResult])])
+            store.close()
+
+            store = MatchStore(db, self.index, dict(idf_shift=10.))
+            self.assertEqual(as_tuples(self.matches), as_tuples(store.get(self.key)))
+            self.assertEqual([NoResult], store.get(('x', None, 1)))
+            self.assertEqual('2 hits, 0 misses', store.stats)
+            store.close()
+
+    def test_matches_are_dropped_when_the_index_changes(self):
+        with TempFile() as db:
+            store = MatchStore(db, self.index, dict(idf_shift=10.))
+            store.put_many([(self.key, self.matches)])
+            store.close()
+
+            changed_index = Index(self.pir_to_details, parse, idf_shift=10., fingerprint='index-v2')
+            store = MatchStore(db, changed_index, dict(idf_shift=10.))
+            self.assertIsNone(store.get(self.key))
+            store.close()
+
+    def test_matches_are_kept_separately_for_parameters(self):
+        with TempFile() as db:
+            store = MatchStore(db, self.index, dict(idf_shift=10.))
+            store.put_many([(self.key, self.matches)])
+            store.close()
+
+            store = MatchStore(db, self.index, dict(idf_shift=1.))
+            self.assertIsNone(store.get(self.key))
+            store.close()
@@ -0,0 +1,90 @@
+# coding: utf-8
+
+from unittest import TestCase
+
+from . import collectors
+from . import diagnostics
+from . import latency
+from . import stats
+
+
+class Counts(collectors.Collector):
+
+    def new(self):
+        return {}
+
+    def add(self, counts, other):
+        for name, n in other.items():
+            counts[name] = counts.get(name, 0) + n
+
+
+class Test_Collector(TestCase):
+
+    def test_new_and_add_are_required(self):
+        class Incomplete(collectors.Collector):
+            def new(self):
+                return {}
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def test_take_resets_the_collected_measurements(self):
+        collector = Counts()
+        collector.enable()
+        collector.collected['a'] = 1
+        self.assertEqual({'a': 1}, collector.take())
+        self.assertEqual({}, collector.take())
+
+    def test_merge_adds_taken_measurements(self):
+        collector = Counts()
+        collector.enable()
+        collector.collected['a'] = 1
+        collector.merge({'a': 2, 'b': 1})
+        self.assertEqual({'a': 3, 'b': 1}, collector.take())
+
+    def test_enable_keeps_the_collected_measurements(self):
+        collector = Counts()
+        collector.enable()
+        collector.collected['a'] = 1
+        collector.enable()
+        self.assertEqual({'a': 1}, collector.take())
+
+    def test_nothing_is_collected_when_paused(self):
+        collector = Counts()
+        collector.enable()
+        collector.collected['a'] = 1
+        with collector.paused():
+            self.assertFalse(collector.enabled())
+            collector.merge({'a': 1})
+        self.assertEqual({'a': 1}, collector.take())
+
+    def test_nothing_is_collected_when_disabled(self):
+        collector = Counts()
+        self.assertFalse(collector.enabled())
+        collector.merge({'a': 1})
+        self.assertIsNone(collector.take())
+        collector.enable()
+        collector.disable()
+        self.assertIsNone(collector.take())
+
+
+class Test_registered_collectors(TestCase):
+
+    def setUp(self):
+        stats.enable()
+        diagnostics.enable()
+
+    def tearDown(self):
+        stats.disable()
+        diagnostics.disable()
+
+    def test_take_all_and_merge_all(self):
+        with stats.timer('stage'):
+            diagnostics.count('a')
+        taken = collectors.take_all()
+        self.assertEqual({}, stats.take())
+        self.assertFalse(latency.enabled())
+
+        collectors.merge_all(taken)
+        collectors.merge_all(taken)
+        self.assertEqual(2, stats.take()['stage'][1])
+        self.assertEqual({'a': 2}, diagnostics.report()['counters'])
@@ -0,0 +1,69 @@
+# coding: utf-8
+
+import os
+import tempfile
+from unittest import TestCase, skipIf
+
+import petl
+
+from . import csvio
+from . import main as m
+from .test_main import VERSION
+
+
+ROWS = [
+    ('id', 'name', 'note'),
+    ('1', 'megtévesztő minisztérium', 'with, comma'),
+    ('2', '"quoted"', 'multi\nline'),
+    ('3', '', ''),
+]
+
+
+class Test_csvio(TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tempdir.name, name)
+
+    def assert_round_trip(self, name):
+        csvio.tocsv(ROWS, self.path(name))
+        self.assertEqual(ROWS, list(csvio.fromcsv(self.path(name))))
+
+    def test_plain(self):
+        self.assert_round_trip('test.csv')
+
+    def test_gzip(self):
+        self.assert_round_trip('test.csv.gz')
+
+    def test_bz2(self):
+        self.assert_round_trip('test.csv.bz2')
+
+    def test_xz(self):
+        self.assert_round_trip('test.csv.xz')
+
+    @skipIf(csvio.zstandard is None, 'zstandard is not installed')
+    def test_zstandard(self):
+        self.assert_round_trip('test.csv.zst')
+
+    def test_output_is_the_same_as_petls(self):
+        csvio.tocsv(ROWS, self.path('csvio.csv'))
+        petl.wrap(ROWS).tocsv(self.path('petl.csv'), encoding='utf-8')
+        with open(self.path('csvio.csv'), 'rb') as f1, open(self.path('petl.csv'), 'rb') as f2:
+            self.assertEqual(f2.read(), f1.read())
+
+    def test_compressed_input_and_output(self):
+        input_gz = self.path('input.csv.gz')
+        csvio.tocsv(csvio.fromcsv('test_data/input.csv'), input_gz)
+
+        argv = ['--no-progress', 'test_data/index.json', 'szervezet']
+        m.main(argv + ['test_data/input.csv', self.path('output.csv')], VERSION)
+        m.main(argv + [input_gz, self.path('output.csv.xz')], VERSION)
+
+        self.assertEqual(
+            list(csvio.fromcsv(self.path('output.csv'))),
+            list(csvio.fromcsv(self.path('output.csv.xz'))))
@@ -0,0 +1,57 @@
+# coding: utf-8
+
+from unittest import TestCase
+
+from . import diagnostics
+
+
+class Test_diagnostics(TestCase):
+
+    def setUp(self):
+        diagnostics.enable()
+
+    def tearDown(self):
+        diagnostics.disable()
+
+    def test_buckets_are_powers_of_two(self):
+        self.assertEqual([0, 1, 2, 4, 4, 8, 1024], [diagnostics.bucket(v) for v in (0, 1, 2, 3, 4, 5, 1000)])
+
+    def test_counters(self):
+        diagnostics.count('a')
+        diagnostics.count('a', 2)
+        diagnostics.count('b')
+        self.assertEqual({'a': 3, 'b': 1}, diagnostics.report()['counters'])
+
+    def test_histograms(self):
+        for value in (1, 3, 4, 10):
+            diagnostics.observe('h', value)
+        self.assertEqual(
+            {'count': 4, 'mean': 4.5, 'max': 10, 'buckets': {'1': 1, '4': 2, '16': 1}},
+            diagnostics.report()['histograms']['h'])
+
+    def test_merge_adds_counters_and_histograms(self):
+        diagnostics.count('a')
+        diagnostics.observe('h', 3)
+        taken = diagnostics.take()
+
+        diagnostics.observe('h', 1)
+        diagnostics.merge(taken)
+        diagnostics.merge(taken)
+        report = diagnostics.report()
+        self.assertEqual({'a': 2}, report['counters'])
+        self.assertEqual({'count': 3, 'mean': 2.333, 'max': 3, 'buckets': {'1': 1, '4': 2}}, report['histograms']['h'])
+
+    def test_nothing_is_collected_when_paused(self):
+        with diagnostics.paused():
+            diagnostics.count('a')
+            diagnostics.observe('h', 1)
+            self.assertFalse(diagnostics.enabled())
+        self.assertTrue(diagnostics.enabled())
+        self.assertEqual({'counters': {}, 'histograms': {}}, diagnostics.take())
+
+    def test_captured_diagnostics_are_separate(self):
+        diagnostics.count('a')
+        with diagnostics.captured() as capture:
+            diagnostics.count('b')
+        self.assertEqual({'b': 1}, capture.diagnostics['counters'])
+        self.assertEqual({'a': 1}, diagnostics.report()['counters'])
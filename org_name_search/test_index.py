@@ -1,9 +1,13 @@
 # coding: utf-8
 
+import datetime
+import random
 from unittest import TestCase
 
 from . import index as m
+from . import scoring
 from .main import OrgNameParser
+from .data import load_pir_to_details
 
 
 class Test(TestCase):
@@ -21,3 +25,148 @@ class Test(TestCase):
         name1 = u'DUNA\xdaJV\xc1ROSI F\u0150ISKOLA'
         name2 = u'duna\xfajv\xe1rosi f\u0151iskola'
         self.assertEqual(m.union_ngrams(name1.lower(), 1), m.union_ngrams(name2, 1))
+
+    def test_word_ngrams(self):
+        self.assertEqual({' abc', 'abc', 'bcd', 'bcd ', ' ab ', ' a '}, m.word_ngrams(['abcd', 'ab', 'a']))
+        self.assertEqual(m.word_ngrams(['duna', 'iskola']), m.union_ngrams('Duna-Iskola'))
+
+    def test_postings_are_sorted_rows_containing_the_ngram(self):
+        pir_to_details = load_pir_to_details('test_data/index.json')
+        index = m.NGramIndex(pir_to_details, parse=None)
+
+        self.assertEqual(list(pir_to_details), index.pirs)
+        for ngram, ngram_id in index.ngram_ids.items():
+            rows = list(index.postings_of(ngram_id))
+            self.assertEqual(sorted(rows), rows)
+            self.assertEqual(index.ngram_counts[ngram_id], len(rows))
+            for row in rows:
+                details = index.details[row]
+                text = ' '.join(sorted(details.names | details.settlements))
+                self.assertIn(ngram, m.union_ngrams(text))
+
+    def test_name_ngrams_are_precomputed(self):
+        pir_to_details = load_pir_to_details('test_data/index.json')
+        index = m.NGramIndex(pir_to_details, parse=None)
+
+        for row, details in enumerate(index.details):
+            names = index.names.of_row(row)
+            self.assertEqual(sorted(details.names), [name for name, _ in names])
+            for name, ngram_ids in names:
+                self.assertEqual(sorted(m.union_ngrams(name)), [index.ngrams[i] for i in ngram_ids])
+
+    def test_lazy_search_returns_the_best_results(self):
+        index = m.NGramIndex(load_pir_to_details('test_data/index.json'), parse=None, idf_shift=10.)
+
+        def summary(results):
+            return [(r.details.pir, r.score, r.match_error) for r in results]
+
+        for name in ('megévesztő minisztérium', 'magyar honvédség intézet', 'családi bölcsőde'):
+            query = m.Query(name, None, parse=None)
+            results = index.search(query)
+            for materialize in (1, 2, 3):
+                self.assertEqual(
+                    summary(results[:materialize]),
+                    summary(index.search(query, materialize=materialize)))
+
+    def test_tied_results_are_in_first_hit_order(self):
+        pir_to_details = {
+            1: m.PirDetails(pir=1, names={'zeta zoo'}, settlements={'bbb'}),
+            2: m.PirDetails(pir=2, names={'zeta zoo'}, settlements={'aaa'}),
+        }
+        # ' aaa' is the first query ngram, so PIR 2 is hit first, although it is in a later row
+        query = m.Query('zeta zoo aaa bbb', None, parse=None)
+        self.assertEqual(' aaa', sorted(query.name_ngrams)[0])
+        scorers = [scoring.PythonScorer] + ([scoring.NumpyScorer] if scoring.numpy is not None else [])
+        for scorer in scorers:
+            index = m.NGramIndex(pir_to_details, parse=None)
+            index.scorer = scorer(index)
+            results = index.search(query)
+            self.assertEqual(results[0], results[1])
+            self.assertEqual([2, 1], [r.details.pir for r in results])
+            self.assertEqual([[2, 1]], [[r.details.pir for r in rs] for rs in index.search_many([query])])
+
+    def test_valid_rows_are_the_ones_valid_at_date(self):
+        index = m.NGramIndex(load_pir_to_details('test_data/index.json'), parse=None)
+
+        for year in range(2015, 2022):
+            for month in (1, 6, 12):
+                date = datetime.date(year, month, 28)
+                valid = index.valid_rows(date)
+                self.assertEqual(
+                    [details.is_valid_at(date) for details in index.details],
+                    [bool(valid[row]) for row in range(len(index.details))])
+
+    def test_dates_in_the_same_epoch_have_the_same_valid_rows(self):
+        index = m.NGramIndex(load_pir_to_details('test_data/index.json'), parse=None)
+
+        first = datetime.date(2018, 12, 28)
+        for day in range(1000):
+            date = first + datetime.timedelta(days=day)
+            same_epoch = index.validity_epoch(date) == index.validity_epoch(date - datetime.timedelta(days=1))
+            same_valid = (
+                [details.is_valid_at(date) for details in index.details] ==
+                [details.is_valid_at(date - datetime.timedelta(days=1)) for details in index.details])
+            if same_epoch:
+                self.assertTrue(same_valid)
+
+
+class Test_apply_delta(TestCase):
+
+    def assert_same_as_rebuilt(self, pir_to_details, delta):
+        index = m.NGramIndex(pir_to_details, parse=None, idf_shift=10.)
+        updated = index.apply_delta(delta, fingerprint='updated')
+
+        expected_pir_to_details = dict(pir_to_details)
+        for pir, details in delta.items():
+            if details is None:
+                expected_pir_to_details.pop(pir, None)
+            else:
+                expected_pir_to_details[pir] = details
+        rebuilt = m.NGramIndex(expected_pir_to_details, parse=None, idf_shift=10., fingerprint='updated')
+
+        self.assertEqual(rebuilt.get_state(), updated.get_state())
+        self.assertEqual(list(rebuilt.tfidfs), list(updated.tfidfs))
+        self.assertEqual(rebuilt.missing_ngram_tfidf, updated.missing_ngram_tfidf)
+        query = m.Query('megtévesztő minisztérium', 'budapest', parse=None)
+        self.assertEqual(
+            [(r.details.pir, r.score, r.match_error) for r in rebuilt.search(query)],
+            [(r.details.pir, r.score, r.match_error) for r in updated.search(query)])
+
+    def test_add_change_and_remove(self):
+        pir_to_details = load_pir_to_details('test_data/index.json')
+        pirs = list(pir_to_details)
+        delta = {
+            pirs[0]: None,
+            pirs[1]: m.PirDetails(
+                pir=pirs[1], names={'megtévesztő minisztérium'}, settlements={'tata'},
+                end_date=datetime.date(2015, 1, 1)),
+            12345: m.PirDetails(pir=12345, names={'zajtalan zongoraterem'}, settlements={'budapest'}),
+        }
+        self.assert_same_as_rebuilt(pir_to_details, delta)
+
+    def test_removing_the_only_pir_having_an_ngram(self):
+        pir_to_details = {
+            1: m.PirDetails(pir=1, names={'közös név'}),
+            2: m.PirDetails(pir=2, names={'közös név', 'xyzzy'}),
+        }
+        self.assert_same_as_rebuilt(pir_to_details, {2: None})
+        self.assert_same_as_rebuilt(pir_to_details, {2: m.PirDetails(pir=2, names={'közös név'})})
+
+    def test_random_deltas(self):
+        rnd = random.Random(3)
+        words = 'iskola óvoda hivatal megyei városi tata eger vác zirc'.split()
+
+        def random_details(pir):
+            # the numbered words bring new ngrams and make some of the old ones vanish
+            names = {
+                ' '.join(rnd.sample(words, rnd.randint(1, 3)) + ['q%d' % rnd.randint(0, 20)])
+                for _ in range(rnd.randint(1, 3))}
+            return m.PirDetails(pir=pir, names=names, settlements={rnd.choice(words[-4:])})
+
+        for _ in range(50):
+            pir_to_details = {pir: random_details(pir) for pir in range(rnd.randint(5, 30))}
+            delta = {}
+            for _ in range(rnd.randint(1, 8)):
+                pir = rnd.randint(0, 40)
+                delta[pir] = None if rnd.random() < 0.4 else random_details(pir)
+            self.assert_same_as_rebuilt(pir_to_details, delta)
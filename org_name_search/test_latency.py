@@ -0,0 +1,67 @@
+# coding: utf-8
+
+import csv
+import os
+import tempfile
+from unittest import TestCase
+
+from . import latency
+
+
+class Test_Latencies(TestCase):
+
+    def test_percentiles_are_accurate_within_a_bucket(self):
+        latencies = latency.Latencies()
+        for i in range(1, 101):
+            latencies.add(i / 1000)
+        for percent in (50, 90, 99):
+            self.assertAlmostEqual(percent / 1000, latencies.percentile(percent), delta=percent / 1000 * 0.1)
+        self.assertEqual(0.1, latencies.percentile(100))
+        self.assertEqual(0.1, latencies.max)
+
+    def test_no_latencies(self):
+        latencies = latency.Latencies()
+        self.assertIsNone(latencies.percentile(50))
+        self.assertEqual('no queries searched', latencies.summary())
+
+    def test_merge(self):
+        latencies, other = latency.Latencies(), latency.Latencies()
+        latencies.add(0.001)
+        other.add(0.5)
+        other.slow_queries.append((0.5, {'name': 'slow'}))
+        latencies.merge(other)
+        self.assertEqual(2, latencies.count)
+        self.assertEqual(0.5, latencies.max)
+        self.assertEqual([(0.5, {'name': 'slow'})], latencies.slow_queries)
+
+
+class Test_recording(TestCase):
+
+    def tearDown(self):
+        latency.disable()
+
+    def test_slow_queries_are_reported_over_the_threshold(self):
+        self.assertFalse(latency.record(1.0))
+        latency.enable(slow_threshold=0.1)
+        self.assertFalse(latency.record(0.01))
+        self.assertTrue(latency.record(0.1))
+        latency.enable()
+        self.assertFalse(latency.record(1.0))
+        self.assertEqual(3, latency.take().count)
+
+    def test_slow_log_has_the_slowest_first(self):
+        latency.enable(slow_threshold=0)
+        latency.add_slow_query(0.2, {'name': 'a', 'query_ngrams': 3})
+        latency.add_slow_query(0.5, {'name': 'b', 'candidates': 7})
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            latency.write_slow_log(path)
+            with open(path, encoding='utf-8', newline='') as f:
+                rows = list(csv.DictReader(f))
+        finally:
+            os.remove(path)
+        self.assertEqual(['b', 'a'], [row['name'] for row in rows])
+        self.assertEqual('500.0', rows[0]['milliseconds'])
+        self.assertEqual('7', rows[0]['candidates'])
+        self.assertEqual('3', rows[1]['query_ngrams'])
@@ -2,16 +2,22 @@
 
 from . import main as m
 
+import collections
 import datetime
+import json
 import operator
 import os
 import petl
 import tempfile
 
-from unittest import TestCase
+from unittest import TestCase, skipUnless
 
 from .data import PirDetails
+from . import diagnostics
+from . import latency
 from .index import Index
+from . import parallel
+from . import stats
 
 VERSION = '0.0.1-test'
 
@@ -80,6 +86,87 @@ class Test_with_files(TestCase):
 
             self.assertEqual('taxid__3', records_to_dict(read_csv(output_csv))[2]['pir_taxid'])
 
+    def test_output_does_not_depend_on_batch_size(self):
+        with TempFile() as batched_csv, TempFile() as single_csv:
+            input_csv = 'test_data/input.csv'
+
+            argv = ['--no-progress', 'test_data/index.json', 'szervezet', input_csv]
+            m.main(argv + [batched_csv], VERSION)
+            m.main(argv + [single_csv, '--batch-size', '1'], VERSION)
+
+            with open(batched_csv, 'rb') as batched, open(single_csv, 'rb') as single:
+                self.assertEqual(batched.read(), single.read())
+
+    def test_output_is_the_same_with_match_cache(self):
+        with TempFile() as plain_csv, TempFile() as first_csv, TempFile() as second_csv, TempFile() as db:
+            input_csv = 'test_data/input.csv'
+
+            argv = ['--no-progress', 'test_data/index.json', 'szervezet', input_csv]
+            m.main(argv + [plain_csv], VERSION)
+            m.main(argv + [first_csv, '--match-cache', db], VERSION)
+            m.main(argv + [second_csv, '--match-cache', db], VERSION)
+
+            with open(plain_csv, 'rb') as plain, open(first_csv, 'rb') as first, open(second_csv, 'rb') as second:
+                plain = plain.read()
+                self.assertEqual(plain, first.read())
+                self.assertEqual(plain, second.read())
+
+    def test_output_is_the_same_with_stats_and_profile(self):
+        with TempFile() as plain_csv, TempFile() as profiled_csv, TempFile() as profile:
+            input_csv = 'test_data/input.csv'
+
+            argv = ['--no-progress', 'test_data/index.json', 'szervezet', input_csv]
+            m.main(argv + [plain_csv], VERSION)
+            m.main(argv + [profiled_csv, '--stats', '--profile', profile], VERSION)
+
+            with open(plain_csv, 'rb') as plain, open(profiled_csv, 'rb') as profiled:
+                self.assertEqual(plain.read(), profiled.read())
+            self.assertGreater(os.path.getsize(profile), 0)
+
+    @skipUnless(parallel.can_fork(), 'needs fork')
+    def test_parallel_output_is_the_same_as_serial(self):
+        with TempFile() as serial_csv, TempFile() as parallel_csv:
+            input_csv = 'test_data/input.csv'
+
+            argv = ['--no-progress', 'test_data/index.json', 'szervezet', input_csv, '--batch-size', '1']
+            m.main(argv + [serial_csv], VERSION)
+            m.main(argv + [parallel_csv, '--jobs', '2'], VERSION)
+
+            with open(serial_csv, 'rb') as serial, open(parallel_csv, 'rb') as parallel_output:
+                self.assertEqual(serial.read(), parallel_output.read())
+
+    @skipUnless(parallel.can_fork(), 'needs fork')
+    def test_parallel_diagnostics_are_the_same_as_serial(self):
+        with TempFile() as output_csv, TempFile() as serial_json, TempFile() as parallel_json:
+            input_csv = 'test_data/input.csv'
+
+            argv = ['--no-progress', 'test_data/index.json', 'szervezet', input_csv, output_csv, '--batch-size', '1']
+            m.main(argv + ['--diagnostics', serial_json], VERSION)
+            m.main(argv + ['--diagnostics', parallel_json, '--jobs', '2'], VERSION)
+
+            with open(serial_json) as serial, open(parallel_json) as parallel_diagnostics:
+                serial = json.load(serial)
+                self.assertEqual(serial, json.load(parallel_diagnostics))
+            self.assertEqual(3, serial['counters']['rows'])
+
+    def test_slow_queries_are_logged(self):
+        with TempFile() as output_csv, TempFile() as slow_log:
+            input_csv = 'test_data/input.csv'
+
+            argv = ['--no-progress', 'test_data/index.json', 'szervezet', input_csv, output_csv]
+            m.main(argv + ['--slow-log', slow_log, '--slow-threshold', '0'], VERSION)
+            slow_queries = {row['name']: row for row in read_csv(slow_log).dicts()}
+
+            self.assertEqual(
+                {'élni tanítunk általános iskola', 'megtévesztő minisztérium', 'elintézzük hivatal'},
+                set(slow_queries))
+            slowest = slow_queries['megtévesztő minisztérium']
+            self.assertGreater(int(slowest['query_ngrams']), 0)
+            self.assertGreater(int(slowest['candidates']), 0)
+
+            m.main(argv + ['--slow-log', slow_log], VERSION)
+            self.assertEqual(0, read_csv(slow_log).nrows())
+
 
 class OrgNameMatcher(m.OrgNameMatcher):
 
@@ -87,6 +174,27 @@ class OrgNameMatcher(m.OrgNameMatcher):
         self.index = Index(index_data, self.parse)
 
 
+class CountingIndex(Index):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = collections.Counter()
+
+    def search(self, *args, **kwargs):
+        self.calls['search'] += 1
+        return super().search(*args, **kwargs)
+
+    def search_many(self, *args, **kwargs):
+        self.calls['search_many'] += 1
+        return super().search_many(*args, **kwargs)
+
+
+class CountingMatcher(m.OrgNameMatcher):
+
+    def load_index(self, index_data):
+        self.index = CountingIndex(index_data, self.parse)
+
+
 find_matches = OrgNameMatcher.run
 INPUT_FIELDS = m.InputFields('org_name', 'settlement', 'date')
 OUTPUT_FIELDS = m.OutputFields('pir', 'pir_name', 'pir_score', 'pir_err', 'pir_settlement', 'taxid')
@@ -229,4 +337,125 @@ class Test_functionality(TestCase):
         match = find1('megtévesztő minisztérium', 'budapest', y(2012), pir_to_details)
         self.assertEqual('megtévesztő minisztérium', match[OUTPUT_FIELDS.name])
 
+    def test_match_fields_are_added_for_each_match(self):
+        input = petl.wrap([['id', 'org_name'], [1, 'megtévesztő minisztérium']])
+        output_fields = m.OutputFields('pir', 'pir_name', 'pir_score', 'pir_err', None, 'taxid')
+        parser = m.OrgNameParser()
+        parser.build(SETTLEMENTS, report_conflicts=True)
+        matches = find_matches(
+            input, m.InputFields('org_name'), output_fields, self.pir_to_details, parser.parse, extramatches=1)
+
+        self.assertEqual(
+            ('id', 'org_name',
+                'pir_score', 'pir_err', 'pir', 'taxid', 'pir_name',
+                'pir_score_1', 'pir_err_1', 'pir_1', 'taxid_1', 'pir_name_1'),
+            petl.header(matches))
+        row = records_to_dict(matches)[1]
+        self.assertEqual(PI_R, row['pir'])
+        self.assertEqual(TATA_PI_R, row['pir_1'])
+
+    def test_cached_matches_are_the_same_as_searched_ones(self):
+        input = petl.wrap(
+            [
+                ['id', INPUT_FIELDS.org_name, INPUT_FIELDS.settlement, INPUT_FIELDS.date],
+                [1, 'Megtévesztő Minisztérium', 'budapest', '20150101'],
+                [2, 'megtévesztő minisztérium.', 'budapest', '20150301'],
+                [3, 'megtévesztő minisztérium', 'budapest', '20030101'],
+                [4, 'megtévesztő minisztérium', 'budapest', '20150101'],
+            ])
+        parser = m.OrgNameParser()
+        parser.build(SETTLEMENTS, report_conflicts=True)
+
+        def find_all(cache_size):
+            matches = find_matches(
+                input, INPUT_FIELDS, OUTPUT_FIELDS, self.pir_to_details, parser.parse, cache_size=cache_size)
+            return records_to_dict(matches)
+
+        cached = find_all(cache_size=10)
+        self.assertEqual(find_all(cache_size=0), cached)
+        self.assertEqual(PI_R, cached[1]['pir'])
+        self.assertEqual(PI_R, cached[2]['pir'])
+        self.assertIsNone(cached[3]['pir'])
+        self.assertEqual(PI_R, cached[4]['pir'])
+
+    def test_outcomes_are_counted_in_diagnostics(self):
+        input = petl.wrap(
+            [
+                ['id', INPUT_FIELDS.org_name, INPUT_FIELDS.settlement, INPUT_FIELDS.date],
+                [1, 'megtévesztő minisztérium', 'budapest', '20120101'],
+                [2, 'megtévesztő minisztérium', '', '20010101'],
+                [3, 'qqq zzz', '', '20120101'],
+                [4, 'megévesztő minisztérium', '', '20120101'],
+                [5, 'megtévesztő alapítvány', '', '20120101'],
+                [6, 'megtévesztő minisztérium', 'budapest', '20120101'],
+            ])
+        parser = m.OrgNameParser()
+        parser.build(SETTLEMENTS, report_conflicts=True)
+        diagnostics.enable()
+        try:
+            records_to_dict(find_matches(
+                input, INPUT_FIELDS, OUTPUT_FIELDS, self.pir_to_details, parser.parse, stop_words=['alapítvány']))
+            report = diagnostics.report()
+        finally:
+            diagnostics.disable()
+
+        self.assertEqual(
+            {
+                'rows': 6,
+                'queries': 4,
+                # row 6 is answered from the query cache
+                'outcome.matched': 2,
+                'outcome.date filter': 1,
+                'outcome.no candidates': 1,
+                'outcome.ambiguous': 1,
+                'outcome.stop word': 1,
+            },
+            report['counters'])
+        outcomes = [count for counter, count in report['counters'].items() if counter.startswith('outcome.')]
+        self.assertEqual(report['counters']['rows'], sum(outcomes))
+        self.assertEqual(4, report['histograms']['query ngrams']['count'])
+
+    def test_queries_are_searched_in_batches_while_recording_latencies(self):
+        input = petl.wrap(
+            [
+                ['id', INPUT_FIELDS.org_name, INPUT_FIELDS.settlement, INPUT_FIELDS.date],
+                [1, 'megtévesztő minisztérium', 'budapest', '20120101'],
+                [2, 'elintézzük hivatal', '', '20120101'],
+            ])
+
+        def search_calls():
+            matcher = CountingMatcher(INPUT_FIELDS, OUTPUT_FIELDS, parse=None, idf_shift=0)
+            matcher.load_index(self.pir_to_details)
+            records_to_dict(matcher.find_matches(input))
+            return matcher.index.calls
+
+        self.assertEqual({'search_many': 1}, search_calls())
+        latency.enable()
+        try:
+            self.assertEqual({'search_many': 1}, search_calls())
+            self.assertEqual(2, latency.take().count)
+        finally:
+            latency.disable()
+
+    def test_slow_query_details_are_not_timed_in_the_stages(self):
+        input = petl.wrap(
+            [
+                ['id', INPUT_FIELDS.org_name, INPUT_FIELDS.settlement, INPUT_FIELDS.date],
+                [1, 'megtévesztő minisztérium', 'budapest', '20120101'],
+                [2, 'elintézzük hivatal', '', '20120101'],
+            ])
+
+        def scoring_calls(slow_threshold):
+            latency.enable(slow_threshold)
+            stats.enable()
+            try:
+                records_to_dict(find_matches(input, INPUT_FIELDS, OUTPUT_FIELDS, self.pir_to_details, parse=None))
+                self.assertEqual(2 if slow_threshold is not None else 0, len(latency.take().slow_queries))
+                return stats.take()['scoring'][1]
+            finally:
+                stats.disable()
+                latency.disable()
+
+        self.assertEqual(scoring_calls(None), scoring_calls(0))
+
 # long names with many words are still matched (kind of)
@@ -11,3 +11,16 @@ class Test(TestCase):
         name1 = u'DUNA\xdaJV\xc1ROSI F\u0150ISKOLA'
         name2 = u'duna\xfajv\xe1rosi f\u0151iskola'
         self.assertEqual(m.normalize(name1), m.normalize(name2))
+
+    def test_tokenize_words_are_normalized_with_simplified_accents(self):
+        name = u'Duna\xfajv\xe1rosi FŐISKOLA (r\xe9gi), K\xd3RH\xc1Z-2'
+        self.assertEqual(m.simplify_accents(m.normalize(name)).split(), m.tokenize(name).words)
+        self.assertEqual(['korház', 'és', 'rendelö'], m.tokenize('Kórház,Rendelő').words)
+
+    def test_tokenize_stop_words_are_separated_by_space_or_dot(self):
+        stop_words = {'kft'}
+        self.assertTrue(m.tokenize('Abc KFT', stop_words).has_stop_word)
+        self.assertTrue(m.tokenize('Abc.Kft.', stop_words).has_stop_word)
+        self.assertFalse(m.tokenize('Abc-Kft', stop_words).has_stop_word)
+        self.assertFalse(m.tokenize('Abckft', stop_words).has_stop_word)
+        self.assertFalse(m.tokenize('Abc KFT').has_stop_word)
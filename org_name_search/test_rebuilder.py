@@ -2,8 +2,8 @@
 
 from unittest import TestCase, main
 from .rebuilder import (
-    find_keywords,
-    group, any_of, at_end
+    Tagger, find_keywords, find_keywords_many,
+    group, any_of, at_end, separated
     )
 
 
@@ -37,6 +37,63 @@ class Test_find_keywords(TestCase):
         self.assertEqual('c', remaining)
         self.assertEqual({'first', 'middle'}, keywords)
 
+    def test_match_over_several_words(self):
+        keywords, remaining = find_keywords(group('span', 'b c-d'), 'a ab c-de f, g')
+        self.assertEqual('a f g', remaining)
+        self.assertEqual({'span'}, keywords)
+
+    def test_matches_in_one_word(self):
+        pattern = any_of(group('x', 'x'), group('y', 'y'))
+        keywords, remaining = find_keywords(pattern, 'axbyc d y e')
+        self.assertEqual('d e', remaining)
+        self.assertEqual({'x', 'y'}, keywords)
+
+    def test_no_match_joins_words(self):
+        self.assertEqual((set(), 'a b c'), find_keywords(group('x', 'x'), ' a, b  (c) '))
+
+    def test_many(self):
+        pattern = any_of(group('first', 'a'), group('middle', 'b'))
+        texts = ['a b c', 'c', 'a abc c', 'a b c', '']
+        results = find_keywords_many(pattern, texts)
+        self.assertEqual([find_keywords(pattern, text) for text in texts], results)
+        # the keywords of the same texts can be changed independently
+        self.assertIsNot(results[0][0], results[3][0])
+
+
+class Test_Tagger(TestCase):
+
+    def assert_same_as_find_keywords(self, alternatives, texts):
+        tagger = Tagger(alternatives)
+        for text in texts:
+            self.assertEqual(find_keywords(any_of(*alternatives), text), tagger.find_keywords(text), text)
+        return tagger
+
+    def test_leftmost_match_wins(self):
+        tagger = self.assert_same_as_find_keywords(
+            [group('second', 'bc'), group('first', 'abc')], ['abc', 'x abc bc', 'bc abc'])
+        self.assertEqual(({'first'}, ''), tagger.find_keywords('abc'))
+
+    def test_first_alternative_wins_at_the_same_position(self):
+        tagger = self.assert_same_as_find_keywords(
+            [group('long', 'ab'), group('short', 'a')], ['ab', 'a ab', 'ba'])
+        self.assertEqual(({'long'}, ''), tagger.find_keywords('ab'))
+
+    def test_keys_of_single_groups(self):
+        alternatives = [group('ka', r'\w+ka'), group('ovoda', 'óvod[aá]'), separated('és')]
+        tagger = self.assert_same_as_find_keywords(alternatives, ['abc', 'aka és óvodá', 'óvoda', 'b óvoda ka'])
+        self.assertTrue(tagger.single_group)
+        self.assertEqual(({'ovoda'}, 'x'), tagger.find_keywords('x óvodá'))
+
+    def test_alternatives_referring_to_groups(self):
+        tagger = self.assert_same_as_find_keywords([group('a', 'a'), r'(?P<b>b)(?P=b)'], ['a bb', 'b'])
+        self.assertTrue(tagger.single_group)
+
+    def test_keys_of_nested_groups(self):
+        alternatives = [group('outer', 'a' + group('inner', 'b')), group('c', 'c')]
+        tagger = self.assert_same_as_find_keywords(alternatives, ['ab c', 'a c'])
+        self.assertFalse(tagger.single_group)
+        self.assertEqual({'outer', 'inner', 'c'}, tagger.find_keywords('ab c')[0])
+
 
 class Test_RE_search(TestCase):
     def test_at_end(self):
@@ -0,0 +1,172 @@
+# coding: utf-8
+
+import datetime
+import random
+from unittest import TestCase, skipIf
+
+from . import scoring as m
+from .data import PirDetails, load_pir_to_details
+from .index import NGramIndex, Query
+
+
+def parse(name):
+    return name
+
+
+QUERIES = (
+    ('megévesztő minisztérium', None),
+    ('megtévesztő minisztérium', 'budapest'),
+    ('magyar honvédség', None),
+    ('családi bölcsőde', 'vitnyéd'),
+    ('intéző hivatal', None),
+    ('xyz', None),
+)
+
+WORDS = (
+    'általános iskola óvoda bölcsőde kollégium gimnázium egyetem főiskola kórház múzeum könyvtár '
+    'polgármesteri hivatal önkormányzat magyar nemzeti központi megyei városi községi '
+    'budapest debrecen szeged pécs győr tata eger sopron vác zirc').split()
+
+
+def random_index(rnd, size=300):
+    pir_to_details = {
+        pir: PirDetails(
+            pir=pir,
+            names={' '.join(rnd.sample(WORDS, rnd.randint(1, 5))) for _ in range(rnd.randint(1, 3))},
+            settlements={rnd.choice(WORDS[-10:])},
+            start_date=rnd.choice((None, datetime.date(2000, 1, 1), datetime.date(2010, 1, 1))),
+            end_date=rnd.choice((None, datetime.date(2005, 1, 1), datetime.date(2015, 1, 1))))
+        for pir in range(size)}
+    return NGramIndex(pir_to_details, parse, idf_shift=10.)
+
+
+def random_terms(rnd, index):
+    query = Query(' '.join(rnd.sample(WORDS, rnd.randint(1, 4))) + ' xq', None, parse)
+    return [
+        (index.ngram_ids[ngram], index.tfidfs[index.ngram_ids[ngram]])
+        for ngram in sorted(query.name_ngrams)
+        if ngram in index.ngram_ids]
+
+
+class Test_pruning(TestCase):
+
+    def assert_pruning_does_not_change_candidates(self, scorer):
+        rnd = random.Random(1)
+        index = random_index(rnd)
+        pruned = scorer(index, prune=True)
+        exhaustive = scorer(index, prune=False)
+        pruned_queries = 0
+        for _ in range(200):
+            terms = random_terms(rnd, index)
+            max_score = sum(tfidf for _, tfidf in terms)
+            valid = pruned.validity_mask(rnd.choice((datetime.date(2003, 1, 1), datetime.date(2012, 1, 1))).toordinal())
+            for min_score in (max_score / 4, max_score / 2):
+                posting_counts = [index.ngram_counts[ngram_id] for ngram_id, _ in terms]
+                if m.admitting_terms(terms, min_score, posting_counts) is not None:
+                    pruned_queries += 1
+                for max_results in (1, 10):
+                    self.assertEqual(
+                        exhaustive.top_candidates(terms, min_score, max_results),
+                        pruned.top_candidates(terms, min_score, max_results))
+                    self.assertEqual(
+                        exhaustive.top_candidates(terms, min_score, max_results, valid),
+                        pruned.top_candidates(terms, min_score, max_results, valid))
+        self.assertGreater(pruned_queries, 0)
+
+    def test_python_scorer(self):
+        self.assert_pruning_does_not_change_candidates(m.PythonScorer)
+
+    @skipIf(m.numpy is None, 'numpy is not installed')
+    def test_numpy_scorer(self):
+        self.assert_pruning_does_not_change_candidates(m.NumpyScorer)
+
+    def test_rare_terms_admit_candidates(self):
+        terms = [(0, 0.1), (1, 0.5), (2, 0.1), (3, 0.3)]
+        self.assertEqual([1, 3], m.admitting_terms(terms, 0.25, [10, 1, 10, 1]))
+        self.assertIsNone(m.admitting_terms(terms, 0.0, [10, 1, 10, 1]))
+
+    def test_no_pruning_when_admitting_terms_are_the_common_ones(self):
+        terms = [(0, 0.1), (1, 0.5), (2, 0.1), (3, 0.3)]
+        self.assertIsNone(m.admitting_terms(terms, 0.25, [1, 10, 1, 10]))
+
+
+@skipIf(m.numpy is None, 'numpy is not installed')
+class Test_NumpyScorer(TestCase):
+
+    def setUp(self):
+        self.index = NGramIndex(load_pir_to_details('test_data/index.json'), parse, idf_shift=10.)
+
+    def assert_same_results(self, date=None):
+        python_index = NGramIndex.from_state(self.index.get_state(), parse, idf_shift=10.)
+        python_index.scorer = m.PythonScorer(python_index)
+        numpy_index = NGramIndex.from_state(self.index.get_state(), parse, idf_shift=10.)
+        numpy_index.scorer = m.NumpyScorer(numpy_index)
+
+        for name, settlement in QUERIES:
+            query = Query(name, settlement, parse, date=date)
+            for max_results in (1, 2, 10):
+                self.assertEqual(
+                    [(r.details.pir, r.score, r.match_error) for r in python_index.search(query, max_results)],
+                    [(r.details.pir, r.score, r.match_error) for r in numpy_index.search(query, max_results)])
+
+    def test_search_many_is_the_same_as_search(self):
+        date = datetime.date(2018, 12, 30)
+        queries = [Query(name, settlement, parse, date=date) for name, settlement in QUERIES]
+        queries += [Query(name, settlement, parse) for name, settlement in QUERIES]
+        for scorer in (m.PythonScorer, m.NumpyScorer):
+            for prune in (True, False):
+                index = NGramIndex.from_state(self.index.get_state(), parse, idf_shift=10.)
+                index.scorer = scorer(index, prune=prune)
+                for max_results in (1, 10):
+                    seconds = []
+                    self.assertEqual(
+                        [[(r.details.pir, r.score, r.match_error) for r in index.search(query, max_results)]
+                            for query in queries],
+                        [[(r.details.pir, r.score, r.match_error) for r in results]
+                            for results in index.search_many(queries, max_results, seconds=seconds)])
+                    self.assertEqual(len(queries), len(seconds))
+                    self.assertTrue(all(s >= 0 for s in seconds))
+
+    def test_batched_cells_do_not_overflow(self):
+        index = self.index
+        queries = [Query(name, settlement, parse) for name, settlement in QUERIES]
+        tasks = [
+            (terms, max_score / 4.0, valid)
+            for terms, max_score, valid in filter(None, map(index._scoring_task, queries))]
+        expected = m.PythonScorer(index).top_candidates_many(tasks, 10)
+        scorer = m.NumpyScorer(index, prune=False)
+        # row ids of the second task would not fit in 32 bits
+        scorer.n_rows = 2 ** 31 - 1
+        self.assertEqual(expected, scorer.top_candidates_many(tasks, 10))
+
+    def test_same_results_as_python_scorer(self):
+        self.assert_same_results()
+
+    def test_same_results_as_python_scorer_with_date(self):
+        self.assert_same_results(datetime.date(2018, 12, 30))
+
+    def test_candidates(self):
+        index = self.index
+        terms = []
+        for ngram in sorted(Query('megévesztő minisztérium', None, parse).name_ngrams):
+            ngram_id = index.ngram_ids.get(ngram)
+            if ngram_id is not None:
+                terms.append((ngram_id, 1.0 / (index.ngram_counts[ngram_id] + index.idf_shift)))
+
+        expected = m.PythonScorer(index).top_candidates(terms, 0.01, 10)
+        self.assertTrue(expected)
+        self.assertEqual(expected, m.NumpyScorer(index).top_candidates(terms, 0.01, 10))
+
+    def test_min_top_score_handles_ties(self):
+        import random
+        rnd = random.Random(42)
+        for _ in range(200):
+            values = [rnd.choice((0.25, 0.5, 0.75, 1.0, rnd.random())) for _ in range(rnd.randint(1, 30))]
+            for k in (1, 2, 3, 10):
+                expected = sorted(set(values), reverse=True)[:k][-1]
+                self.assertEqual(expected, m._min_top_score(m.numpy.array(values), k))
+
+    def test_min_top_score_with_many_ties(self):
+        values = [1.0] * 50 + [0.5] * 50 + [0.25] * 50 + [0.1]
+        for k, expected in ((1, 1.0), (2, 0.5), (3, 0.25), (4, 0.1), (5, 0.1)):
+            self.assertEqual(expected, m._min_top_score(m.numpy.array(values), k))
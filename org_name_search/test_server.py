@@ -0,0 +1,161 @@
+# coding: utf-8
+
+import asyncio
+import http.client
+import json
+import threading
+from unittest import TestCase, skipUnless
+
+import petl
+
+from . import main as m
+from . import parallel
+from . import server
+
+
+QUERIES = [
+    {'name': 'megtévesztő minisztérium', 'date': '2016'},
+    {'name': 'elintézzük hivatal', 'settlement': 'nahol', 'date': '2030'},
+    {'name': 'élni tanítunk általános iskola'},
+    {'name': 'megtévesztő minisztérium', 'date': '2016'},
+]
+
+
+def make_matcher(jobs=1):
+    parser = m.OrgNameParser()
+    parser.build(('budapest', 'tata'), report_conflicts=True)
+    matcher = m.OrgNameMatcher(
+        m.InputFields(*server.QUERY_FIELDS), None, parser.parse, idf_shift=10., jobs=jobs)
+    matcher.load_index('test_data/index.json')
+    return matcher
+
+
+def expected_matches(queries):
+    parser = m.OrgNameParser()
+    parser.build(('budapest', 'tata'), report_conflicts=True)
+    input = petl.wrap(
+        [('id',) + server.QUERY_FIELDS] +
+        [(i,) + server.query_row(query) for i, query in enumerate(queries)])
+    output_fields = m.OutputFields('pir', 'pir_name', 'pir_score', 'pir_err', 'pir_settlement', 'taxid')
+    matches = m.find_matches(
+        input, m.InputFields(*server.QUERY_FIELDS), output_fields, 'test_data/index.json', parser.parse,
+        idf_shift=10.)
+    return [
+        [] if row.pir_score == 0 else [{
+            'pir': row.pir,
+            'tax_id': row.taxid,
+            'score': row.pir_score,
+            'match_error': row.pir_err,
+            'name': row.pir_name,
+            'settlement': row.pir_settlement}]
+        for row in matches.namedtuples()]
+
+
+class ServerThread:
+    '''
+    MatchServer running on localhost (on a free port) in a background thread
+    '''
+
+    def __init__(self, matcher):
+        self.match_server = server.MatchServer(matcher)
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.server = self.loop.run_until_complete(self.match_server.start('127.0.0.1', 0))
+            self.port = self.server.sockets[0].getsockname()[1]
+            started.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run)
+        self.thread.start()
+        started.wait()
+
+    def close(self):
+        async def stop():
+            self.server.close()
+            await self.server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.match_server.close()
+
+    def request(self, method, path, body=None):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port)
+        try:
+            connection.request(method, path, body=None if body is None else json.dumps(body))
+            response = connection.getresponse()
+            return response.status, json.loads(response.read().decode('utf-8'))
+        finally:
+            connection.close()
+
+
+class Test_server(TestCase):
+
+    jobs = 1
+
+    def setUp(self):
+        self.server = ServerThread(make_matcher(self.jobs))
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_single_query(self):
+        status, response = self.server.request('POST', '/match', QUERIES[0])
+        self.assertEqual(200, status)
+        self.assertEqual({'matches': expected_matches(QUERIES[:1])[0]}, response)
+
+    def test_batch_query(self):
+        status, response = self.server.request('POST', '/match', QUERIES)
+        self.assertEqual(200, status)
+        self.assertEqual([{'matches': matches} for matches in expected_matches(QUERIES)], response)
+
+    def test_bad_requests(self):
+        self.assertEqual(400, self.server.request('POST', '/match', {'settlement': 'tata'})[0])
+        self.assertEqual(400, self.server.request('POST', '/match', ['name'])[0])
+        self.assertEqual(404, self.server.request('GET', '/nothing')[0])
+        self.assertEqual(405, self.server.request('GET', '/match')[0])
+
+    def test_stats(self):
+        for query in QUERIES:
+            self.server.request('POST', '/match', query)
+        status, stats = self.server.request('GET', '/stats')
+        self.assertEqual(200, status)
+        self.assertEqual(len(QUERIES), stats['requests'])
+        self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+
+    def test_keep_alive(self):
+        connection = http.client.HTTPConnection('127.0.0.1', self.server.port)
+        try:
+            for query in QUERIES:
+                connection.request('POST', '/match', body=json.dumps(query))
+                response = connection.getresponse()
+                self.assertEqual(200, response.status)
+                response.read()
+        finally:
+            connection.close()
+
+
+@skipUnless(parallel.can_fork(), 'needs fork')
+class Test_server_with_workers(Test_server):
+
+    jobs = 2
+
+
+class Test_latency_stats(TestCase):
+
+    def test_percentiles(self):
+        latencies = server.Latencies()
+        for ms in range(1, 101):
+            latencies.add(ms / 1000)
+        stats = server.latency_stats(latencies)
+        self.assertEqual(100, stats['requests'])
+        # the percentiles are accurate within a histogram bucket
+        self.assertAlmostEqual(50.0, stats['p50_ms'], delta=5)
+        self.assertAlmostEqual(99.0, stats['p99_ms'], delta=10)
+
+    def test_no_requests(self):
+        self.assertEqual({'requests': 0, 'p50_ms': None, 'p99_ms': None}, server.latency_stats(server.Latencies()))
@@ -0,0 +1,49 @@
+# coding: utf-8
+
+from unittest import TestCase, main
+
+from . import settlements as m
+
+
+SETTLEMENTS = ('eger', 'tata', 'budapest 01. kerület', 'budapest 11. kerület', 'nagykálló', 'kálló')
+
+
+class Test_SettlementMap(TestCase):
+
+    def setUp(self):
+        self.settlement_map = m.SettlementMap()
+        self.settlement_map.build(SETTLEMENTS, report_conflicts=False)
+
+    def assert_extracted(self, text, settlements, rest):
+        self.assertEqual((settlements, rest), self.settlement_map.extract_settlements(text))
+
+    def test_single_word_settlements(self):
+        self.assert_extracted('egri tatai iskola tata', {'eger', 'tata'}, 'iskola')
+        self.assert_extracted('nagykállói óvoda', {'nagykálló'}, 'óvoda')
+        self.assert_extracted('óvoda', set(), 'óvoda')
+
+    def test_same_as_extract_settlements_for_single_words(self):
+        variant_map = m.make_settlement_variant_map(['eger', 'kálló', 'udvar'], report_conflicts=False)
+        trie = m.make_settlement_trie(variant_map)
+        for text in ['egri kallói udvari iskola', 'udvar eger', 'kálló', '']:
+            self.assertEqual(
+                m.extract_settlements(variant_map, text), m.extract_longest_settlements(trie, text), text)
+
+    def test_multi_word_settlements(self):
+        self.assert_extracted('budapest 01 kerület óvoda', {'budapest 01. kerület'}, 'óvoda')
+        self.assert_extracted('budapest 01 kerületi óvoda', {'budapest 01. kerület'}, 'óvoda')
+        self.assert_extracted('tatai budapest 01 iskola', {'tata'}, 'budapest 01 iskola')
+
+    def test_district_numbers(self):
+        self.assert_extracted('budapest xi kerületi iskola', {'budapest 11. kerület'}, 'iskola')
+        self.assert_extracted('budapest 1 kerület', {'budapest 01. kerület'}, '')
+
+    def test_district_variants(self):
+        self.assertEqual(
+            ['budapest 1. kerület', 'budapest i. kerület'], m._district_variants('budapest 01. kerület'))
+        self.assertEqual(['budapest 14. kerület', 'budapest xiv. kerület'], m._district_variants('budapest 14. kerület'))
+        self.assertEqual([], m._district_variants('eger'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# coding: utf-8
+
+import json
+from unittest import TestCase
+
+from . import main as m
+from . import snapshot
+from .data import load_pir_to_details
+from .index import Index, Query
+from .test_main import TempFile, VERSION
+
+
+INDEX_JSON = 'test_data/index.json'
+
+
+def parse(name):
+    return name
+
+
+class Test_snapshot(TestCase):
+
+    def test_loaded_index_finds_the_same(self):
+        index = Index(load_pir_to_details(INDEX_JSON), parse, idf_shift=10.)
+        with TempFile() as snapshot_file:
+            index.save(snapshot_file)
+            loaded = Index.load(snapshot_file, parse, idf_shift=10.)
+
+        query = Query('megévesztő minisztérium', None, parse)
+        self.assertEqual(
+            [(r.details.pir, r.score, r.match_error) for r in index.search(query)],
+            [(r.details.pir, r.score, r.match_error) for r in loaded.search(query)])
+        self.assertEqual(index.missing_ngram_tfidf, loaded.missing_ngram_tfidf)
+
+    def test_json_is_not_a_snapshot(self):
+        self.assertFalse(snapshot.is_snapshot(INDEX_JSON))
+
+    def test_corrupt_snapshot_is_rejected(self):
+        index = Index(load_pir_to_details(INDEX_JSON), parse)
+        with TempFile() as snapshot_file:
+            index.save(snapshot_file)
+            with open(snapshot_file, 'r+b') as f:
+                f.seek(-1, 2)
+                last = f.read(1)
+                f.seek(-1, 2)
+                f.write(bytes([last[0] ^ 0xff]))
+            with self.assertRaises(snapshot.SnapshotError):
+                Index.load(snapshot_file, parse)
+
+    def test_build_index_command(self):
+        input_csv = 'test_data/input.csv'
+        with TempFile() as snapshot_file, TempFile() as from_json, TempFile() as from_snapshot:
+            m.main(['build-index', INDEX_JSON, snapshot_file], VERSION)
+            self.assertTrue(snapshot.is_snapshot(snapshot_file))
+
+            m.main(['--no-progress', INDEX_JSON, 'szervezet', input_csv, from_json], VERSION)
+            m.main(['--no-progress', snapshot_file, 'szervezet', input_csv, from_snapshot], VERSION)
+
+            with open(from_json, 'rb') as f1, open(from_snapshot, 'rb') as f2:
+                self.assertEqual(f1.read(), f2.read())
+
+    def test_update_index_command(self):
+        input_csv = 'test_data/input.csv'
+        with open(INDEX_JSON) as f:
+            pir_to_details = json.load(f)
+        pirs = list(pir_to_details)
+        delta = {
+            pirs[0]: None,
+            pirs[1]: dict(pir_to_details[pirs[1]], names=['megtévesztő minisztérium']),
+        }
+        del pir_to_details[pirs[0]]
+        pir_to_details[pirs[1]] = delta[pirs[1]]
+        with TempFile() as delta_json, TempFile() as updated_json, TempFile() as snapshot_file, \
+                TempFile() as from_json, TempFile() as from_snapshot:
+            for path, data in ((delta_json, delta), (updated_json, pir_to_details)):
+                with open(path, 'w') as f:
+                    json.dump(data, f)
+            m.main(['update-index', INDEX_JSON, delta_json, snapshot_file], VERSION)
+
+            m.main(['--no-progress', updated_json, 'szervezet', input_csv, from_json], VERSION)
+            m.main(['--no-progress', snapshot_file, 'szervezet', input_csv, from_snapshot], VERSION)
+
+            with open(from_json, 'rb') as f1, open(from_snapshot, 'rb') as f2:
+                self.assertEqual(f1.read(), f2.read())
@@ -0,0 +1,45 @@
+# coding: utf-8
+
+from unittest import TestCase
+
+from . import stats
+
+
+class Test_stats(TestCase):
+
+    def setUp(self):
+        stats.enable()
+
+    def tearDown(self):
+        stats.disable()
+
+    def test_timer_counts_calls(self):
+        for _ in range(3):
+            with stats.timer('stage'):
+                pass
+        timings = stats.take()
+        seconds, calls = timings['stage']
+        self.assertEqual(3, calls)
+        self.assertGreaterEqual(seconds, 0)
+
+    def test_merge_adds_timings(self):
+        with stats.timer('stage'):
+            pass
+        stats.merge({'stage': (1.0, 2), 'other': (0.5, 1)})
+        timings = stats.take()
+        self.assertEqual(3, timings['stage'][1])
+        self.assertGreaterEqual(timings['stage'][0], 1.0)
+        self.assertEqual((0.5, 1), timings['other'])
+
+    def test_report_lists_stages_slowest_first(self):
+        stats.merge({'fast': (0.1, 1), 'slow': (2.0, 4)})
+        lines = stats.report().splitlines()
+        self.assertEqual(['stage', 'slow', 'fast'], [line.split()[0] for line in lines])
+        self.assertIn('500000.0', lines[1])
+
+    def test_timer_does_nothing_when_disabled(self):
+        stats.disable()
+        with stats.timer('stage'):
+            pass
+        stats.enable()
+        self.assertEqual({}, stats.take())
@@ -0,0 +1,66 @@
+# coding: utf-8
+
+import io
+import json
+import os
+from unittest import TestCase
+
+from . import stream
+from .test_server import QUERIES, expected_matches, make_matcher
+
+
+def run(lines, format='jsonl', batch_size=1):
+    output = io.StringIO()
+    stream.run(make_matcher(), io.StringIO(''.join(lines)), output, format, batch_size)
+    return output.getvalue().splitlines()
+
+
+class Test_stream(TestCase):
+
+    def test_jsonl(self):
+        lines = [json.dumps(dict(query, id=i)) + '\n' for i, query in enumerate(QUERIES)]
+        for batch_size in (1, 3):
+            results = [json.loads(line) for line in run(lines, batch_size=batch_size)]
+            expected = [
+                dict(query, id=i, matches=matches)
+                for i, (query, matches) in enumerate(zip(QUERIES, expected_matches(QUERIES)))]
+            self.assertEqual(expected, results)
+
+    def test_jsonl_errors_are_reported_in_place(self):
+        lines = [
+            json.dumps(QUERIES[0]) + '\n', 'not json\n', '{"settlement": "tata"}\n', json.dumps(QUERIES[2]) + '\n']
+        results = [json.loads(line) for line in run(lines, batch_size=10)]
+        self.assertEqual(4, len(results))
+        self.assertIn('matches', results[0])
+        self.assertEqual('not json', results[1]['input'])
+        self.assertIn('error', results[1])
+        self.assertIn('error', results[2])
+        self.assertIn('matches', results[3])
+
+    def test_tsv(self):
+        lines = ['{}\t{}\t{}\n'.format(q['name'], q.get('settlement', ''), q.get('date', '')) for q in QUERIES]
+        results = [line.split('\t') for line in run(lines, format='tsv')]
+        for fields, query, matches in zip(results, QUERIES, expected_matches(QUERIES)):
+            self.assertEqual(query['name'], fields[0])
+            self.assertEqual(9, len(fields))
+            self.assertEqual(str(matches[0]['pir']) if matches else '', fields[5])
+
+
+class Test_micro_batches(TestCase):
+
+    def test_batches_are_produced_without_waiting_for_more_input(self):
+        read_fd, write_fd = os.pipe()
+        with os.fdopen(read_fd) as lines, os.fdopen(write_fd, 'w') as producer:
+            batches = stream.micro_batches(lines, batch_size=10, max_delay=0.2)
+            producer.write('a\nb\n')
+            producer.flush()
+            # the producer is still open, but the available lines are produced
+            self.assertEqual(['a\n', 'b\n'], next(batches))
+            producer.write('c\n')
+            producer.close()
+            self.assertEqual([['c\n']], list(batches))
+
+    def test_batch_size_is_respected(self):
+        lines = io.StringIO(''.join(f'{i}\n' for i in range(7)))
+        batches = list(stream.micro_batches(lines, batch_size=3, max_delay=1.0))
+        self.assertEqual([3, 3, 1], [len(batch) for batch in batches])
@@ -41,6 +41,25 @@ class Test(TestCase):
             'közös fenntartású adászteveli napköziotthonos óvoda',
             {'ovoda'}, 'adászteveli')
 
+    def test_compiled_tagger_is_the_same_as_find_keywords(self):
+        names = [
+            'óvodafenntartó',
+            'észak dunántúli környezetvédelmi és vízügyi igazgatóság',
+            'egyesített családsegítő és gondozási központ kapcsolat központ',
+            'közös fenntartású nemesszalóki általános iskola',
+            'közös fenntartású adászteveli napköziotthonos óvoda',
+            'idősek szép otthona',
+            'mezőgazdasági és gazdasági szervezet',
+            'tudományegyetem egyetemi kar',
+            'ovoda es altalanos iskola',
+            'budapest',
+            '',
+        ]
+        for name in names:
+            self.assertEqual(m.find_keywords(m.ORG_TYPE, name), m.extract_org_types(name), name)
+        self.assertEqual(
+            [m.find_keywords(m.ORG_TYPE, name) for name in names], m.extract_org_types_many(names + names)[len(names):])
+
 
 if __name__ == '__main__':
     main()